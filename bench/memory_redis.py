@@ -0,0 +1,249 @@
+import asyncio
+import fnmatch
+from collections import Counter
+
+
+class MemoryStore:
+    def __init__(self):
+        """
+        In-memory data shared by every MemoryRedis client of a benchmark run.
+        Counts every command, to report Redis operations per datapoint.
+        """
+        self.values = {}
+        self.lists = {}
+        self.hashes = {}
+        self.zsets = {}
+        self.sets = {}
+        self.ops = Counter()
+        self.condition = asyncio.Condition()
+
+
+class MemoryRedis:
+    def __init__(self, store: MemoryStore, decode_responses: bool = True):
+        """
+        Stand-in for redis.asyncio.Redis with the commands the services use.
+        :param store: Data shared with the other clients.
+        :param decode_responses: Return str like Redis(decode_responses=True), bytes otherwise.
+        """
+        self.store = store
+        self.decode_responses = decode_responses
+
+    def count(self, command: str):
+        self.store.ops[command] += 1
+
+    @staticmethod
+    def encode(value) -> bytes:
+        if isinstance(value, bytes):
+            return value
+        return str(value).encode("utf-8")
+
+    @staticmethod
+    def key(name) -> str:
+        return name.decode("utf-8") if isinstance(name, bytes) else str(name)
+
+    def out(self, value):
+        if value is None or not self.decode_responses:
+            return value
+        return value.decode("utf-8")
+
+    def out_key(self, name: str):
+        return name if self.decode_responses else name.encode("utf-8")
+
+    def spaces(self) -> tuple:
+        return self.store.values, self.store.lists, self.store.hashes, self.store.zsets, self.store.sets
+
+    async def ping(self) -> bool:
+        self.count("ping")
+        return True
+
+    async def aclose(self):
+        pass
+
+    async def get(self, name):
+        self.count("get")
+        return self.out(self.store.values.get(self.key(name)))
+
+    async def mget(self, names) -> list:
+        self.count("mget")
+        return [self.out(self.store.values.get(self.key(name))) for name in names]
+
+    async def set(self, name, value, ex=None, px=None, nx=False):
+        self.count("set")
+        name = self.key(name)
+        if nx and name in self.store.values:
+            return None
+        self.store.values[name] = self.encode(value)
+        return True
+
+    async def delete(self, *names) -> int:
+        self.count("delete")
+        deleted = 0
+        for name in map(self.key, names):
+            for space in self.spaces():
+                if space.pop(name, None) is not None:
+                    deleted += 1
+        return deleted
+
+    async def exists(self, *names) -> int:
+        self.count("exists")
+        return sum(any(self.key(name) in space for space in self.spaces()) for name in names)
+
+    async def lpush(self, name, *values) -> int:
+        self.count("lpush")
+        async with self.store.condition:
+            items = self.store.lists.setdefault(self.key(name), [])
+            for value in values:
+                items.insert(0, self.encode(value))
+            self.store.condition.notify_all()
+            return len(items)
+
+    async def rpush(self, name, *values) -> int:
+        self.count("rpush")
+        async with self.store.condition:
+            items = self.store.lists.setdefault(self.key(name), [])
+            items.extend(self.encode(value) for value in values)
+            self.store.condition.notify_all()
+            return len(items)
+
+    async def blpop(self, keys, timeout=0):
+        self.count("blpop")
+        keys = [self.key(name) for name in ([keys] if isinstance(keys, (str, bytes)) else keys)]
+        async with self.store.condition:
+            while True:
+                for name in keys:
+                    if self.store.lists.get(name):
+                        return self.out_key(name), self.out(self.store.lists[name].pop(0))
+                try:
+                    await asyncio.wait_for(self.store.condition.wait(), timeout or None)
+                except asyncio.TimeoutError:
+                    return None
+
+    async def lrem(self, name, count: int, value) -> int:
+        self.count("lrem")
+        items = self.store.lists.get(self.key(name), [])
+        value = self.encode(value)
+        removed = 0
+        while value in items and (count == 0 or removed < abs(count)):
+            items.remove(value)
+            removed += 1
+        return removed
+
+    async def llen(self, name) -> int:
+        self.count("llen")
+        return len(self.store.lists.get(self.key(name), []))
+
+    async def lrange(self, name, start: int, end: int) -> list:
+        self.count("lrange")
+        items = self.store.lists.get(self.key(name), [])
+        end = len(items) if end == -1 else end + 1
+        return [self.out(item) for item in items[start:end]]
+
+    async def hset(self, name, key=None, value=None, mapping=None) -> int:
+        self.count("hset")
+        fields = self.store.hashes.setdefault(self.key(name), {})
+        items = dict(mapping or {})
+        if key is not None:
+            items[key] = value
+        added = sum(self.key(field) not in fields for field in items)
+        fields.update({self.key(field): self.encode(item) for field, item in items.items()})
+        return added
+
+    async def hgetall(self, name) -> dict:
+        self.count("hgetall")
+        fields = self.store.hashes.get(self.key(name), {})
+        return {self.out_key(field): self.out(item) for field, item in fields.items()}
+
+    async def hmget(self, name, keys) -> list:
+        self.count("hmget")
+        fields = self.store.hashes.get(self.key(name), {})
+        return [self.out(fields.get(self.key(key))) for key in keys]
+
+    async def sadd(self, name, *values) -> int:
+        self.count("sadd")
+        members = self.store.sets.setdefault(self.key(name), set())
+        added = len({self.encode(value) for value in values} - members)
+        members.update(self.encode(value) for value in values)
+        return added
+
+    async def smembers(self, name) -> set:
+        self.count("smembers")
+        return {self.out(value) for value in self.store.sets.get(self.key(name), set())}
+
+    async def zadd(self, name, mapping: dict) -> int:
+        self.count("zadd")
+        members = self.store.zsets.setdefault(self.key(name), {})
+        added = sum(self.encode(member) not in members for member in mapping)
+        members.update({self.encode(member): float(score) for member, score in mapping.items()})
+        return added
+
+    def score_range(self, name, low, high, reverse: bool, start, num, withscores: bool) -> list:
+        low, high = float(low), float(high)
+        members = sorted(self.store.zsets.get(self.key(name), {}).items(), key=lambda item: (item[1], item[0]),
+                         reverse=reverse)
+        found = [(member, score) for member, score in members if low <= score <= high]
+        if start is not None:
+            found = found[start:start + num] if num is not None and num >= 0 else found[start:]
+        if withscores:
+            return [(self.out(member), score) for member, score in found]
+        return [self.out(member) for member, _ in found]
+
+    async def zrangebyscore(self, name, min, max, start=None, num=None, withscores=False) -> list:
+        self.count("zrangebyscore")
+        return self.score_range(name, min, max, False, start, num, withscores)
+
+    async def zrevrangebyscore(self, name, max, min, start=None, num=None, withscores=False) -> list:
+        self.count("zrevrangebyscore")
+        return self.score_range(name, min, max, True, start, num, withscores)
+
+    def pipeline(self, transaction: bool = True):
+        self.count("pipeline")
+        return MemoryPipeline(self)
+
+    async def scan_iter(self, match: str = "*"):
+        self.count("scan")
+        for name in list(self.store.values):
+            if fnmatch.fnmatchcase(name, match):
+                yield self.out_key(name)
+
+
+class MemoryPipeline:
+    def __init__(self, client: MemoryRedis):
+        """
+        Pipeline of a MemoryRedis client. Like redis-py, commands are queued until execute(),
+        except between watch() and multi() where they run at once. Everything runs on one event
+        loop, so WATCH never fails.
+        """
+        self.client = client
+        self.queued = []
+        self.watching = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.queued = []
+        self.watching = False
+
+    async def watch(self, *names):
+        self.client.count("watch")
+        self.watching = True
+
+    def multi(self):
+        self.watching = False
+        self.queued = []
+
+    def __getattr__(self, command):
+        method = getattr(self.client, command)
+        if self.watching:
+            return method
+
+        def queue(*args, **kwargs):
+            self.queued.append((method, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self) -> list:
+        self.client.count("exec")
+        queued, self.queued = self.queued, []
+        self.watching = False
+        return [await method(*args, **kwargs) for method, args, kwargs in queued]
@@ -0,0 +1,179 @@
+"""
+Offline end-to-end benchmark of the TradeMon pipeline.
+
+Feeder -> Reader/Stocker -> TFRecord runs against local stand-ins of the search, stock and
+chat completions APIs, with an in-memory Redis (or a real one with --redis-url), so no API key,
+GPU or network is needed. Reports datapoints/s, per-stage p50/p99 and Redis operations per datapoint.
+
+Run from the repository root:
+    python -m bench.pipeline --num-points 16 --output bench_report.json
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.memory_redis import MemoryStore, MemoryRedis
+from bench.upstreams import Upstreams
+
+
+def load_module(name: str, path: str):
+    """
+    Load a service module by path. Every service has its own "app" package, so they cannot
+    all be imported by package name in one process.
+    """
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def set_environment(base_url: str, args, data_dir: str):
+    """Point every service at the stand-ins."""
+    os.environ.update({
+        "SEARCH_API_URL_WEB": f"{base_url}/search/web",
+        "SEARCH_API_URL_NEWS": f"{base_url}/search/news",
+        "SEARCH_API_KEY": "bench",
+        "SEARCH_API_PERIOD": str(args.search_period),
+        "STOCK_API_KEY": "bench",
+        "STOCK_API_URL": f"{base_url}/stock/query",
+        "STOCK_API_PERIOD": str(args.stock_period),
+        "MODEL_API_URL": f"{base_url}/llm",
+        "PROMPT_TEMPLATES_PATH": os.path.join(ROOT, "reader/app/prompt_templates.json"),
+        "SEARCH_QUERIES_NAME": "search_queries",
+        "STOCK_QUERIES_NAME": "stock_queries",
+        "REDIS_URL": args.redis_url or "redis://memory",
+        "LLM_RETRIES": "3",
+        "FEEDING_TIMEOUT": str(args.timeout),
+        "TICKERS_PATH": os.path.join(ROOT, "feeder/data/tickers/tickers.txt"),
+        "DATA_DIR": data_dir,
+        "METRICS_PORT": "0",
+        "METRICS_FLUSH_PERIOD": "0"
+    })
+
+
+def use_memory_redis(service, store: MemoryStore, decode_responses: bool):
+    """Replace a service's Redis connection with the in-memory one."""
+    async def init_redis():
+        service.redis = MemoryRedis(store, decode_responses)
+        return True
+    service.init_redis = init_redis
+
+
+def stage_report(metrics) -> dict:
+    return {
+        stage: {
+            "count": histogram.count,
+            "mean": histogram.sum / histogram.count if histogram.count else 0.0,
+            "p50": histogram.quantile(0.5),
+            "p99": histogram.quantile(0.99)
+        }
+        for stage, histogram in sorted(metrics.histograms.items())
+    }
+
+
+async def run_benchmark(args) -> dict:
+    upstreams = Upstreams(
+        search_latency=args.search_latency,
+        stock_latency=args.stock_latency,
+        llm_latency=args.llm_latency,
+        llm_token_latency=args.llm_token_latency,
+        results=args.results,
+        result_size=args.result_size,
+        article_pool=args.article_pool,
+        seed=args.seed
+    )
+    base_url = await upstreams.start()
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="trademon_bench_")
+    set_environment(base_url, args, data_dir)
+
+    reader_module = load_module("bench_reader", "reader/app/reader.py")
+    stocker_module = load_module("bench_stocker", "stocker/app/stocker.py")
+    feeder_module = load_module("bench_feeder", "feeder/app/feeder.py")
+
+    reader = reader_module.Reader()
+    stocker = stocker_module.Stocker()
+    feeder = feeder_module.Feeder()
+
+    store = MemoryStore()
+    if not args.redis_url:
+        use_memory_redis(reader, store, True)
+        use_memory_redis(stocker, store, True)
+        use_memory_redis(feeder, store, False)
+
+    workers = [asyncio.create_task(reader.run_worker()), asyncio.create_task(stocker.run_worker())]
+
+    # The feeder draws its dates from the global random generator.
+    random.seed(args.seed)
+    started = time.perf_counter()
+    try:
+        async with feeder:
+            await feeder.run(args.num_points)
+        elapsed = time.perf_counter() - started
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await upstreams.stop()
+
+    datapoints = feeder.stats["generated"]
+    redis_ops = sum(store.ops.values())
+    return {
+        "num_points": args.num_points,
+        "datapoints": datapoints,
+        "elapsed": elapsed,
+        "datapoints_per_second": datapoints / elapsed if elapsed else 0.0,
+        "feeder_stats": feeder.stats,
+        "upstream_requests": upstreams.requests,
+        "redis_ops": dict(store.ops) if not args.redis_url else None,
+        "redis_ops_per_datapoint": redis_ops / datapoints if datapoints and not args.redis_url else None,
+        "stages": {
+            "feeder": stage_report(feeder.stage_metrics),
+            "reader": stage_report(reader.metrics),
+            "stocker": stage_report(stocker.metrics)
+        },
+        "http": {
+            "reader": reader.http.stats(),
+            "stocker": stocker.http.stats()
+        },
+        "data_dir": data_dir
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the TradeMon pipeline against local stand-ins")
+    parser.add_argument("--num-points", type=int, default=8, help="Datapoints to generate")
+    parser.add_argument("--search-latency", type=float, default=0.05, help="Seconds per search request")
+    parser.add_argument("--stock-latency", type=float, default=0.1, help="Seconds per stock request")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds of prefill per completion")
+    parser.add_argument("--llm-token-latency", type=float, default=0.002, help="Seconds per generated token")
+    parser.add_argument("--results", type=int, default=20, help="Maximum results per search")
+    parser.add_argument("--result-size", type=int, default=600, help="Characters per result description")
+    parser.add_argument("--article-pool", type=int, default=40, help="Articles per ticker searches draw from")
+    parser.add_argument("--search-period", type=float, default=0.0, help="SEARCH_API_PERIOD for the run")
+    parser.add_argument("--stock-period", type=float, default=0.0, help="STOCK_API_PERIOD for the run")
+    parser.add_argument("--timeout", type=int, default=600, help="FEEDING_TIMEOUT for the run")
+    parser.add_argument("--redis-url", default=None, help="Use a real Redis instead of the in-memory one")
+    parser.add_argument("--data-dir", default=None, help="Where to write the dataset, a temp dir by default")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the upstream data and feeder dates")
+    parser.add_argument("--output", default=None, help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import random
+import re
+from datetime import date, timedelta
+from aiohttp import web
+
+
+class Upstreams:
+    def __init__(self, search_latency: float = 0.05, stock_latency: float = 0.1, llm_latency: float = 0.05,
+                 llm_token_latency: float = 0.002, results: int = 20, result_size: int = 600,
+                 article_pool: int = 40, seed: int = 0):
+        """
+        Local stand-ins for the Brave search API, the AlphaVantage API and a chat completions server.
+        :param search_latency: Seconds per search request.
+        :param stock_latency: Seconds per stock request.
+        :param llm_latency: Seconds of prefill per completion.
+        :param llm_token_latency: Seconds per generated token.
+        :param results: Maximum search results per request.
+        :param result_size: Characters in each result description.
+        :param article_pool: Articles per ticker that searches draw from, smaller pools overlap more.
+        :param seed: Random seed of the generated data.
+        """
+        self.search_latency = search_latency
+        self.stock_latency = stock_latency
+        self.llm_latency = llm_latency
+        self.llm_token_latency = llm_token_latency
+        self.results = results
+        self.result_size = result_size
+        self.article_pool = article_pool
+        self.seed = seed
+        self.series = {}
+        self.requests = {"search": 0, "stock": 0, "llm": 0}
+        self.runner = None
+        self.port = None
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/search/web", self.handle_search)
+        app.router.add_get("/search/news", self.handle_search)
+        app.router.add_get("/stock/query", self.handle_stock)
+        app.router.add_get("/llm/health", self.handle_health)
+        app.router.add_post("/llm/v1/chat/completions", self.handle_completion)
+        return app
+
+    async def start(self, port: int = 0) -> str:
+        """
+        Serve every stand-in on localhost.
+        :param port: Port, 0 for any free port.
+        :return str: Base URL of the stand-ins.
+        """
+        self.runner = web.AppRunner(self.make_app(), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{self.port}"
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle_search(self, request: web.Request) -> web.Response:
+        self.requests["search"] += 1
+        await asyncio.sleep(self.search_latency)
+
+        query = request.query.get("q", "")
+        match = re.search(r'"(\S+) stock"', query)
+        ticker = match.group(1) if match else "UNKNOWN"
+        count = min(int(request.query.get("count", "10")), self.results)
+
+        rng = random.Random(f"{self.seed}:{query}")
+        articles = rng.sample(range(self.article_pool), min(count, self.article_pool))
+        results = [self.make_article(ticker, num) for num in articles]
+
+        if request.path.endswith("news"):
+            return web.json_response({"type": "news", "results": results})
+        return web.json_response({"type": "search", "web": {"results": results}})
+
+    def make_article(self, ticker: str, num: int) -> dict:
+        rng = random.Random(f"{self.seed}:{ticker}:{num}")
+        words = ["earnings", "analyst", "guidance", "revenue", "margin", "supply", "chain", "growth",
+                 "risk", "lawsuit", "buyback", "dividend", "upgrade", "downgrade", "momentum"]
+        description = ""
+        while len(description) < self.result_size:
+            description += rng.choice(words) + " "
+        return {
+            "title": f"{ticker} article {num}",
+            "url": f"https://news.example.com/{ticker}/{num}",
+            "age": f"{rng.randint(1, 300)} days ago",
+            "description": description.strip(),
+            "extra_snippets": [description[:self.result_size // 3]]
+        }
+
+    def make_series(self, symbol: str) -> dict:
+        """Daily bars of a random walk over every weekday from 2015 to mid-2025."""
+        if symbol not in self.series:
+            rng = random.Random(f"{self.seed}:{symbol}")
+            price = rng.uniform(20, 400)
+            series = {}
+            day = date(2015, 1, 1)
+            while day <= date(2025, 6, 30):
+                if day.weekday() < 5:
+                    price *= 1 + rng.gauss(0.0003, 0.02)
+                    series[day.strftime("%Y-%m-%d")] = {
+                        "1. open": f"{price:.4f}",
+                        "2. high": f"{price * 1.01:.4f}",
+                        "3. low": f"{price * 0.99:.4f}",
+                        "4. close": f"{price:.4f}",
+                        "5. volume": str(rng.randint(10 ** 5, 10 ** 7))
+                    }
+                day += timedelta(days=1)
+            # Newest first, like AlphaVantage.
+            self.series[symbol] = dict(sorted(series.items(), reverse=True))
+        return self.series[symbol]
+
+    async def handle_stock(self, request: web.Request) -> web.Response:
+        self.requests["stock"] += 1
+        await asyncio.sleep(self.stock_latency)
+
+        series = self.make_series(request.query.get("symbol", "UNKNOWN"))
+        if request.query.get("outputsize") != "full":
+            series = dict(list(series.items())[:100])
+        return web.json_response({
+            "Meta Data": {"2. Symbol": request.query.get("symbol")},
+            "Time Series (Daily)": series
+        })
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    @staticmethod
+    def answer_keys(payload: dict) -> list:
+        """Keys the request asks for, from its JSON schema or else its 'Return EXACTLY' format."""
+        schema = payload.get("response_format", {}).get("json_schema", {}).get("schema")
+        if schema:
+            return list(schema["properties"])
+        text = " ".join(message["content"] for message in payload["messages"])
+        return re.findall(r'"(\w+)": <int>', text)
+
+    async def handle_completion(self, request: web.Request) -> web.StreamResponse:
+        self.requests["llm"] += 1
+        payload = await request.json()
+
+        rng = random.Random()
+        answer = json.dumps({key: rng.randint(-100, 100) for key in self.answer_keys(payload)})
+        tokens = [answer[i:i + 4] for i in range(0, len(answer), 4)]
+        prompt_tokens = sum(len(message["content"]) for message in payload["messages"]) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens)
+        }
+
+        await asyncio.sleep(self.llm_latency)
+
+        if not payload.get("stream"):
+            await asyncio.sleep(self.llm_token_latency * len(tokens))
+            return web.json_response({
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer},
+                             "finish_reason": "stop"}],
+                "usage": usage
+            })
+
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        try:
+            for token in tokens:
+                await asyncio.sleep(self.llm_token_latency)
+                chunk = {"choices": [{"index": 0, "delta": {"content": token}}]}
+                await resp.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            await resp.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode("utf-8"))
+            await resp.write(b"data: [DONE]\n\n")
+        except ConnectionResetError:
+            # The client closed the stream early.
+            pass
+        return resp
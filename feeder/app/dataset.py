@@ -0,0 +1,187 @@
+import glob
+import json
+import os
+import tensorflow as tf
+from shared.feature_stats import FeatureStats
+
+SHARD_PATTERN = "analysis_data_*.tfrecord"
+
+
+def find_shards(data_dir: str, pattern: str = SHARD_PATTERN) -> list:
+    """
+    Find the TFRecord files written by the Feeder.
+    :param data_dir: Directory of the dataset, DATA_DIR of the Feeder.
+    :param pattern: Glob of the shard names.
+    :return list: Sorted paths of the shards.
+    """
+    return sorted(glob.glob(os.path.join(data_dir, pattern)))
+
+
+def load_metadata(shard: str) -> dict:
+    """
+    Load the _meta.json the Feeder writes next to a shard.
+    :param shard: Path of the TFRecord file.
+    :return dict: The metadata, empty if there is none.
+    """
+    path = os.path.splitext(shard)[0] + "_meta.json"
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def collect_metrics(shards: list) -> list:
+    """
+    Metric names of every shard. Shards can hold different metrics, records without one of
+    them get its default value.
+    :param shards: Paths of the TFRecord files.
+    :return list: Sorted metric names, the column order of the features.
+    """
+    metrics = set()
+    for shard in shards:
+        metrics.update(load_metadata(shard).get("metrics", []))
+    return sorted(metrics)
+
+
+def collect_labels(shards: list) -> list:
+    """
+    Names of the float labels of every shard, the stock result's forward returns, besides the
+    int "label".
+    :param shards: Paths of the TFRecord files.
+    :return list: Sorted label names.
+    """
+    labels = set()
+    for shard in shards:
+        labels.update(load_metadata(shard).get("labels", []))
+    return sorted(labels)
+
+
+def collect_feature_stats(shards: list) -> FeatureStats:
+    """
+    Feature statistics of every shard, merged from the stats the Feeder keeps in the metadata.
+    Shards written before the Feeder kept them are left out, and so are the float labels.
+    :param shards: Paths of the TFRecord files.
+    :return FeatureStats: The merged stats.
+    """
+    stats = FeatureStats()
+    for shard in shards:
+        metadata = load_metadata(shard)
+        shard_stats = metadata.get("feature_stats")
+        if shard_stats:
+            stats.merge(FeatureStats.from_dict(shard_stats, exclude=set(metadata.get("labels", []))))
+    return stats
+
+
+def normalization(stats: FeatureStats, metrics: list) -> tuple:
+    """
+    Mean and std of each feature column, to standardize features with. Metrics without stats
+    or with no spread are left as they are.
+    :param stats: Feature statistics, see collect_feature_stats.
+    :param metrics: Metric names in feature column order.
+    :return tuple: (means, stds) lists in metrics order.
+    """
+    means, stds = [], []
+    for metric in metrics:
+        stat = stats.stats.get(metric)
+        if stat is None or stat.count < 2 or stat.std == 0:
+            means.append(0.0)
+            stds.append(1.0)
+        else:
+            means.append(stat.mean)
+            stds.append(stat.std)
+    return means, stds
+
+
+def make_feature_spec(metrics: list, default_value: float = 0.0, label: str = "label") -> dict:
+    """
+    Fixed parse spec of the Feeder's records: one float per metric and the label, the int
+    "label" or a float one of collect_labels. Records without a float label get NaN.
+    :param metrics: Metric names.
+    :param default_value: Value of metrics a record does not have.
+    :param label: Name of the label.
+    :return dict: Spec for tf.io.parse_example.
+    """
+    spec = {metric: tf.io.FixedLenFeature([], tf.float32, default_value=default_value) for metric in metrics}
+    if label == "label":
+        spec[label] = tf.io.FixedLenFeature([], tf.int64, default_value=0)
+    else:
+        spec[label] = tf.io.FixedLenFeature([], tf.float32, default_value=float("nan"))
+    return spec
+
+
+def make_dataset(shards: list, metrics: list = None, batch_size: int = 256, shuffle_buffer: int = 0,
+                 cache=None, repeat: bool = False, drop_remainder: bool = False, default_value: float = 0.0,
+                 deterministic: bool = False, seed: int = None, normalize: bool = False,
+                 label: str = "label") -> tf.data.Dataset:
+    """
+    Input pipeline of (features, label) batches. Shards are read in parallel, records are
+    batched before they are parsed so parsing is one vectorized op per batch.
+    :param shards: Paths of the TFRecord files, see find_shards.
+    :param metrics: Feature columns, the metrics of the shards' metadata by default.
+    :param batch_size: Records per batch.
+    :param shuffle_buffer: Records in the shuffle buffer, 0 keeps the file order.
+    :param cache: Cache the raw records after the first epoch: True in memory, a path on disk.
+    :param repeat: Repeat forever.
+    :param drop_remainder: Drop the last, smaller batch.
+    :param default_value: Value of metrics a record does not have.
+    :param deterministic: Keep the order of records, slower when shards are interleaved.
+    :param seed: Seed of the shuffles.
+    :param normalize: Standardize the features with the mean and std of the shards' feature
+    stats, no pass over the data is needed. Missing metrics are standardized from default_value.
+    :param label: Label of the batches, "label" or a forward return of collect_labels.
+    :return tf.data.Dataset: Batches of float32 features [batch, len(metrics)] in metrics order
+    and labels [batch], int64 for "label" and float32 for forward returns.
+    """
+    if metrics is None:
+        metrics = collect_metrics(shards)
+    spec = make_feature_spec(metrics, default_value, label)
+    means, stds = normalization(collect_feature_stats(shards), metrics) if normalize and metrics else (None, None)
+
+    files = tf.data.Dataset.from_tensor_slices(shards)
+    if shuffle_buffer:
+        files = files.shuffle(len(shards), seed=seed)
+    records = files.interleave(
+        tf.data.TFRecordDataset,
+        cycle_length=min(len(shards), 16) or 1,
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=deterministic
+    )
+
+    # The cache holds raw records, so every epoch is shuffled anew.
+    if cache is True:
+        records = records.cache()
+    elif cache:
+        records = records.cache(cache)
+    if shuffle_buffer:
+        records = records.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    if repeat:
+        records = records.repeat()
+
+    def parse(serialized):
+        parsed = tf.io.parse_example(serialized, spec)
+        if metrics:
+            features = tf.stack([parsed[metric] for metric in metrics], axis=1)
+            if means is not None:
+                features = (features - means) / stds
+        else:
+            features = tf.zeros([tf.shape(serialized)[0], 0], tf.float32)
+        return features, parsed[label]
+
+    return (records
+            .batch(batch_size, drop_remainder=drop_remainder)
+            .map(parse, num_parallel_calls=tf.data.AUTOTUNE, deterministic=deterministic)
+            .prefetch(tf.data.AUTOTUNE))
+
+
+def load_dataset(data_dir: str, **options) -> tuple:
+    """
+    Input pipeline of every shard in a directory.
+    :param data_dir: Directory of the dataset, DATA_DIR of the Feeder.
+    :param options: Arguments of make_dataset.
+    :return tuple: (dataset, metric names in feature column order)
+    """
+    shards = find_shards(data_dir)
+    if not shards:
+        raise FileNotFoundError(f"No {SHARD_PATTERN} files in {data_dir}")
+    metrics = options.pop("metrics", None) or collect_metrics(shards)
+    return make_dataset(shards, metrics=metrics, **options), metrics
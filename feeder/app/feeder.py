@@ -8,6 +8,10 @@ from datetime import datetime, timedelta
 from redis.asyncio import Redis
 import logging
 import os
+from shared.metrics import Metrics
+from shared.deadline import TIMEOUT_ERROR, make_entry, task_timeout, taken_key
+from shared.result_index import ResultIndex
+from shared.feature_stats import FeatureStats
 
 
 class Feeder:
@@ -23,22 +27,34 @@ class Feeder:
         self.redis_url = os.environ.get("REDIS_URL")
         self.search_queue = os.getenv("SEARCH_QUERIES_NAME")
         self.stock_queue = os.getenv("STOCK_QUERIES_NAME")
+        # Seconds to wait for a result, queueing included.
         self.feeding_timeout = int(os.getenv("FEEDING_TIMEOUT"))
+        # Seconds past the task timeout without any task taken from a queue after which its
+        # workers are taken for gone, see wait_for_key.
+        self.stall_margin = float(os.getenv("FEEDING_STALL_MARGIN", "60"))
         self.tickers_path = os.getenv("TICKERS_PATH")
+        # Days a datapoint's date may move to reuse an indexed search result, 0 never moves it.
+        self.reuse_days = int(os.getenv("FEEDER_REUSE_DAYS", "0"))
         self.output_dir = os.getenv("DATA_DIR")
         self.logger.info(f"Search Queue: {self.search_queue}")
         self.logger.info(f"Stock Queue: {self.stock_queue}")
         self.logger.info(f"Redis URL: {self.redis_url}")
         self.redis = None
+        self.index = None
         self.tf_writer = None
         self.metrics = set()
+        self.labels = set()
         self.stats = {
             'total_requested': 0,
             'generated': 0,
             'cached': 0,
             'failed': 0,
-            'skipped': 0
+            'skipped': 0,
+            'reused': 0,
+            'stalled': 0
         }
+        self.stage_metrics = Metrics("feeder")
+        self.feature_stats = FeatureStats()
 
     async def init_redis(self) -> bool:
         try:
@@ -51,7 +67,10 @@ class Feeder:
 
     async def open_connection(self):
         """Initialize Redis connection"""
-        return await self.init_redis()
+        connected = await self.init_redis()
+        if connected:
+            self.index = ResultIndex(self.redis)
+        return connected
 
     async def close_connection(self):
         """Close connections"""
@@ -98,14 +117,25 @@ class Feeder:
         """
         Fetch cached data or queue for processing and get response.
         """
+        prefix = redis_key.split(":", 1)[0]
         try:
-            data = await self.redis.get(redis_key)
-            if not data:
-                await self.redis.lpush(queue_name, redis_key)
-                data = await self.wait_for_key(redis_key)
+            with self.stage_metrics.timer("redis_get"):
+                data = await self.redis.get(redis_key)
+            data = json.loads(data) if data else None
+            if data is not None and data.get("error") == TIMEOUT_ERROR:
+                # An earlier attempt ran out of time, clear it and try again.
+                await self.redis.delete(redis_key)
+                data = None
+            self.stage_metrics.record_cache(prefix, data is not None)
+            if data is None:
+                deadline = time.time() + self.feeding_timeout
+                entry = make_entry(redis_key, task_timeout(prefix))
+                depth = await self.redis.lpush(queue_name, entry)
+                self.stage_metrics.set_gauge(f"{prefix}_queue_depth", depth)
+                with self.stage_metrics.timer(f"wait_{prefix}"):
+                    data = await self.wait_for_key(redis_key, deadline, queue_name, entry)
             else:
                 self.stats['cached'] += 1
-                data = json.loads(data)
 
             return data
         except json.JSONDecodeError:
@@ -116,15 +146,27 @@ class Feeder:
 
         return None
 
-    async def wait_for_key(self, key):
+    async def wait_for_key(self, key, deadline: float, queue_name: str = None, entry: str = None):
         """
         Wait for a Redis key to be populated with results and get it.
+        Every worker takes its next task within the task timeout, so while the entry is still
+        queued and no task was taken from the queue for longer than that (plus FEEDING_STALL_MARGIN),
+        no worker serves the queue: the entry is taken back and the wait given up.
         :param key: The Redis key to wait for.
+        :param deadline: Unix time to give up at.
+        :param queue_name: Queue the task was pushed to, None to skip the check.
+        :param entry: The queue entry of the task.
         :return: The value of the key or None if it times out.
         """
-        #TODO make feeding_timeout class-wide to address lock.
-        start_time = time.time()
-        while time.time() - start_time < self.feeding_timeout:
+        started = time.time()
+        timeout = task_timeout(key.split(":", 1)[0])
+        while time.time() < deadline:
+            if queue_name is not None and timeout > 0 and await self.queue_stalled(queue_name, started, timeout):
+                if await self.redis.lrem(queue_name, 1, entry):
+                    self.logger.warning(f"No worker took a task from {queue_name} in "
+                                        f"{timeout + self.stall_margin:.0f}s, giving up on {key}")
+                    self.stats['stalled'] += 1
+                    return None
             data = await self.redis.get(key)
             if data:
                 try:
@@ -141,6 +183,20 @@ class Feeder:
         self.logger.warning(f"Timeout waiting for {key}, skipping...")
         return None
 
+    async def queue_stalled(self, queue_name: str, since: float, timeout: float) -> bool:
+        """
+        Check if no task was taken from a queue for longer than the task timeout and the margin.
+        :param queue_name: The queue.
+        :param since: Unix time the wait started, the queue is not judged before.
+        :param timeout: Task timeout of the queue's workers.
+        :return bool: True if its workers look gone.
+        """
+        if time.time() - since <= timeout + self.stall_margin:
+            return False
+        taken_at = await self.redis.get(taken_key(queue_name))
+        last = max(since, float(taken_at) if taken_at else 0.0)
+        return time.time() - last > timeout + self.stall_margin
+
     def create_tf_example(self, search_data, stock_data):
         """
         Make TensorFlow Example from search and stock data. Returns None if metrics are missing or empty.
@@ -166,6 +222,13 @@ class Feeder:
                 features[metric] = tf.train.Feature(
                     int64_list=tf.train.Int64List(value=[int(value)]))
 
+        # Trailing price features of the stock result are features, its forward returns labels.
+        for group, names in (("features", self.metrics), ("labels", self.labels)):
+            for name, value in (stock_data or {}).get(group, {}).items():
+                if isinstance(value, (int, float)):
+                    names.add(name)
+                    features[name] = tf.train.Feature(float_list=tf.train.FloatList(value=[float(value)]))
+
         if stock_data and "outperformed" in stock_data:
             outperformed = stock_data["outperformed"]
             features["label"] = tf.train.Feature(
@@ -177,6 +240,27 @@ class Feeder:
 
         return tf.train.Example(features=tf.train.Features(feature=features))
 
+    async def reuse_date(self, ticker: str, date: datetime, max_start: datetime) -> datetime:
+        """
+        Move a date to the nearest one with a search result already indexed for the ticker.
+        :param ticker: The ticker symbol.
+        :param date: The drawn date.
+        :param max_start: Latest date a datapoint may start at.
+        :return datetime: The indexed date within FEEDER_REUSE_DAYS, or the drawn date.
+        """
+        try:
+            nearest = await self.index.nearest("search", ticker, date, max_days=self.reuse_days)
+        except Exception as e:
+            self.logger.error(f"Index lookup failed: {str(e)}")
+            return date
+        if nearest is None:
+            return date
+        found = datetime.strptime(nearest[1], "%Y-%m-%d")
+        if not self.start_date <= found <= max_start:
+            return date
+        self.stats['reused'] += 1
+        return found
+
     async def generate_datapoint(self, ticker):
         """
         Generate a single data point for a ticker
@@ -186,8 +270,11 @@ class Feeder:
         max_start = self.end_date - self.time_delta
         rand_days = random.randint(0, (max_start - self.start_date).days)
         date = self.start_date + timedelta(days=rand_days)
+        if self.reuse_days:
+            date = await self.reuse_date(ticker, date, max_start)
 
-        search_data, stock_data = await self.fetch_datapoint(ticker, date)
+        with self.stage_metrics.timer("datapoint"):
+            search_data, stock_data = await self.fetch_datapoint(ticker, date)
         if not search_data or not stock_data:
             self.stats['failed'] += 1
             return None
@@ -200,6 +287,7 @@ class Feeder:
 
         if self.tf_writer:
             self.tf_writer.write(example.SerializeToString())
+        self.feature_stats.add_example(example, self.labels)
         self.stats['generated'] += 1
         return example
 
@@ -223,12 +311,16 @@ class Feeder:
         output_path = os.path.join(self.output_dir, output_filename)
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
-        with tf.io.TFRecordWriter(output_path) as self.tf_writer:
-            tasks = []
-            for i in range(min(num_points, len(tickers))):
-                ticker = tickers[i]
-                tasks.append(self.generate_datapoint(ticker))
-            await asyncio.gather(*tasks)
+        await self.stage_metrics.start(self.redis)
+        try:
+            with tf.io.TFRecordWriter(output_path) as self.tf_writer:
+                tasks = []
+                for i in range(min(num_points, len(tickers))):
+                    ticker = tickers[i]
+                    tasks.append(self.generate_datapoint(ticker))
+                await asyncio.gather(*tasks)
+        finally:
+            await self.stage_metrics.stop()
 
         self.logger.info(f"Dataset generation complete."
                          f"Success: {self.stats['generated']}, "
@@ -246,7 +338,10 @@ class Feeder:
                 "time_delta_days": self.time_delta.days
             },
             "metrics": list(self.metrics),
-            "stats": self.stats
+            "labels": sorted(self.labels),
+            "stats": self.stats,
+            "feature_stats": self.feature_stats.to_dict(),
+            "timings": self.stage_metrics.snapshot()
         }
 
         metadata_path = os.path.splitext(output_path)[0] + "_meta.json"
@@ -0,0 +1,82 @@
+import json
+import os
+import numpy as np
+import pytest
+import tensorflow as tf
+from app.dataset import find_shards, collect_metrics, collect_feature_stats, load_dataset
+from shared.feature_stats import FeatureStats
+
+
+def write_shard(path: str, records: list):
+    """Write records like the Feeder: float metrics, an int label and the _meta.json."""
+    metrics = set()
+    stats = FeatureStats()
+    with tf.io.TFRecordWriter(path) as writer:
+        for values, label in records:
+            features = {metric: tf.train.Feature(float_list=tf.train.FloatList(value=[value]))
+                        for metric, value in values.items()}
+            features["label"] = tf.train.Feature(int64_list=tf.train.Int64List(value=[label]))
+            example = tf.train.Example(features=tf.train.Features(feature=features))
+            writer.write(example.SerializeToString())
+            stats.add_example(example)
+            metrics.update(values)
+    with open(os.path.splitext(path)[0] + "_meta.json", "w") as f:
+        json.dump({"metrics": list(metrics), "feature_stats": stats.to_dict()}, f)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    write_shard(str(tmp_path / "analysis_data_a.tfrecord"),
+                [({"PE_RATIO": float(num), "ESG_RISKS": 1.0}, num % 2) for num in range(10)])
+    write_shard(str(tmp_path / "analysis_data_b.tfrecord"),
+                [({"PE_RATIO": 100.0 + num, "REGULATORY_RISK": 5.0}, 1) for num in range(5)])
+    return str(tmp_path)
+
+
+def test_metrics_union(data_dir):
+    shards = find_shards(data_dir)
+    assert len(shards) == 2
+    assert collect_metrics(shards) == ["ESG_RISKS", "PE_RATIO", "REGULATORY_RISK"]
+
+
+def test_load_dataset(data_dir):
+    dataset, metrics = load_dataset(data_dir, batch_size=4, default_value=-1.0, deterministic=True)
+    features, labels = zip(*[(x.numpy(), y.numpy()) for x, y in dataset])
+    features = np.concatenate(features)
+    labels = np.concatenate(labels)
+
+    assert features.shape == (15, 3)
+    assert labels.sum() == 10
+    column = {metric: num for num, metric in enumerate(metrics)}
+    # Metrics a shard does not have get the default value.
+    missing = features[features[:, column["PE_RATIO"]] >= 100]
+    assert (missing[:, column["ESG_RISKS"]] == -1.0).all()
+    assert (missing[:, column["REGULATORY_RISK"]] == 5.0).all()
+
+
+def test_shuffle_cache_repeat(data_dir):
+    dataset, _ = load_dataset(data_dir, batch_size=8, shuffle_buffer=16, cache=True, repeat=True,
+                              drop_remainder=True, seed=1)
+    batches = list(dataset.take(4))
+    assert all(x.shape == (8, 3) for x, _ in batches)
+
+
+def test_feature_stats(data_dir):
+    stats = collect_feature_stats(find_shards(data_dir)).to_dict()
+    assert stats["examples"] == 15
+    assert stats["labels"] == {"0": 5, "1": 10}
+    pe_ratio = stats["metrics"]["PE_RATIO"]
+    values = [float(num) for num in range(10)] + [100.0 + num for num in range(5)]
+    assert pe_ratio["count"] == 15
+    assert pe_ratio["mean"] == pytest.approx(np.mean(values))
+    assert pe_ratio["std"] == pytest.approx(np.std(values, ddof=1))
+    assert (pe_ratio["min"], pe_ratio["max"]) == (0.0, 104.0)
+    assert stats["metrics"]["ESG_RISKS"]["missing_rate"] == pytest.approx(5 / 15)
+
+
+def test_normalize(data_dir):
+    dataset, metrics = load_dataset(data_dir, batch_size=15, normalize=True)
+    features = next(iter(dataset))[0].numpy()
+    column = features[:, metrics.index("PE_RATIO")]
+    assert column.mean() == pytest.approx(0.0, abs=1e-5)
+    assert column.std(ddof=1) == pytest.approx(1.0, rel=1e-4)
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+from shared.feature_stats import FeatureStats
+from shared.running_stats import QuantileSketch, RunningStat
+
+
+def test_merge_matches_single_pass():
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(size=5000) * rng.choice([-1, 1], size=5000)
+    whole, left, right = RunningStat(), RunningStat(), RunningStat()
+    sketch, left_sketch, right_sketch = QuantileSketch(), QuantileSketch(), QuantileSketch()
+    for num, value in enumerate(values):
+        whole.update(value)
+        sketch.add(value)
+        (left if num % 3 else right).update(value)
+        (left_sketch if num % 3 else right_sketch).add(value)
+    left.merge(right)
+    left_sketch.merge(right_sketch)
+
+    assert left.mean == pytest.approx(whole.mean)
+    assert left.std == pytest.approx(whole.std)
+    assert (left.min, left.max) == (whole.min, whole.max)
+    for q in (0.01, 0.25, 0.5, 0.75, 0.99):
+        exact = np.quantile(values, q)
+        assert left_sketch.quantile(q) == pytest.approx(sketch.quantile(q))
+        assert left_sketch.quantile(q) == pytest.approx(exact, rel=0.03)
+
+
+def test_round_trip():
+    stats = FeatureStats()
+    for num in range(100):
+        stats.update({"PE_RATIO": float(num), **({"ESG_RISKS": 0.0} if num % 4 else {})}, num % 2)
+    restored = FeatureStats.from_dict(stats.to_dict())
+    restored.merge(stats)
+
+    data = restored.to_dict()
+    assert data["examples"] == 200
+    assert data["metrics"]["ESG_RISKS"]["missing_rate"] == pytest.approx(0.25)
+    assert data["metrics"]["PE_RATIO"]["quantiles"]["0.5"] == pytest.approx(49.5, rel=0.03)
+
+
+def make_example(floats: dict, label: int):
+    features = {name: tf.train.Feature(float_list=tf.train.FloatList(value=[value])) for name, value in floats.items()}
+    features["label"] = tf.train.Feature(int64_list=tf.train.Int64List(value=[label]))
+    return tf.train.Example(features=tf.train.Features(feature=features))
+
+
+def test_labels_left_out_of_metrics():
+    stats = FeatureStats()
+    example = make_example({"PE_RATIO": 3.0, "momentum_21d": 0.1, "return_21d": 0.05, "excess_return_21d": 0.01}, 1)
+    stats.add_example(example, {"return_21d", "excess_return_21d"})
+
+    data = stats.to_dict()
+    assert sorted(data["metrics"]) == ["PE_RATIO", "momentum_21d"]
+    assert data["labels"] == {"1": 1}
+    # Stats of shards that counted labels as metrics can leave them out when loaded.
+    stats.add_example(example)
+    restored = FeatureStats.from_dict(stats.to_dict(), exclude={"return_21d", "excess_return_21d"})
+    assert sorted(restored.stats) == ["PE_RATIO", "momentum_21d"]
@@ -0,0 +1,81 @@
+import time
+import pytest
+from datetime import datetime
+from app.feeder import Feeder
+from bench.memory_redis import MemoryStore, MemoryRedis
+from shared.result_index import ResultIndex
+
+
+@pytest.fixture
+def feeder(monkeypatch):
+    monkeypatch.setenv("FEEDING_TIMEOUT", "60")
+    monkeypatch.setenv("FEEDER_REUSE_DAYS", "30")
+    feeder = Feeder()
+    feeder.redis = MemoryRedis(MemoryStore(), decode_responses=False)
+    feeder.index = ResultIndex(feeder.redis)
+    return feeder
+
+
+async def add_result(feeder, day: str):
+    await feeder.index.add(f"search:AAPL,{day}", {"ticker": "AAPL", "metrics": {"esg_risk": 1}})
+
+
+@pytest.mark.asyncio
+async def test_reuse_nearest_indexed_date(feeder):
+    await add_result(feeder, "2022-03-10")
+    max_start = feeder.end_date - feeder.time_delta
+    assert await feeder.reuse_date("AAPL", datetime(2022, 3, 1), max_start) == datetime(2022, 3, 10)
+    assert feeder.stats["reused"] == 1
+    # Farther than FEEDER_REUSE_DAYS, or another ticker: the drawn date is kept.
+    assert await feeder.reuse_date("AAPL", datetime(2022, 6, 1), max_start) == datetime(2022, 6, 1)
+    assert await feeder.reuse_date("MSFT", datetime(2022, 3, 1), max_start) == datetime(2022, 3, 1)
+
+
+@pytest.mark.asyncio
+async def test_reuse_stays_in_window(feeder):
+    max_start = feeder.end_date - feeder.time_delta
+    await add_result(feeder, "2019-12-20")
+    await add_result(feeder, "2024-01-10")
+    assert await feeder.reuse_date("AAPL", datetime(2020, 1, 5), max_start) == datetime(2020, 1, 5)
+    assert await feeder.reuse_date("AAPL", max_start, max_start) == max_start
+    assert feeder.stats["reused"] == 0
+
+
+@pytest.mark.asyncio
+async def test_no_reuse_by_default(feeder, monkeypatch):
+    monkeypatch.setenv("FEEDER_REUSE_DAYS", "0")
+    feeder = Feeder()
+    feeder.index = None
+
+    async def fetch_datapoint(ticker, date):
+        feeder.drawn = date
+        return None, None
+    feeder.fetch_datapoint = fetch_datapoint
+
+    # Without FEEDER_REUSE_DAYS the index is never looked up, the drawn date is used.
+    await feeder.generate_datapoint("AAPL")
+    assert feeder.stats["reused"] == 0
+    assert feeder.start_date <= feeder.drawn <= feeder.end_date - feeder.time_delta
+
+
+@pytest.mark.asyncio
+async def test_unserved_queue_given_up(feeder, monkeypatch):
+    monkeypatch.setenv("SEARCH_TASK_TIMEOUT", "0.2")
+    feeder.stall_margin = 0.2
+
+    # No worker takes the task: it is taken back from the queue.
+    assert await feeder.fetch_or_queue_data("search_queries", "search:AAPL,2022-01-01") is None
+    assert await feeder.redis.llen("search_queries") == 0
+    assert feeder.stats["stalled"] == 1
+
+
+@pytest.mark.asyncio
+async def test_queue_stalled(feeder):
+    now = time.time()
+    # Too early to tell.
+    assert not await feeder.queue_stalled("search_queries", now, 10)
+    feeder.stall_margin = 5
+    await feeder.redis.set("search_queries:taken_at", now - 1)
+    assert not await feeder.queue_stalled("search_queries", now - 100, 10)
+    await feeder.redis.set("search_queries:taken_at", now - 20)
+    assert await feeder.queue_stalled("search_queries", now - 100, 10)
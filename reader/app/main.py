@@ -1,6 +1,12 @@
 from app.reader import Reader
+from shared.supervisor import Supervisor
 import asyncio
+import os
 
 if __name__ == "__main__":
-    reader = Reader()
-    asyncio.run(reader.run_worker())
\ No newline at end of file
+    # WORKER_PROCESSES > 1 (or 0 for one per core) runs several processes under a supervisor.
+    if int(os.environ.get("WORKER_PROCESSES", "1")) == 1:
+        reader = Reader()
+        asyncio.run(reader.run())
+    else:
+        Supervisor(Reader).run()
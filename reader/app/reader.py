@@ -1,11 +1,16 @@
 import json
+import hashlib
 import aiohttp
 import os
 import logging
 import asyncio
+import random
+import time
 from shared.payloads import *
 from shared.worker import Worker
-from shared.rate_limiter import RateLimiter
+from shared.running_stats import RunningStat
+from shared.inference_pool import InferencePool
+from shared.deadline import expired, remaining
 
 
 def discard_goals(remaining_goals: set[str], extracted_results: dict) -> set[str]:
@@ -23,6 +28,63 @@ def discard_goals(remaining_goals: set[str], extracted_results: dict) -> set[str
     }
 
 
+def parse_first_object(text: str):
+    """
+    Parse the first complete JSON object in text, ignoring anything around it.
+    :param text: Text that may hold a JSON object, possibly still incomplete.
+
+    :return dict: The object, or None if no complete object is found yet.
+    """
+    start = text.find("{")
+    if start == -1:
+        return None
+    try:
+        obj, _ = json.JSONDecoder().raw_decode(text, start)
+    except json.JSONDecodeError:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+def article_keys(result: dict) -> tuple:
+    """
+    Keys a search result is recognized by across searches.
+    :param result: Search result.
+    :return tuple: (URL without fragment and trailing slash or "", hash of the title and description)
+    """
+    url = str(result.get("url") or "").split("#", 1)[0].rstrip("/").lower()
+    text = " ".join(str(result.get(field) or "") for field in ("title", "description"))
+    content = hashlib.sha1(" ".join(text.lower().split()).encode("utf-8")).hexdigest()
+    return url, content
+
+
+def pool_articles(results_by_goal: dict) -> tuple:
+    """
+    Deduplicate the search results of several goals: results with the same URL or the same
+    text are one article.
+    :param results_by_goal: dict of goal to its search results in relevance order.
+
+    :return tuple: (dict of article key to result, dict of goal to its article keys in relevance order)
+    """
+    articles = {}
+    aliases = {}
+    keys_by_goal = {}
+    for goal, results in results_by_goal.items():
+        keys = []
+        for result in results:
+            url, content = article_keys(result)
+            key = (aliases.get(url) if url else None) or aliases.get(content)
+            if key is None:
+                key = content
+                articles[key] = result
+            if url:
+                aliases[url] = key
+            aliases[content] = key
+            if key not in keys:
+                keys.append(key)
+        keys_by_goal[goal] = keys
+    return articles, keys_by_goal
+
+
 class Reader(Worker):
     def __init__(self):
         super().__init__(
@@ -30,17 +92,90 @@ class Reader(Worker):
             data_type="search"
         )
         self.prompt_templates = json.load(open(os.environ.get("PROMPT_TEMPLATES_PATH")))
-        self.llm_url = f"{os.environ.get('MODEL_API_URL')}/v1/chat/completions"
+        # MODEL_API_URL may list several comma-separated inference servers.
+        self.llm_pool = InferencePool(
+            urls=os.environ.get("MODEL_API_URL").split(","),
+            max_failures=int(os.environ.get("LLM_MAX_FAILURES", "3")),
+            eject_period=float(os.environ.get("LLM_EJECT_PERIOD", "30")),
+            probe_period=float(os.environ.get("LLM_PROBE_PERIOD", "10"))
+        )
         self.search_api_url_web = os.environ.get("SEARCH_API_URL_WEB")
         self.search_api_url_news = os.environ.get("SEARCH_API_URL_NEWS")
         self.search_api_period = os.environ.get("SEARCH_API_PERIOD")
         self.search_api_key = os.environ.get("SEARCH_API_KEY")
         self.llm_retries = int(os.environ.get("LLM_RETRIES"))
-        self.rate_limiter = RateLimiter(period=float(self.search_api_period))
+        # Seconds of backoff between attempts while no inference server is available.
+        self.llm_backoff = float(os.environ.get("LLM_RETRY_BACKOFF", "2"))
+        self.llm_max_backoff = float(os.environ.get("LLM_RETRY_MAX_BACKOFF", "30"))
+        # Seconds per request, shortened to what is left of the task's deadline.
+        self.llm_timeout = float(os.environ.get("LLM_TIMEOUT", "300"))
+        self.search_timeout = float(os.environ.get("SEARCH_API_TIMEOUT", "30"))
+        self.llm_stream = os.environ.get("LLM_STREAM", "false").lower() == "true"
+        self.rate_limiter = self.make_rate_limiter("search", float(self.search_api_period))
+
+        # Prompt packing: results are packed into what is left of the context after the
+        # instructions and the expected answer. estimate_tokens can be swapped for a real tokenizer.
+        self.llm_context_tokens = int(os.environ.get("LLM_CONTEXT_TOKENS", "4096"))
+        self.estimate_tokens = estimate_tokens
+        self.max_tokens = {
+            goal: estimate_max_tokens(template["output_keys"], self.estimate_tokens)
+            if template.get("output_keys") else 3200
+            for goal, template in self.prompt_templates.items()
+        }
+
+        # Answers are constrained to the goal's output keys, generation ends with the object.
+        self.output_schemas = {
+            goal: make_json_schema(template["output_keys"], template.get("range"))
+            if template.get("output_keys") else None
+            for goal, template in self.prompt_templates.items()
+        }
+
+        # Requests of the same goal go to the same llama.cpp slot to reuse its prompt cache.
+        # A slot caches one prefix, so goals sharing one would evict each other's: each goal gets
+        # a slot of its own while they last, the others let the server choose.
+        self.llm_slots = int(os.environ.get("LLM_SLOTS", "0"))
+        self.goal_slots = {
+            goal: num if num < self.llm_slots else None
+            for num, goal in enumerate(sorted(self.prompt_templates))
+        }
+        unpinned = [goal for goal, slot in self.goal_slots.items() if slot is None]
+        if self.llm_slots > 0 and unpinned:
+            self.logger.warning(f"{len(self.goal_slots)} goals but LLM_SLOTS={self.llm_slots}, "
+                                f"not pinned to a slot: {', '.join(unpinned)}")
+
+        # Separate connection pools, so completions holding every LLM connection for seconds
+        # delay neither searches nor health probes. One LLM connection per llama.cpp slot.
+        llm_servers = len(self.llm_pool.backends)
+        llm_connections = int(os.environ.get("LLM_CONNECTIONS", str(self.llm_slots or 4)))
+        self.llm_http = self.http.add("llm", limit=llm_connections * llm_servers,
+                                      limit_per_host=llm_connections, timeout=self.llm_timeout)
+        self.llm_health_http = self.http.add("llm_health", limit=llm_servers, limit_per_host=1, timeout=10)
+        self.search_http = self.http.add("search", limit=int(os.environ.get("SEARCH_API_CONNECTIONS", "4")),
+                                         timeout=self.search_timeout,
+                                         retries=int(os.environ.get("SEARCH_API_HTTP_RETRIES", "2")))
+
+        # Requests answering several goals at once, by sorted goal tuple.
+        self.request_specs = {}
+        # Aggregate goals share the articles their searches return, one request per article.
+        self.share_articles = os.environ.get("AGGREGATE_SHARE_ARTICLES", "true").lower() == "true"
+
+        # Sequential estimation for aggregate goals, budgets of 0 are unlimited.
+        self.early_stop = os.environ.get("AGGREGATE_EARLY_STOP", "false").lower() == "true"
+        # Tolerance as a share of each goal's value range, 0.05 is 5 points on [0, 100].
+        self.early_stop_tolerance = float(os.environ.get("AGGREGATE_TOLERANCE", "0.05"))
+        self.early_stop_tolerances = {
+            goal: self.early_stop_tolerance * (max(template.get("range") or [0, 100])
+                                               - min(template.get("range") or [0, 100]))
+            for goal, template in self.prompt_templates.items()
+        }
+        self.early_stop_z = float(os.environ.get("AGGREGATE_CONFIDENCE_Z", "1.96"))
+        self.early_stop_min_samples = int(os.environ.get("AGGREGATE_MIN_SAMPLES", "4"))
+        self.aggregate_token_budget = int(os.environ.get("AGGREGATE_TOKEN_BUDGET", "0"))
+        self.aggregate_time_budget = float(os.environ.get("AGGREGATE_TIME_BUDGET", "0"))
 
     async def wait_for_llm(self, max_attempts: int = 120, timeout: int = 10) -> bool:
         """
-        Wait for the LLM to become operational.
+        Wait for at least one LLM backend to become operational.
 
         :param max_attempts: Maximum number of attempts to make before giving up.
         :param timeout: Timeout in seconds for each attempt.
@@ -50,30 +185,10 @@ class Reader(Worker):
 
         self.logger.info("Waiting for LLM to become available...")
 
-        test_payload = {
-            "model": "llama",
-            "messages": [
-                {"role": "user", "content": "test"}
-            ],
-            "max_tokens": 1
-        }
-
-        for attempt in range(max_attempts):
-            try:
-                async with self.session.post(self.llm_url, json=test_payload, timeout=timeout) as resp:
-                    if resp.status != 503:
-                        if resp.status == 200:
-                            self.logger.info("LLM OPERATIONAL")
-                            return True
-                        else:
-                            self.logger.warning(f"LLM returned unexpected status: {resp.status}")
-
-            except asyncio.TimeoutError:
-                self.logger.debug(f"Attempt {attempt + 1}/{max_attempts}: Connection timed out")
-            except aiohttp.ClientError as e:
-                self.logger.debug(f"Attempt {attempt + 1}/{max_attempts}: Connection error: {str(e)}")
-
-            await asyncio.sleep(5)
+        if await self.llm_pool.wait_until_ready(self.llm_health_http.session, max_attempts=max_attempts,
+                                                period=5, timeout=timeout):
+            self.logger.info("LLM OPERATIONAL")
+            return True
 
         self.logger.error("LLM CONNECTION FAILED")
         return False
@@ -84,48 +199,215 @@ class Reader(Worker):
         if not await self.wait_for_llm():
             await self.close_connection()
             raise ConnectionError("LLM unavailable")
+        self.llm_pool.start(self.llm_health_http.session)
 
-    async def llm_extract(self, date: str, ticker: str, goal: str, content: str) -> dict:
+    async def close_connection(self):
+        """Stop LLM health probing + worker connection close."""
+        await self.llm_pool.stop()
+        await super().close_connection()
+
+    def request_spec(self, goal) -> dict:
+        """
+        What a request for one goal, or for several goals over the same context, is made of.
+        :param goal: A goal, or a list of goals answered by one request.
+
+        :return dict: "goals", "prompt", "max_tokens", "slot", "schema" and "output_keys" of the request.
+        Only single-goal requests are pinned to a slot.
+        """
+        goals = tuple(sorted([goal] if isinstance(goal, str) else goal))
+        if goals not in self.request_specs:
+            templates = [self.prompt_templates[name] for name in goals]
+            output_keys = [key for template in templates for key in template.get("output_keys", [])]
+            if len(goals) == 1:
+                spec = {
+                    "prompt": templates[0]["prompt"],
+                    "max_tokens": self.max_tokens[goals[0]],
+                    "schema": self.output_schemas[goals[0]]
+                }
+            else:
+                schemas = [self.output_schemas[name] for name in goals]
+                spec = {
+                    "prompt": make_combined_template([template["prompt"] for template in templates]),
+                    "max_tokens": (estimate_max_tokens(output_keys, self.estimate_tokens)
+                                   if all(template.get("output_keys") for template in templates) else 3200),
+                    "schema": merge_json_schemas(schemas) if all(schemas) else None
+                }
+            # A combined prompt has its own prefix, pinning it to a goal's slot would evict that
+            # goal's cached prompt. The server chooses a slot for it instead.
+            slot = self.goal_slots[goals[0]] if len(goals) == 1 else None
+            spec.update(goals=goals, slot=slot, output_keys=output_keys)
+            self.request_specs[goals] = spec
+        return self.request_specs[goals]
+
+    async def post_completion(self, payload: dict, usage: dict = None) -> str:
+        """
+        Send a completion request and wait for the whole answer.
+        :param payload: Chat completions payload.
+        :param usage: Optional dict, its "total_tokens" is increased by the tokens the LLM reports.
+
+        :return str: The generated text.
+        """
+        async with self.llm_pool.acquire() as backend:
+            async with self.llm_http.post(f"{backend.url}/v1/chat/completions", json=payload) as resp:
+                resp.raise_for_status()
+                content = await resp.json()
+                raw = content["choices"][0]["message"]["content"].strip()
+
+        if usage is not None:
+            usage["total_tokens"] = (usage.get("total_tokens", 0)
+                                     + content.get("usage", {}).get("total_tokens", 0))
+        return raw
+
+    async def stream_completion(self, payload: dict, expected_keys: list, usage: dict = None) -> str:
+        """
+        Stream a completion and close the request as soon as a JSON object with all expected keys
+        has arrived, so the server stops generating.
+        :param payload: Chat completions payload.
+        :param expected_keys: Keys the answer must hold before it is complete.
+        :param usage: Optional dict, increased by "total_tokens", "streamed_chunks", "ttft" (seconds to
+        the first token) and "decode_time" (seconds from the first to the last token). Without a usage
+        chunk from the server (a stream closed early never gets one), "total_tokens" is estimated from
+        the prompt and the text received.
+
+        :return str: The generated text.
+        """
+        payload = {**payload, "stream": True, "stream_options": {"include_usage": True}}
+        text = ""
+        chunks = 0
+        reported_tokens = 0
+        started = time.monotonic()
+        first_token = last_token = None
+
+        async with self.llm_pool.acquire() as backend, \
+                self.llm_http.post(f"{backend.url}/v1/chat/completions", json=payload) as resp:
+            resp.raise_for_status()
+
+            async for line in resp.content:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+
+                chunk = json.loads(data)
+                if chunk.get("usage"):
+                    reported_tokens = chunk["usage"].get("total_tokens", 0)
+                if not chunk.get("choices"):
+                    continue
+                delta = chunk["choices"][0].get("delta", {}).get("content")
+                if not delta:
+                    continue
+
+                last_token = time.monotonic()
+                if first_token is None:
+                    first_token = last_token
+                chunks += 1
+                text += delta
+
+                if "}" in delta:
+                    answer = parse_first_object(text)
+                    if answer is not None and all(key in answer for key in expected_keys):
+                        resp.close()
+                        break
+
+        if usage is not None:
+            if not reported_tokens:
+                reported_tokens = (sum(self.estimate_tokens(message["content"]) for message in payload["messages"])
+                                   + self.estimate_tokens(text))
+            usage["total_tokens"] = usage.get("total_tokens", 0) + reported_tokens
+            usage["streamed_chunks"] = usage.get("streamed_chunks", 0) + chunks
+            if first_token is not None:
+                usage["ttft"] = usage.get("ttft", 0.0) + first_token - started
+                usage["decode_time"] = usage.get("decode_time", 0.0) + last_token - first_token
+
+        if first_token is not None:
+            self.metrics.observe("llm_ttft", first_token - started)
+            self.logger.debug(f"LLM stream: {first_token - started:.3f}s to first token, "
+                              f"{chunks} chunks in {last_token - first_token:.3f}s")
+        return text.strip()
+
+    async def llm_extract(self, date: str, ticker: str, goal: str, content: str, usage: dict = None) -> dict:
         """
         Send a request to the LLM and return the predicted price with a dict response.
         :param date: The latest date of the stock to search for.
         :param ticker: The ticker symbol of the stock.
-        :param goal: The value to extract.
+        :param goal: The value to extract, or a list of goals to answer in one request.
         :param content: The content to extract from.
+        :param usage: Optional dict, its "total_tokens" is increased by the tokens the LLM reports.
+        With LLM_STREAM, stream timings are added as well (see stream_completion).
 
         :return dict: key-value pair(s).
         """
 
-        prompt = self.prompt_templates[goal]["prompt"]
-        payload = make_llm_payload(prompt, date, ticker, content)
+        spec = self.request_spec(goal)
+        payload = make_llm_payload(spec["prompt"], date, ticker, content,
+                                   max_tokens=spec["max_tokens"], slot=spec["slot"], schema=spec["schema"])
 
         last_exception = None
 
         for attempt in range(self.llm_retries):
             try:
-                await self.rate_limiter.acquire()
-                async with self.session.post(self.llm_url, json=payload) as resp:
-                    content = await resp.json()
-                    raw = content["choices"][0]["message"]["content"].strip()
-
-                self.logger.debug(f"LLM payload: {json.dumps(payload, indent=2)}")
-                self.logger.debug(f"Raw LLM response: {raw}")
-
-                try:
-                    return json.loads(raw)
-                except json.JSONDecodeError:
-                    return {}
+                with self.metrics.timer("rate_limit_wait"):
+                    await self.rate_limiter.acquire()
+                with self.metrics.timer("llm_extract"):
+                    if self.llm_stream:
+                        raw = await self.stream_completion(payload, spec["output_keys"], usage)
+                    else:
+                        raw = await self.post_completion(payload, usage)
+
+                # Dumping the payload takes longer than the rest of the request handling.
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug(f"LLM payload: {json.dumps(payload, indent=2)}")
+                    self.logger.debug(f"Raw LLM response: {raw}")
+
+                with self.metrics.timer("json_parse"):
+                    return parse_first_object(raw) or {}
 
             except Exception as e:
                 last_exception = e
+                self.metrics.increment("llm_errors")
                 self.logger.warning(f"LLM request attempt {attempt} failed: {str(e)}")
-                if attempt < self.llm_retries:
-                    self.logger.info("Retrying...")
+                if expired():
+                    break
+                if attempt + 1 < self.llm_retries:
+                    if not self.llm_pool.available:
+                        # Every server is ejected or unhealthy, give them time to recover.
+                        backoff = min(self.llm_max_backoff, self.llm_backoff * 2 ** attempt)
+                        delay = remaining(random.uniform(0, backoff))
+                        self.logger.info(f"No inference backend available, retrying in {delay:.1f}s...")
+                        await asyncio.sleep(delay)
+                    else:
+                        self.logger.info("Retrying...")
                     continue
 
         self.logger.error(f"All {self.llm_retries} attempts failed. Last error: {str(last_exception)}")
         return {}
 
+    async def fetch_search(self, search_api_url: str, params: dict):
+        """
+        Call the search API.
+        :param search_api_url: Web or news search URL.
+        :param params: Parameters from make_search_payload.
+        :return bytes: The raw response body, or None on failure.
+        """
+        with self.metrics.timer("search"):
+            async with self.search_http.get(
+                    search_api_url,
+                    acquire=self.rate_limited(self.rate_limiter),
+                    headers={
+                        "Accept": "application/json",
+                        "Accept-Encoding": "gzip",
+                        "x-subscription-token": str(self.search_api_key)
+                    },
+                    params=params
+            ) as resp:
+                if resp.status != 200:
+                    self.logger.error(f"Search API failed: {resp.status} {await resp.text()}")
+                    return None
+
+                return await resp.read()
+
     async def search_internet(self, date: str, ticker: str, goal: str, count=6) -> list:
         """
         Search the internet for the goal for the ticker and date.
@@ -142,23 +424,22 @@ class Reader(Worker):
             search_api_url = self.search_api_url_web
 
         params = make_search_payload(self.prompt_templates[goal]["search"], date, ticker, count)
+        archive_key = self.archive.make_key(search_api_url, params)
 
-        await self.rate_limiter.acquire()
         try:
-            async with self.session.get(
-                    search_api_url,
-                    headers={
-                        "Accept": "application/json",
-                        "Accept-Encoding": "gzip",
-                        "x-subscription-token": str(self.search_api_key)
-                    },
-                    params=params
-            ) as resp:
-                if resp.status != 200:
-                    self.logger.error(f"Search API failed: {resp.status} {await resp.text()}")
+            if self.archive.replaying:
+                body = await self.archive.get(archive_key)
+                if body is None:
+                    self.logger.warning(f"No archived search for {goal} {ticker} {date}")
                     return []
+            else:
+                body = await self.fetch_search(search_api_url, params)
+                if body is None:
+                    return []
+                await self.archive.put(archive_key, body)
 
-                results = await resp.json()
+            with self.metrics.timer("json_parse"):
+                results = json.loads(body)
         except Exception as e:
             self.logger.error(f"Search request failed: {str(e)}")
             return []
@@ -190,7 +471,25 @@ class Reader(Worker):
 
         return result_fields
 
-    async def process_goal(self, date: str, ticker: str, goal: str) -> dict:
+    def pack_results(self, date: str, ticker: str, goal, results: list) -> str:
+        """
+        Package search results into the context left over for the goal's prompt.
+        :param date: The latest date of the stock to search for.
+        :param ticker: The ticker symbol of the stock.
+        :param goal: The goal the results will be extracted for, or a list of goals of one request.
+        :param results: Search results in relevance order.
+
+        :return str: The packaged results.
+        """
+        spec = self.request_spec(goal)
+        payload = make_llm_payload(spec["prompt"], date, ticker, "", max_tokens=spec["max_tokens"])
+        # 8 tokens per message for the chat template.
+        prompt_tokens = sum(self.estimate_tokens(message["content"]) + 8 for message in payload["messages"])
+        budget = self.llm_context_tokens - prompt_tokens - spec["max_tokens"]
+
+        return package_web_results(results, token_budget=max(budget, 0), estimate=self.estimate_tokens)
+
+    async def process_goal(self, date: str, ticker: str, goal: str, sampling: dict = None) -> dict:
         try:
             if goal not in self.prompt_templates:
                 raise ValueError(f"Goal {goal} not found in prompt templates")
@@ -201,10 +500,10 @@ class Reader(Worker):
                     self.logger.warning(f"No content found for {goal}")
                     return {}
 
-                packaged = package_web_results(html_content)
+                packaged = self.pack_results(date, ticker, goal, html_content)
                 results = await self.llm_extract(date, ticker, goal, packaged)
             else:
-                results = await self.get_aggregate(date, ticker, goal)
+                results = await self.get_aggregate(date, ticker, goal, sampling=sampling)
 
             if not results:
                 self.logger.warning(f"Empty results for {goal}")
@@ -214,73 +513,252 @@ class Reader(Worker):
             self.logger.error(f"Error processing goal {goal}: {str(e)}")
             return {}
 
-    async def get_aggregate(self, date: str, ticker: str, goal: str, count=20) -> dict:
+    def stop_reason(self, goal: str, stats: dict, usage: dict, started: float) -> str:
+        """
+        Decide if an aggregate goal may stop issuing LLM calls.
+        :param goal: The goal, its tolerance is AGGREGATE_TOLERANCE of its value range.
+        :param stats: dict of metric to RunningStat.
+        :param usage: dict with the "total_tokens" spent on the goal so far.
+        :param started: time.monotonic() when the goal started.
+
+        :return str: "converged", "token_budget" or "time_budget" if it should stop, "" otherwise.
+        """
+        if 0 < self.aggregate_token_budget <= usage.get("total_tokens", 0):
+            return "token_budget"
+        if 0 < self.aggregate_time_budget <= time.monotonic() - started:
+            return "time_budget"
+        if all(stat.count >= self.early_stop_min_samples
+               and stat.half_width(self.early_stop_z) <= self.early_stop_tolerances[goal]
+               for stat in stats.values()):
+            return "converged"
+        return ""
+
+    async def get_aggregate(self, date: str, ticker: str, goal: str, count=20, sampling: dict = None) -> dict:
         """
         Goes per-site and combines multiple metrics into average values.
+        With AGGREGATE_EARLY_STOP, sites stop being read once every metric's confidence interval
+        is within AGGREGATE_TOLERANCE of the goal's value range, or once the goal's token/time
+        budget is spent.
 
         :param date: Date to search for.
         :param ticker: The ticker symbol to search for.
         :param goal: The goal to choose a template for.
         :param count: Number of news articles to search for.
+        :param sampling: Optional dict, filled with the number and spread of samples under the goal's name.
 
         :return dict: Dictionary with average values for each metric found in responses.
         """
 
-        sums = {}
-        counts = {}
-
-
         template = self.prompt_templates.get(goal)
         if not template or not template.get("output_keys"):
             self.logger.error(f"No template or output keys found for goal: {goal}")
             return {}
 
         expected_keys = template["output_keys"]
-
-        for key in expected_keys:
-            sums[key] = 0.0
-            counts[key] = 0
+        stats = {key: RunningStat() for key in expected_keys}
+        usage = {"total_tokens": 0}
+        started = time.monotonic()
+        calls = 0
+        stopped = "exhausted"
 
         results = await self.search_internet(date, ticker, goal, count)
 
         for result in results:
-            to_read = f"{result.get('description', '')}\n\n{result.get('extra_snippets', '')}"
+            if self.early_stop:
+                reason = self.stop_reason(goal, stats, usage, started)
+                if reason:
+                    stopped = reason
+                    break
+
+            to_read = self.pack_results(date, ticker, goal, [result])
             if to_read != "":
-                answer = await self.llm_extract(date, ticker, goal, to_read)
-                try:
-                    for metric, value in answer.items():
-                        if metric in expected_keys:
-                            try:
-                                num_value = float(value)
-                                sums[metric] = sums.get(metric, 0) + num_value
-                                counts[metric] = counts.get(metric, 0) + 1
-                            except (ValueError, TypeError):
-                                self.logger.warning(f"Invalid value for metric {metric}: {value}")
-                except (AttributeError, TypeError):
-                    self.logger.warning(f"Invalid answer format from LLM: {answer}")
-
-        averages = {
-            metric: sums[metric] / counts[metric] if counts[metric] > 0 else 0
-            for metric in expected_keys
+                answer = await self.llm_extract(date, ticker, goal, to_read, usage=usage)
+                calls += 1
+                self.record_answer(stats, answer)
+
+        if stopped != "exhausted":
+            self.logger.info(f"{goal} stopped ({stopped}) after {calls}/{len(results)} calls")
+
+        if sampling is not None:
+            sampling[goal] = self.sampling_summary(stats, usage, calls, len(results), stopped)
+
+        return self.averages(stats)
+
+    def record_answer(self, stats: dict, answer: dict):
+        """
+        Add the values of an LLM answer to the running stats of their metrics.
+        :param stats: dict of metric to RunningStat, other keys of the answer are ignored.
+        :param answer: The parsed answer.
+        """
+        try:
+            for metric, value in answer.items():
+                if metric in stats:
+                    try:
+                        stats[metric].update(float(value))
+                    except (ValueError, TypeError):
+                        self.logger.warning(f"Invalid value for metric {metric}: {value}")
+        except (AttributeError, TypeError):
+            self.logger.warning(f"Invalid answer format from LLM: {answer}")
+
+    @staticmethod
+    def averages(stats: dict) -> dict:
+        return {metric: stat.mean if stat.count > 0 else 0 for metric, stat in stats.items()}
+
+    @staticmethod
+    def sampling_summary(stats: dict, usage: dict, calls: int, available: int, stopped: str) -> dict:
+        """
+        How many samples an aggregate goal used and what they cost, for the task's "sampling".
+        """
+        return {
+            "calls": calls,
+            "available": available,
+            "stopped": stopped,
+            "tokens": round(usage["total_tokens"]),
+            "ttft": usage["ttft"] / calls if calls and "ttft" in usage else None,
+            "time_per_chunk": (usage["decode_time"] / usage["streamed_chunks"]
+                               if usage.get("streamed_chunks") else None),
+            "metrics": {
+                metric: {"n": stat.count, "std": stat.std}
+                for metric, stat in stats.items()
+            }
         }
 
-        return averages
+    async def extract_article(self, date: str, ticker: str, goals: list, result: dict) -> tuple:
+        """
+        Extract the metrics of several goals from one article with one LLM request.
+        :param goals: Goals to answer.
+        :param result: The article's search result.
 
-    async def get_all_metrics(self, date: str, ticker: str) -> dict:
+        :return tuple: (answer, usage of the request), ({}, {}) if nothing of the article fits the prompt.
+        """
+        to_read = self.pack_results(date, ticker, goals, [result])
+        if to_read == "":
+            return {}, {}
+        usage = {"total_tokens": 0}
+        if len(goals) > 1:
+            self.metrics.increment("combined_requests")
+        return await self.llm_extract(date, ticker, goals, to_read, usage=usage), usage
+
+    async def get_shared_aggregates(self, date: str, ticker: str, goals: list, count=20,
+                                    sampling: dict = None) -> dict:
+        """
+        get_aggregate of several goals sharing their articles. All goals search first, then the
+        results are pooled by URL and text: an article found by several goals is packaged once
+        and read by one LLM request answering all goals that have it and have not stopped.
+        Every goal still reads its articles in its own relevance order and stops on its own, and is
+        only charged for the answers it reaches: its even share of each request's tokens.
+
+        :param date: Date to search for.
+        :param ticker: The ticker symbol to search for.
+        :param goals: Aggregate goals.
+        :param count: Number of news articles to search for, per goal.
+        :param sampling: Optional dict, filled per goal like get_aggregate, with "shared_calls"
+        telling how many of its calls answered other goals too.
+
+        :return dict: Dictionary with average values for each metric of every goal.
+        """
+        goals = [goal for goal in goals if self.prompt_templates[goal].get("output_keys")]
+        searches = await asyncio.gather(*(self.search_internet(date, ticker, goal, count) for goal in goals))
+        articles, keys = pool_articles(dict(zip(goals, searches)))
+        results_found = sum(len(results) for results in searches)
+        self.metrics.increment("articles_deduplicated", results_found - len(articles))
+
+        stats = {goal: {key: RunningStat() for key in self.prompt_templates[goal]["output_keys"]} for goal in goals}
+        usage = {goal: {"total_tokens": 0} for goal in goals}
+        calls = {goal: 0 for goal in goals}
+        shared_calls = {goal: 0 for goal in goals}
+        stopped = {goal: "exhausted" for goal in goals}
+        position = {goal: 0 for goal in goals}
+        answers = {}
+        active = set(goals)
+        started = time.monotonic()
+        requests = 0
+
+        while active:
+            wanted = {}
+            for goal in sorted(active):
+                # A goal is charged for an answer once it reaches it: answers prefetched for goals
+                # that stop first are never counted.
+                while position[goal] < len(keys[goal]) and (keys[goal][position[goal]], goal) in answers:
+                    answer, request_usage, group_size = answers.pop((keys[goal][position[goal]], goal))
+                    self.record_answer(stats[goal], answer)
+                    position[goal] += 1
+                    if not request_usage:
+                        continue
+                    calls[goal] += 1
+                    shared_calls[goal] += group_size > 1
+                    # Goals split the cost of a shared request; each waited for its first token.
+                    for field, value in request_usage.items():
+                        share = value if field == "ttft" else value / group_size
+                        usage[goal][field] = usage[goal].get(field, 0) + share
+                if position[goal] >= len(keys[goal]):
+                    active.discard(goal)
+                    continue
+                if self.early_stop:
+                    reason = self.stop_reason(goal, stats[goal], usage[goal], started)
+                    if reason:
+                        stopped[goal] = reason
+                        active.discard(goal)
+                        continue
+                wanted.setdefault(keys[goal][position[goal]], []).append(goal)
+
+            if not wanted:
+                break
+
+            # Goals that reach the article later are answered by the same request.
+            for key, group in wanted.items():
+                group.extend(goal for goal in sorted(active)
+                             if goal not in group and (key, goal) not in answers
+                             and key in keys[goal][position[goal] + 1:])
+
+            groups = list(wanted.items())
+            extracted = await asyncio.gather(*(self.extract_article(date, ticker, group, articles[key])
+                                               for key, group in groups))
+            for (key, group), (answer, request_usage) in zip(groups, extracted):
+                if request_usage:
+                    requests += 1
+                for goal in group:
+                    answers[(key, goal)] = (answer, request_usage, len(group))
+
+        unused = sum(1 for _, request_usage, _ in answers.values() if request_usage)
+        self.metrics.increment("unused_answers", unused)
+        self.logger.info(f"{ticker} {date}: {len(articles)} unique articles of {results_found} results "
+                         f"read with {requests} LLM requests, {unused} answers unused")
+
+        metrics = {}
+        for goal in goals:
+            if stopped[goal] != "exhausted":
+                self.logger.info(f"{goal} stopped ({stopped[goal]}) after {calls[goal]}/{len(keys[goal])} calls")
+            if sampling is not None:
+                sampling[goal] = self.sampling_summary(stats[goal], usage[goal], calls[goal],
+                                                       len(keys[goal]), stopped[goal])
+                sampling[goal]["shared_calls"] = shared_calls[goal]
+            metrics.update(self.averages(stats[goal]))
+        return metrics
+
+    async def get_all_metrics(self, date: str, ticker: str, sampling: dict = None) -> dict:
         """
         Get all metrics from the json list of goals.
         :param date: latest date to check
         :param ticker: stock's ticker
+        :param sampling: Optional dict, filled per goal with how many samples were used.
         :return: A dict of metrics, all are numerical values.
         """
         remaining_goals = set(self.prompt_templates.keys())
         results = {}
 
-        #TODO add super search to get many goals in 1 request.
+        if self.share_articles:
+            shared = sorted(goal for goal in remaining_goals
+                            if self.prompt_templates[goal]["type"] != "single"
+                            and self.prompt_templates[goal].get("output_keys"))
+            if shared:
+                result = await self.get_shared_aggregates(date, ticker, shared, sampling=sampling)
+                results.update(result)
+                remaining_goals -= set(shared)
 
         if remaining_goals:
             for goal in remaining_goals.copy():
-                result = await self.process_goal(date, ticker, goal)
+                result = await self.process_goal(date, ticker, goal, sampling=sampling)
                 results.update(result)
                 discard_goals(remaining_goals, result)
 
@@ -298,12 +776,14 @@ class Reader(Worker):
         try:
             self.logger.info(f"Processing task: {task}")
 
-            metrics = await self.get_all_metrics(date, ticker)
+            sampling = {}
+            metrics = await self.get_all_metrics(date, ticker, sampling=sampling)
 
             result = {
                 "ticker": ticker,
                 "date": date,
-                "metrics": metrics
+                "metrics": metrics,
+                "sampling": sampling
             }
 
             return result
@@ -0,0 +1,22 @@
+import os
+import pytest
+from app.reader import Reader
+
+TEMPLATES = os.path.join(os.path.dirname(os.path.dirname(__file__)), "app", "prompt_templates.json")
+
+
+@pytest.fixture
+def make_reader(monkeypatch):
+    """Make a Reader with the repository's templates and no upstream, settings override the defaults."""
+    def make(**settings):
+        defaults = {"MODEL_API_URL": "http://inference:8000", "PROMPT_TEMPLATES_PATH": TEMPLATES,
+                    "SEARCH_API_PERIOD": "0", "LLM_RETRIES": "1", "LLM_SLOTS": "4"}
+        for name, value in {**defaults, **settings}.items():
+            monkeypatch.setenv(name, str(value))
+        return Reader()
+    return make
+
+
+@pytest.fixture
+def reader(make_reader):
+    return make_reader()
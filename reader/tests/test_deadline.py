@@ -0,0 +1,47 @@
+import asyncio
+import time
+import pytest
+from shared.worker import Worker
+from shared.deadline import make_entry, parse_entry, remaining, client_timeout, current_deadline
+
+
+def test_entry_round_trip():
+    entry = make_entry("search:AAPL,2022-01-01", 1800.0)
+    assert parse_entry(entry) == ("search:AAPL,2022-01-01", 1800.0)
+    assert parse_entry(entry.encode("utf-8")) == ("search:AAPL,2022-01-01", 1800.0)
+
+
+def test_plain_key_has_no_timeout():
+    assert make_entry("stock:AAPL,2022-01-01,2023-01-01") == "stock:AAPL,2022-01-01,2023-01-01"
+    assert parse_entry("stock:AAPL,2022-01-01,2023-01-01") == ("stock:AAPL,2022-01-01,2023-01-01", None)
+
+
+def test_timeout_bounded_by_deadline():
+    assert remaining(30) == 30
+    token = current_deadline.set(time.time() + 5)
+    try:
+        assert 4 < remaining(30) <= 5
+        assert remaining(2) == 2
+        assert client_timeout(30).total <= 5
+    finally:
+        current_deadline.reset(token)
+
+
+def test_expired_deadline_raises():
+    token = current_deadline.set(time.time() - 1)
+    try:
+        assert remaining(30) == 0.0
+        with pytest.raises(asyncio.TimeoutError):
+            client_timeout(30)
+    finally:
+        current_deadline.reset(token)
+
+
+def test_budget_counts_from_when_taken(monkeypatch):
+    monkeypatch.setenv("TASK_TIMEOUT", "600")
+    worker = Worker("queue", "search")
+    _, timeout = parse_entry(make_entry("search:AAPL,2022-01-01", 30.0))
+    # Time spent queued is not taken off the budget.
+    assert worker.task_budget(timeout) == 30.0
+    assert worker.task_budget(5000.0) == 600.0
+    assert worker.task_budget(None) == 600.0
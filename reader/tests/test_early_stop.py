@@ -0,0 +1,72 @@
+import time
+import pytest
+from shared.running_stats import RunningStat
+
+
+def make_stats(values: dict) -> dict:
+    stats = {}
+    for metric, observations in values.items():
+        stats[metric] = RunningStat()
+        for value in observations:
+            stats[metric].update(value)
+    return stats
+
+
+def test_tolerance_scales_with_range(reader):
+    # ESG_RISKS is scored on [0, 100], FINANCIAL_SENTIMENT on [-100, 100].
+    assert reader.early_stop_tolerances["ESG_RISKS"] == pytest.approx(5.0)
+    assert reader.early_stop_tolerances["FINANCIAL_SENTIMENT"] == pytest.approx(10.0)
+
+
+def test_converged_needs_min_samples_and_narrow_interval(make_reader):
+    reader = make_reader(AGGREGATE_MIN_SAMPLES=4)
+    started = time.monotonic()
+    usage = {"total_tokens": 0}
+    # Identical answers: zero spread, but fewer than AGGREGATE_MIN_SAMPLES.
+    assert reader.stop_reason("ESG_RISKS", make_stats({"esg": [50, 50, 50]}), usage, started) == ""
+    assert reader.stop_reason("ESG_RISKS", make_stats({"esg": [50] * 4}), usage, started) == "converged"
+    # Every metric must converge.
+    stats = make_stats({"esg": [50] * 4, "other": [0, 100, 0, 100]})
+    assert reader.stop_reason("ESG_RISKS", stats, usage, started) == ""
+
+
+def test_interval_against_goal_tolerance(reader):
+    started = time.monotonic()
+    usage = {"total_tokens": 0}
+    # Half width 1.96 * 8.16 / 2 = 8: above 5 on [0, 100], within 10 on [-100, 100].
+    values = [40, 50, 60, 50]
+    assert reader.stop_reason("ESG_RISKS", make_stats({"esg": values}), usage, started) == ""
+    assert reader.stop_reason("FINANCIAL_SENTIMENT", make_stats({"score": values}), usage, started) == "converged"
+
+
+def test_budgets(make_reader):
+    reader = make_reader(AGGREGATE_TOKEN_BUDGET=1000, AGGREGATE_TIME_BUDGET=5)
+    stats = make_stats({"esg": [0, 100]})
+    now = time.monotonic()
+    assert reader.stop_reason("ESG_RISKS", stats, {"total_tokens": 999}, now) == ""
+    assert reader.stop_reason("ESG_RISKS", stats, {"total_tokens": 1000}, now) == "token_budget"
+    assert reader.stop_reason("ESG_RISKS", stats, {"total_tokens": 0}, now - 6) == "time_budget"
+
+
+@pytest.mark.asyncio
+async def test_get_aggregate_stops_early(make_reader):
+    reader = make_reader(AGGREGATE_EARLY_STOP="true", AGGREGATE_MIN_SAMPLES=3)
+    keys = reader.prompt_templates["ESG_RISKS"]["output_keys"]
+
+    async def search_internet(date, ticker, goal, count=20):
+        return [{"url": f"https://example.com/{num}", "title": f"t{num}", "description": "d"} for num in range(10)]
+
+    async def llm_extract(date, ticker, goal, content, usage=None):
+        usage["total_tokens"] += 100
+        return {key: 30 for key in keys}
+
+    reader.search_internet = search_internet
+    reader.llm_extract = llm_extract
+    reader.pack_results = lambda date, ticker, goal, results: "article"
+
+    sampling = {}
+    metrics = await reader.get_aggregate("2022-01-01", "AAPL", "ESG_RISKS", sampling=sampling)
+    assert metrics == {key: 30 for key in keys}
+    assert sampling["ESG_RISKS"]["calls"] == 3
+    assert sampling["ESG_RISKS"]["stopped"] == "converged"
+    assert sampling["ESG_RISKS"]["tokens"] == 300
@@ -0,0 +1,112 @@
+import pytest
+from shared.payloads import (estimate_tokens, estimate_max_tokens, truncate_to_tokens,
+                             package_web_results, make_llm_payload, make_json_schema,
+                             make_combined_template, merge_json_schemas)
+from app.reader import pool_articles
+
+results = [
+    {
+        "title": f"Result {num}",
+        "age": "2 days ago",
+        "description": "earnings beat estimates " * 200,
+        "extra_snippets": ["analysts raised targets " * 50, "guidance was cut " * 50]
+    }
+    for num in range(10)
+]
+
+
+@pytest.mark.parametrize("budget", [64, 500, 1500, 3000])
+def test_package_web_results_budget(budget):
+    """
+    Packaged results stay within the token budget and keep relevance order.
+    """
+    packaged = package_web_results(results, token_budget=budget)
+
+    assert estimate_tokens(packaged) <= budget
+    assert packaged.startswith("=== RESULT 1 ===")
+
+
+def test_package_web_results_counts_separators():
+    """
+    With an exact estimate (one token per character) the separators count against the budget.
+    """
+    first, second = package_web_results(results[:2], estimate=len).split("\n\n\n")
+    for budget in (len(first) + len(second), len(first) + len(second) + 40, 5000):
+        packaged = package_web_results(results, token_budget=budget, estimate=len)
+        assert len(packaged) <= budget
+
+
+def test_package_web_results_unlimited():
+    packaged = package_web_results(results)
+
+    assert packaged.count("=== RESULT") == len(results)
+    assert packaged.index("=== RESULT 2 ===") < packaged.index("=== RESULT 3 ===")
+
+
+def test_truncate_to_tokens():
+    text = "word " * 1000
+
+    assert truncate_to_tokens(text, 10000) == text
+    assert estimate_tokens(truncate_to_tokens(text, 50)) <= 50
+    assert truncate_to_tokens(text, 0) == ""
+
+
+def test_max_tokens_from_output_keys():
+    keys = ["earnings_score", "analyst_score", "debt_score"]
+    payload = make_llm_payload("{{TICKER}} at {{TIME}}", "2024-01-01", "AAPL", "",
+                               max_tokens=estimate_max_tokens(keys))
+
+    assert 16 < payload["max_tokens"] < 3200
+    assert estimate_max_tokens(keys) > estimate_max_tokens(keys[:1])
+
+
+def test_llm_payload_static_prefix():
+    """
+    Requests for the same goal share the whole system message, only the user message varies.
+    """
+    template = "Analyze {{TICKER}} as of {{TIME}}. Return EXACTLY: {\"score\": <int>}"
+    first = make_llm_payload(template, "2024-01-01", "AAPL", "apple news", slot=2)
+    second = make_llm_payload(template, "2022-06-30", "MSFT", "microsoft news", slot=2)
+
+    assert first["messages"][0] == second["messages"][0]
+    assert "AAPL" not in first["messages"][0]["content"]
+    assert "AAPL" in first["messages"][1]["content"]
+    assert first["cache_prompt"] and first["id_slot"] == 2
+    assert "id_slot" not in make_llm_payload(template, "2024-01-01", "AAPL", "")
+
+
+def test_llm_payload_schema():
+    keys = ["antitrust_risk", "fda_risk"]
+    schema = make_json_schema(keys, [0, 100])
+    payload = make_llm_payload("{{TICKER}}", "2024-01-01", "AAPL", "", schema=schema)
+
+    assert payload["response_format"]["json_schema"]["schema"] == schema
+    assert schema["required"] == keys and not schema["additionalProperties"]
+    assert schema["properties"]["fda_risk"] == {"type": "integer", "minimum": 0, "maximum": 100}
+    assert make_llm_payload("{{TICKER}}", "2024-01-01", "AAPL", "")["response_format"] == {"type": "json_object"}
+
+
+def test_combined_request():
+    risk = make_json_schema(["antitrust_risk", "fda_risk"], [0, 100])
+    sentiment = make_json_schema(["earnings_score"], [-100, 100])
+    schema = merge_json_schemas([risk, sentiment])
+    template = make_combined_template(["Rate {{TICKER}} risks.", "Rate {{TICKER}} earnings."])
+
+    assert schema["required"] == ["antitrust_risk", "fda_risk", "earnings_score"]
+    assert schema["properties"]["earnings_score"]["minimum"] == -100
+    assert "Task 1: Rate {{TICKER}} risks." in template and "Task 2:" in template
+
+
+def test_pool_articles():
+    article = {"url": "https://news.example.com/a/", "title": "A", "description": "Earnings beat"}
+    syndicated = {"url": "https://other.example.com/a", "title": "A", "description": "Earnings  beat"}
+    other = {"url": "https://news.example.com/b", "title": "B", "description": "Guidance cut"}
+    articles, keys = pool_articles({
+        "FINANCIAL_SENTIMENT": [article, other],
+        "EXECUTIVE_IMPACT": [{**article, "url": "https://news.example.com/a#top"}],
+        "INDUSTRY_TRENDS": [other, syndicated]
+    })
+
+    assert len(articles) == 2
+    assert keys["EXECUTIVE_IMPACT"] == keys["FINANCIAL_SENTIMENT"][:1]
+    assert keys["INDUSTRY_TRENDS"] == keys["FINANCIAL_SENTIMENT"][::-1]
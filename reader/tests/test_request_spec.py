@@ -0,0 +1,17 @@
+def test_combined_requests_are_not_pinned(reader):
+    first, second = sorted(reader.prompt_templates)[:2]
+    assert reader.request_spec(first)["slot"] == reader.goal_slots[first]
+    # A combined prompt would evict the cached prefix of its first goal's slot.
+    assert reader.request_spec([first, second])["slot"] is None
+
+
+def test_goal_slots(make_reader):
+    reader = make_reader(LLM_SLOTS=4)
+    goals = sorted(reader.prompt_templates)
+    # Every pinned goal has a slot to itself, goals beyond LLM_SLOTS are not pinned.
+    assert [reader.goal_slots[goal] for goal in goals[:4]] == [0, 1, 2, 3]
+    assert all(reader.goal_slots[goal] is None for goal in goals[4:])
+
+    reader = make_reader(LLM_SLOTS=len(goals))
+    assert sorted(reader.goal_slots.values()) == list(range(len(goals)))
+    assert all(slot is None for slot in make_reader(LLM_SLOTS=0).goal_slots.values())
@@ -0,0 +1,56 @@
+import pytest
+
+ESG, REGULATORY = "ESG_RISKS", "REGULATORY_RISK"
+
+
+def article(num: int, url: str = None) -> dict:
+    return {"url": url or f"https://example.com/{num}", "title": f"Article {num}", "description": f"About {num}"}
+
+
+@pytest.mark.asyncio
+async def test_shared_aggregates_dedupe_extend_and_stop(make_reader):
+    reader = make_reader(AGGREGATE_EARLY_STOP="true", AGGREGATE_MIN_SAMPLES=2)
+    searches = {
+        ESG: [article(num) for num in (1, 2, 3, 4, 5)],
+        # 3 and 1 by URL, the last one by its text (same article under another URL).
+        REGULATORY: [article(3), article(6), article(7), article(1), article(4, "https://mirror.example.com/4")]
+    }
+    requests = []
+
+    async def search_internet(date, ticker, goal, count=20):
+        return searches[goal]
+
+    async def extract_article(date, ticker, goals, result):
+        num = int(result["title"].split()[-1])
+        requests.append((num, sorted(goals)))
+        answer = {}
+        for goal in goals:
+            for key in reader.prompt_templates[goal]["output_keys"]:
+                # ESG answers are far apart and never converge, regulatory answers agree at once.
+                answer[key] = 100 * (num % 2) if goal == ESG else 50
+        return answer, {"total_tokens": 100}
+
+    reader.search_internet = search_internet
+    reader.extract_article = extract_article
+    sampling = {}
+    metrics = await reader.get_shared_aggregates("2024-01-01", "AAPL", [ESG, REGULATORY], sampling=sampling)
+
+    # Every article is read once, goals reaching it later join the request.
+    assert sorted(num for num, _ in requests) == [1, 2, 3, 4, 5, 6]
+    assert dict(requests)[1] == [ESG, REGULATORY]
+    assert dict(requests)[3] == [ESG, REGULATORY]
+    assert reader.metrics.counters["articles_deduplicated"] == 3
+
+    # Regulatory converges after 3 and 6 and never uses the answer on 1 prefetched for it.
+    assert sampling[REGULATORY]["stopped"] == "converged"
+    assert sampling[REGULATORY]["calls"] == 2
+    assert sampling[REGULATORY]["shared_calls"] == 1
+    assert sampling[REGULATORY]["tokens"] == 150
+    assert reader.metrics.counters["unused_answers"] == 1
+
+    assert sampling[ESG]["stopped"] == "exhausted"
+    assert sampling[ESG]["calls"] == 5
+    assert sampling[ESG]["shared_calls"] == 2
+    assert sampling[ESG]["tokens"] == 400
+    assert metrics["esg_risk"] == pytest.approx(60)
+    assert metrics["fda_risk"] == pytest.approx(50)
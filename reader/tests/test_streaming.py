@@ -0,0 +1,87 @@
+import json
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from app.reader import parse_first_object
+
+PAYLOAD = {"messages": [{"role": "system", "content": "x" * 400}, {"role": "user", "content": "y" * 400}]}
+
+
+def sse(delta: str = None, usage: dict = None) -> bytes:
+    chunk = {"choices": [{"delta": {"content": delta}}] if delta is not None else []}
+    if usage:
+        chunk["usage"] = usage
+    return f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
+
+
+@pytest_asyncio.fixture
+async def server():
+    """Local completions server streaming an answer, then junk it never stops sending unless closed."""
+    sent = {"chunks": 0}
+
+    async def complete(request):
+        body = await request.json()
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        deltas = ['{"price"', ': 5, ', '"volume": 7}'] + (["junk"] * 50 if body.get("endless") else [])
+        try:
+            for delta in deltas:
+                await resp.write(sse(delta))
+                sent["chunks"] += 1
+            if not body.get("endless"):
+                await resp.write(sse(usage={"total_tokens": 123}))
+                await resp.write(b"data: [DONE]\n\n")
+        except ConnectionResetError:
+            pass
+        return resp
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", complete)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}", sent
+    await runner.cleanup()
+
+
+@pytest_asyncio.fixture
+async def streaming_reader(make_reader, server):
+    url, _ = server
+    reader = make_reader(MODEL_API_URL=url)
+    reader.http.open()
+    yield reader
+    await reader.http.close()
+
+
+def test_parse_first_object():
+    assert parse_first_object('Sure: {"a": 1} and {"b": 2}') == {"a": 1}
+    assert parse_first_object('{"a": {"b": 1}, "c": 2} trailing') == {"a": {"b": 1}, "c": 2}
+    assert parse_first_object('{"a": 1, "b"') is None
+    assert parse_first_object("no object") is None
+
+
+@pytest.mark.asyncio
+async def test_stream_reports_server_usage(streaming_reader):
+    usage = {}
+    # An answer missing a key is read to the end of the stream, usage chunk included.
+    text = await streaming_reader.stream_completion(PAYLOAD, ["price", "volume", "spread"], usage)
+    assert json.loads(text) == {"price": 5, "volume": 7}
+    assert usage["total_tokens"] == 123
+    assert usage["streamed_chunks"] == 3
+
+
+@pytest.mark.asyncio
+async def test_early_cancel_estimates_prompt(streaming_reader, server):
+    _, sent = server
+    usage = {}
+    payload = {**PAYLOAD, "endless": True}
+    text = await streaming_reader.stream_completion(payload, ["price", "volume"], usage)
+
+    assert parse_first_object(text) == {"price": 5, "volume": 7}
+    assert usage["streamed_chunks"] == 3
+    # No usage chunk arrives once the stream is closed, the prompt is still counted.
+    prompt = sum(streaming_reader.estimate_tokens(message["content"]) for message in PAYLOAD["messages"])
+    assert usage["total_tokens"] == prompt + streaming_reader.estimate_tokens(text)
+    assert usage["total_tokens"] > 200
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlencode, urlsplit
+
+MODES = ("off", "record", "replay")
+
+# Request parameters that are never part of an archive key.
+SECRET_PARAMS = {"apikey"}
+
+
+class ResponseArchive:
+    def __init__(self, path: str, mode: str = "off"):
+        """
+        Local archive of raw upstream responses, compressed and indexed by request.
+        In "record" mode every response is appended, older responses of a request are kept; in
+        "replay" mode the newest response of each request is served from the archive without
+        network access. "off" does neither. get and put run SQLite in a thread, off the event loop.
+        :param path: Path of the SQLite archive file.
+        :param mode: "off", "record" or "replay".
+        """
+        if mode not in MODES:
+            raise ValueError(f"Invalid archive mode {mode}, expected one of {MODES}")
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.path = path
+        self.mode = mode
+        self.db = None
+        # One connection shared by the threads of get and put.
+        self.lock = threading.Lock()
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    @staticmethod
+    def make_key(url: str, params: dict) -> str:
+        """
+        Key of a request: its URL path and sorted parameters, without secrets. The host is left
+        out so an archive replays the same when the API is reached through another address.
+        :param url: Request URL.
+        :param params: Query parameters.
+        :return str: The key.
+        """
+        kept = sorted((key, str(value)) for key, value in params.items() if key not in SECRET_PARAMS)
+        return f"{urlsplit(url).path}?{urlencode(kept)}"
+
+    def connect(self) -> sqlite3.Connection:
+        if self.db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            # WAL lets several worker processes record into the same file.
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT NOT NULL, recorded_at REAL NOT NULL, size INTEGER NOT NULL, body BLOB NOT NULL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS entries_key ON entries (key)")
+            # Archives recorded before entries were appended kept one response per request.
+            if self.db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'responses'").fetchone():
+                self.db.execute("INSERT INTO entries (key, recorded_at, size, body) "
+                                "SELECT key, recorded_at, size, body FROM responses ORDER BY recorded_at")
+                self.db.execute("DROP TABLE responses")
+            self.db.commit()
+        return self.db
+
+    def read(self, key: str):
+        """
+        Newest archived response of a request, see get.
+        :param key: Key from make_key.
+        :return bytes: The raw response body, or None if it is not archived.
+        """
+        with self.lock:
+            row = self.connect().execute("SELECT body FROM entries WHERE key = ? ORDER BY rowid DESC LIMIT 1",
+                                         (key,)).fetchone()
+        return zlib.decompress(row[0]) if row else None
+
+    def write(self, key: str, body: bytes):
+        """
+        Append a response when recording, see put.
+        :param key: Key from make_key.
+        :param body: The raw response body.
+        """
+        if not self.recording:
+            return
+        try:
+            with self.lock:
+                db = self.connect()
+                db.execute("INSERT INTO entries (key, recorded_at, size, body) VALUES (?, ?, ?, ?)",
+                           (key, time.time(), len(body), zlib.compress(body)))
+                db.commit()
+        except sqlite3.Error as e:
+            self.logger.error(f"Archiving {key} failed: {str(e)}")
+
+    async def get(self, key: str):
+        """
+        Get the newest archived response of a request.
+        :param key: Key from make_key.
+        :return bytes: The raw response body, or None if it is not archived.
+        """
+        return await asyncio.to_thread(self.read, key)
+
+    async def put(self, key: str, body: bytes):
+        """
+        Archive a response when recording, after the older ones of the same request.
+        :param key: Key from make_key.
+        :param body: The raw response body.
+        """
+        if self.recording:
+            await asyncio.to_thread(self.write, key, body)
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
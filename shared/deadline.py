@@ -0,0 +1,84 @@
+import asyncio
+import contextvars
+import json
+import os
+import time
+import aiohttp
+
+# Result written for a task whose deadline passed, so whoever waits on it stops waiting.
+TIMEOUT_ERROR = "timeout"
+
+# Unix time by which the task being processed must be done, None without a deadline.
+current_deadline = contextvars.ContextVar("current_deadline", default=None)
+
+
+def task_timeout(data_type: str) -> float:
+    """
+    Longest a task of a service may run once taken, shared by its workers and the Feeder:
+    <DATA_TYPE>_TASK_TIMEOUT, else TASK_TIMEOUT. 0 for no limit.
+    :param data_type: Type of the tasks. Ex: "search"
+    :return float: The timeout in seconds.
+    """
+    return float(os.environ.get(f"{data_type.upper()}_TASK_TIMEOUT", os.environ.get("TASK_TIMEOUT", "1800")))
+
+
+def taken_key(queue: str) -> str:
+    """Key holding the Unix time a worker last took a task from a queue."""
+    return f"{queue}:taken_at"
+
+
+def make_entry(key: str, timeout: float = None) -> str:
+    """
+    Make a queue entry for a task.
+    :param key: Task key. Ex: "search:AAPL,2022-01-01"
+    :param timeout: Seconds the task may take once a worker takes it, None for the worker's own
+    limit. Time spent in the queue does not count.
+    :return str: The entry, the plain key without a timeout.
+    """
+    if timeout is None:
+        return key
+    return json.dumps({"key": key, "timeout": timeout})
+
+
+def parse_entry(entry) -> tuple:
+    """
+    Read a queue entry made by make_entry. Plain task keys are accepted too.
+    :param entry: The entry, str or bytes.
+    :return tuple: (task key, timeout or None)
+    """
+    if isinstance(entry, bytes):
+        entry = entry.decode("utf-8")
+    if entry.startswith("{"):
+        data = json.loads(entry)
+        return data["key"], data.get("timeout")
+    return entry, None
+
+
+def remaining(limit: float = None):
+    """
+    Seconds left until the current deadline.
+    :param limit: Upper bound of the result, None for none.
+    :return float: The seconds left, at most limit. None without a deadline and limit.
+    """
+    deadline = current_deadline.get()
+    if deadline is None:
+        return limit
+    left = max(0.0, deadline - time.time())
+    return left if limit is None else min(left, limit)
+
+
+def expired() -> bool:
+    deadline = current_deadline.get()
+    return deadline is not None and time.time() >= deadline
+
+
+def client_timeout(limit: float) -> aiohttp.ClientTimeout:
+    """
+    Timeout of an HTTP call: limit, or less when the current deadline is nearer.
+    :param limit: Timeout in seconds without a deadline.
+    :return aiohttp.ClientTimeout: The timeout of the whole call.
+    :raises asyncio.TimeoutError: The deadline has passed already.
+    """
+    if expired():
+        raise asyncio.TimeoutError("Task deadline passed")
+    return aiohttp.ClientTimeout(total=remaining(limit))
@@ -0,0 +1,156 @@
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+
+class LoopMonitor:
+    def __init__(self, metrics, period: float = 0.5, slow_threshold: float = 0.25, debug: bool = False):
+        """
+        Measures how late the event loop wakes up, to tell synchronous work on the loop apart
+        from waiting on upstreams. A watchdog thread logs the loop thread's stack whenever the
+        loop is stuck for longer than slow_threshold, naming the code that blocks it.
+        :param metrics: Metrics to record "loop_lag" and "slow_callbacks" in.
+        :param period: Seconds between lag samples, 0 disables the monitor.
+        :param slow_threshold: Seconds of blocking reported as a slow callback, 0 disables the watchdog.
+        :param debug: Also run asyncio in debug mode, which logs every callback slower than
+        slow_threshold. Costly, meant for development.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.metrics = metrics
+        self.period = period
+        self.slow_threshold = slow_threshold
+        self.debug = debug
+        self.heartbeat = time.monotonic()
+        self.loop_thread = None
+        self.watchdog = None
+        self.stopped = threading.Event()
+
+    async def run(self):
+        """Sample the loop lag forever. Starts the watchdog thread."""
+        if self.period <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        if self.debug:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.slow_threshold
+
+        self.loop_thread = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        if self.slow_threshold > 0:
+            self.stopped.clear()
+            self.watchdog = threading.Thread(target=self.watch, name="loop-watchdog", daemon=True)
+            self.watchdog.start()
+
+        try:
+            while True:
+                expected = time.monotonic() + self.period
+                await asyncio.sleep(self.period)
+                now = time.monotonic()
+                self.heartbeat = now
+                lag = max(0.0, now - expected)
+                self.metrics.observe("loop_lag", lag)
+        finally:
+            self.stopped.set()
+
+    def watch(self):
+        """Watchdog thread: report the loop thread's stack once per stall."""
+        reported = None
+        while not self.stopped.wait(self.slow_threshold / 2):
+            heartbeat = self.heartbeat
+            stalled = time.monotonic() - heartbeat - self.period
+            if stalled < self.slow_threshold or reported == heartbeat:
+                continue
+            reported = heartbeat
+            frame = sys._current_frames().get(self.loop_thread)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame, limit=12))
+            self.metrics.increment("slow_callbacks")
+            self.logger.warning(f"Event loop blocked for {stalled:.3f}s in:\n{stack}")
+
+
+class TaskProfiler:
+    # Only one profiler can run in a process at a time.
+    active = False
+
+    def __init__(self, service: str, sample_rate: float = 0.0, directory: str = "profiles",
+                 dump_every: int = 20, top: int = 40):
+        """
+        Opt-in cProfile of a sampled share of tasks. Profiles are added up and written to
+        <directory>/<service>-<pid>.pstats (for pstats/snakeviz) and a .txt hot-spot report.
+        cProfile sees the whole event loop thread, not one task: whatever else runs while a task
+        is profiled (background jobs such as the Stocker's prefetch, health probes, the metrics
+        server) is attributed to it. Profile with those turned off to measure the task alone.
+        :param service: Name of the service, used in file names.
+        :param sample_rate: Share of tasks to profile between 0 and 1, 0 disables profiling.
+        :param directory: Where to write the reports.
+        :param dump_every: Write the reports after this many profiled tasks, and on close().
+        :param top: Functions listed in the text report.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.service = service
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.dump_every = dump_every
+        self.top = top
+        self.stats = None
+        self.profiled = 0
+
+    @contextmanager
+    def profile(self):
+        """
+        Profile the block if it is sampled and no other profile runs. Time spent awaiting is
+        included, so the "tottime" report is the one that shows CPU hot spots. Coroutines run
+        concurrently with the block are profiled too, see the class docstring.
+        """
+        if self.sample_rate <= 0 or TaskProfiler.active or random.random() >= self.sample_rate:
+            yield
+            return
+
+        TaskProfiler.active = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            TaskProfiler.active = False
+            if self.stats is None:
+                self.stats = pstats.Stats(profiler)
+            else:
+                self.stats.add(profiler)
+            self.profiled += 1
+            if self.profiled % self.dump_every == 0:
+                self.dump()
+
+    def dump(self):
+        """Write the reports of every task profiled so far."""
+        if self.stats is None:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{self.service}-{os.getpid()}")
+            self.stats.dump_stats(f"{path}.pstats")
+
+            report = io.StringIO()
+            report.write(f"{self.profiled} profiled tasks of {self.service}, including whatever "
+                         f"ran on the event loop next to them (background jobs)\n\n")
+            for order in ("cumulative", "tottime"):
+                pstats.Stats(f"{path}.pstats", stream=report).sort_stats(order).print_stats(self.top)
+            with open(f"{path}.txt", "w") as f:
+                f.write(report.getvalue())
+            self.logger.info(f"Wrote profile of {self.profiled} tasks to {path}.pstats")
+        except OSError as e:
+            self.logger.error(f"Writing profile failed: {str(e)}")
+
+    def close(self):
+        self.dump()
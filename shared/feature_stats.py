@@ -0,0 +1,106 @@
+from shared.running_stats import RunningStat, QuantileSketch
+
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+
+class FeatureStats:
+    def __init__(self):
+        """
+        Streaming statistics of a dataset, kept as examples are written so training needs no
+        pass over the data to normalize it: per metric count, missing rate, mean/std, min/max
+        and quantiles, and the label balance. Stats of shards or runs can be merged.
+        """
+        self.examples = 0
+        self.stats = {}
+        self.sketches = {}
+        self.labels = {}
+
+    def update(self, metrics: dict, label: int):
+        """
+        Add one example.
+        :param metrics: Metric name to value of the example, missing metrics left out.
+        :param label: Label of the example.
+        """
+        self.examples += 1
+        for metric, value in metrics.items():
+            if metric not in self.stats:
+                self.stats[metric] = RunningStat()
+                self.sketches[metric] = QuantileSketch()
+            self.stats[metric].update(value)
+            self.sketches[metric].add(value)
+        label = str(int(label))
+        self.labels[label] = self.labels.get(label, 0) + 1
+
+    def add_example(self, example, label_names=()):
+        """
+        Add a tf.train.Example as the Feeder writes it: float metrics, float labels and an int64 "label".
+        :param example: The example.
+        :param label_names: Names of the float labels (forward returns), left out of the metrics:
+        they are targets and must not be normalized or summarized as inputs.
+        """
+        metrics = {}
+        label = 0
+        for name, feature in example.features.feature.items():
+            if name in label_names:
+                continue
+            if name == "label":
+                label = feature.int64_list.value[0]
+            elif feature.float_list.value:
+                metrics[name] = feature.float_list.value[0]
+            elif feature.int64_list.value:
+                metrics[name] = float(feature.int64_list.value[0])
+        self.update(metrics, label)
+
+    def merge(self, other: "FeatureStats"):
+        """
+        Add the examples of other stats, ex: of another shard.
+        :param other: The other stats.
+        """
+        self.examples += other.examples
+        for metric, stat in other.stats.items():
+            if metric not in self.stats:
+                self.stats[metric] = RunningStat()
+                self.sketches[metric] = QuantileSketch(other.sketches[metric].relative_accuracy)
+            self.stats[metric].merge(stat)
+            self.sketches[metric].merge(other.sketches[metric])
+        for label, count in other.labels.items():
+            self.labels[label] = self.labels.get(label, 0) + count
+
+    def to_dict(self) -> dict:
+        """
+        Stats for the dataset metadata: a readable summary with everything needed to merge them.
+        :return dict: JSON-serializable stats.
+        """
+        metrics = {}
+        for metric, stat in sorted(self.stats.items()):
+            sketch = self.sketches[metric]
+            metrics[metric] = {
+                **stat.to_dict(),
+                "missing_rate": 1 - stat.count / self.examples if self.examples else 0.0,
+                "quantiles": {str(q): sketch.quantile(q) for q in QUANTILES},
+                "sketch": sketch.to_dict()
+            }
+        return {
+            "examples": self.examples,
+            "labels": dict(sorted(self.labels.items())),
+            "label_balance": {label: count / self.examples for label, count in sorted(self.labels.items())}
+            if self.examples else {},
+            "metrics": metrics
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, exclude=()) -> "FeatureStats":
+        """
+        Stats from to_dict.
+        :param data: The dict.
+        :param exclude: Metrics to leave out, ex: labels of shards that counted them as metrics.
+        """
+        stats = cls()
+        stats.examples = data["examples"]
+        stats.labels = dict(data["labels"])
+        for metric, values in data["metrics"].items():
+            if metric in exclude:
+                continue
+            stats.stats[metric] = RunningStat.from_dict(values)
+            stats.sketches[metric] = QuantileSketch.from_dict(values["sketch"])
+        return stats
@@ -0,0 +1,257 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from types import SimpleNamespace
+import aiohttp
+from shared.deadline import client_timeout, expired, remaining
+
+# Statuses worth another attempt: rate limited or a temporary server failure.
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+def parse_retry_after(value: str):
+    """
+    Seconds to wait from a Retry-After header, in seconds or as an HTTP date.
+    :return float: The seconds, None if there is no valid header.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class Upstream:
+    def __init__(self, name: str, limit: int = 8, limit_per_host: int = None, timeout: float = 30,
+                 connect_timeout: float = 5, retries: int = 0, backoff: float = 0.5, max_backoff: float = 8,
+                 keepalive: float = 60, dns_ttl: int = 300, metrics=None):
+        """
+        Connection pool and retry policy of one upstream API, with its own aiohttp session so a
+        slow upstream cannot hold the connections of another.
+        :param name: Name of the upstream, used in metric names. Ex: "search"
+        :param limit: Most open connections, match it to the requests the upstream serves at once.
+        :param limit_per_host: Most open connections to one host, limit by default.
+        :param timeout: Seconds per request, shortened to what is left of the task's deadline.
+        :param connect_timeout: Seconds to open a connection. Waiting for a free one is only
+        bounded by timeout.
+        :param retries: Extra attempts after connection errors, timeouts and RETRY_STATUSES. 429 is
+        only retried for requests made with an acquire callback (see request).
+        :param backoff: Base of the exponential backoff in seconds. Waits are drawn uniformly
+        up to the backoff (full jitter) so workers do not retry in step.
+        :param max_backoff: Longest wait between attempts.
+        :param keepalive: Seconds idle connections are kept open.
+        :param dns_ttl: Seconds DNS lookups are cached.
+        :param metrics: Optional Metrics to record connection waits and reuse in.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.name = name
+        self.limit = limit
+        self.limit_per_host = limit_per_host or limit
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.keepalive = keepalive
+        self.dns_ttl = dns_ttl
+        self.metrics = metrics
+        self.session = None
+
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.counts = {"requests": 0, "retries": 0, "errors": 0, "new_connections": 0, "reused_connections": 0}
+        self.queued_time = 0.0
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """Hooks that time the wait for a free connection and count new and reused ones."""
+        trace = aiohttp.TraceConfig()
+
+        async def queued_start(session, context, params):
+            context.queued_at = time.monotonic()
+
+        async def queued_end(session, context, params):
+            waited = time.monotonic() - context.queued_at
+            self.queued_time += waited
+            if self.metrics is not None:
+                self.metrics.observe(f"{self.name}_connection_wait", waited)
+
+        def connected(context):
+            # Requests count as in flight once they hold a connection, not while they wait for one.
+            if context.trace_request_ctx is not None and not context.trace_request_ctx.connected:
+                context.trace_request_ctx.connected = True
+                self.in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+        async def created(session, context, params):
+            self.counts["new_connections"] += 1
+            connected(context)
+
+        async def reused(session, context, params):
+            self.counts["reused_connections"] += 1
+            connected(context)
+
+        trace.on_connection_queued_start.append(queued_start)
+        trace.on_connection_queued_end.append(queued_end)
+        trace.on_connection_create_end.append(created)
+        trace.on_connection_reuseconn.append(reused)
+        return trace
+
+    def open(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl,
+                keepalive_timeout=self.keepalive
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout, sock_connect=self.connect_timeout),
+                trace_configs=[self.trace_config()]
+            )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def retry_delay(self, attempt: int, retry_after: float = None):
+        """
+        Full jitter backoff of an attempt, at least the upstream's Retry-After, cut to what is
+        left of the deadline.
+        :param attempt: Number of the failed attempt, from 0.
+        :param retry_after: Seconds the upstream asked to wait, None if it did not.
+        :return float: Seconds to wait, None if Retry-After is past the deadline.
+        """
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if retry_after is not None:
+            left = remaining()
+            if left is not None and retry_after > left:
+                return None
+            delay = max(delay, retry_after)
+        return remaining(delay)
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str, retries: int = None, acquire=None, **kwargs):
+        """
+        Make a request, retrying connection errors, timeouts and RETRY_STATUSES before the
+        response is handed over. Without a "timeout" argument the upstream's timeout is used,
+        bounded by the task's deadline.
+        :param method: HTTP method.
+        :param url: URL.
+        :param retries: Overrides the upstream's retries, ex: 0 for requests that must not repeat.
+        :param acquire: Coroutine function awaited before every attempt, ex: a rate limiter's
+        acquire, so retries stay within the upstream's rate limit. 429 is only retried with it.
+        :param kwargs: Arguments of aiohttp.ClientSession.request.
+        :return aiohttp.ClientResponse: The response, released on exit.
+        """
+        retries = self.retries if retries is None else retries
+        attempt = 0
+        while True:
+            if acquire is not None:
+                await acquire()
+            timeout = kwargs.get("timeout") or client_timeout(self.timeout)
+            self.counts["requests"] += 1
+            trace = SimpleNamespace(connected=False)
+            resp = None
+            try:
+                try:
+                    resp = await self.session.request(method, url, trace_request_ctx=trace,
+                                                      **{**kwargs, "timeout": timeout})
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    if attempt >= retries or expired():
+                        self.counts["errors"] += 1
+                        raise
+                    delay = self.retry_delay(attempt)
+                    self.logger.debug(f"{self.name} request failed ({e.__class__.__name__}), retrying")
+                else:
+                    delay = None
+                    if resp.status in RETRY_STATUSES and attempt < retries and not expired() \
+                            and (resp.status != 429 or acquire is not None):
+                        delay = self.retry_delay(attempt, parse_retry_after(resp.headers.get("Retry-After")))
+                    if delay is None:
+                        yield resp
+                        return
+                    self.logger.debug(f"{self.name} returned {resp.status}, retrying in {delay:.2f}s")
+            finally:
+                if resp is not None:
+                    resp.release()
+                if trace.connected:
+                    self.in_flight -= 1
+
+            self.counts["retries"] += 1
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> dict:
+        """
+        Pool utilization of the upstream.
+        :return dict: Counts, requests holding a connection, their peak and share of the limit,
+        and seconds spent waiting for a free connection.
+        """
+        return {
+            **self.counts,
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "utilization": self.in_flight / self.limit if self.limit else 0.0,
+            "queued_time": self.queued_time
+        }
+
+
+class HttpClient:
+    def __init__(self, metrics=None):
+        """
+        The upstreams of a worker, each with its own connection pool (see Upstream).
+        :param metrics: Optional Metrics shared by the upstreams.
+        """
+        self.metrics = metrics
+        self.upstreams = {}
+
+    def add(self, name: str, **config) -> Upstream:
+        """
+        Register an upstream.
+        :param name: Name of the upstream.
+        :param config: Arguments of Upstream.
+        :return Upstream: The upstream, its session is made by open().
+        """
+        upstream = Upstream(name, metrics=self.metrics, **config)
+        self.upstreams[name] = upstream
+        return upstream
+
+    def open(self):
+        for upstream in self.upstreams.values():
+            upstream.open()
+
+    async def close(self):
+        for upstream in self.upstreams.values():
+            await upstream.close()
+
+    def stats(self) -> dict:
+        """
+        Utilization of every upstream, also set as gauges of the metrics.
+        :return dict: Upstream name to its stats.
+        """
+        stats = {name: upstream.stats() for name, upstream in self.upstreams.items()}
+        if self.metrics is not None:
+            for name, upstream_stats in stats.items():
+                self.metrics.set_gauge(f"{name}_in_flight", upstream_stats["in_flight"])
+                self.metrics.set_gauge(f"{name}_utilization", upstream_stats["utilization"])
+                self.metrics.set_gauge(f"{name}_new_connections", upstream_stats["new_connections"])
+                self.metrics.set_gauge(f"{name}_reused_connections", upstream_stats["reused_connections"])
+        return stats
@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+import aiohttp
+from shared.deadline import expired
+
+
+class Backend:
+    def __init__(self, url: str):
+        """
+        One llama.cpp/OpenAI-compatible inference server.
+        :param url: Base URL of the server, ex: "http://inference:8000".
+        """
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.healthy = False
+        self.failures = 0
+        self.ejected_until = 0.0
+
+    @property
+    def available(self) -> bool:
+        return self.healthy and time.monotonic() >= self.ejected_until
+
+
+class InferencePool:
+    def __init__(self, urls: list, max_failures: int = 3, eject_period: float = 30.0, probe_period: float = 10.0):
+        """
+        Pool of inference servers with least-outstanding-requests routing and health probing.
+        :param urls: Base URLs of the servers.
+        :param max_failures: Consecutive failed requests before a server is ejected.
+        :param eject_period: Seconds an ejected server is left out before it is probed again.
+        :param probe_period: Seconds between health probes of every server.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.backends = [Backend(url) for url in urls if url.strip()]
+        self.max_failures = max_failures
+        self.eject_period = eject_period
+        self.probe_period = probe_period
+        self.probe_task = None
+
+    async def probe(self, session: aiohttp.ClientSession, backend: Backend, timeout: float = 5) -> bool:
+        """
+        Check if a server is ready. Uses /health (503 while llama.cpp loads the model), or
+        /v1/models for servers without it.
+        :param session: aiohttp session.
+        :param backend: Server to probe.
+        :param timeout: Timeout in seconds of the probe.
+
+        :return bool: True if the server is ready.
+        """
+        try:
+            async with session.get(f"{backend.url}/health", timeout=timeout) as resp:
+                if resp.status == 404:
+                    async with session.get(f"{backend.url}/v1/models", timeout=timeout) as models:
+                        return models.status == 200
+                return resp.status == 200
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            self.logger.debug(f"Probe of {backend.url} failed: {str(e)}")
+            return False
+
+    async def probe_all(self, session: aiohttp.ClientSession, timeout: float = 5):
+        """
+        Probe every server that is not ejected, and re-admit ejected servers once healthy again.
+        :param session: aiohttp session.
+        :param timeout: Timeout in seconds of each probe.
+        """
+        now = time.monotonic()
+        backends = [backend for backend in self.backends if now >= backend.ejected_until]
+        results = await asyncio.gather(*(self.probe(session, backend, timeout) for backend in backends))
+
+        for backend, healthy in zip(backends, results):
+            if healthy and not backend.healthy:
+                self.logger.info(f"Inference backend {backend.url} ready")
+                backend.failures = 0
+            elif not healthy and backend.healthy:
+                self.logger.warning(f"Inference backend {backend.url} failed its health probe")
+            backend.healthy = healthy
+
+    async def wait_until_ready(self, session: aiohttp.ClientSession, max_attempts: int = 120,
+                               period: float = 5, timeout: float = 5) -> bool:
+        """
+        Wait until at least one server is ready.
+        :param session: aiohttp session.
+        :param max_attempts: Maximum number of probe rounds before giving up.
+        :param period: Seconds between probe rounds.
+        :param timeout: Timeout in seconds of each probe.
+
+        :return bool: True if a server is ready, False otherwise.
+        """
+        for attempt in range(max_attempts):
+            await self.probe_all(session, timeout)
+            ready = sum(backend.available for backend in self.backends)
+            if ready:
+                self.logger.info(f"{ready}/{len(self.backends)} inference backends ready")
+                return True
+            self.logger.debug(f"Attempt {attempt + 1}/{max_attempts}: no inference backend ready")
+            await asyncio.sleep(period)
+        return False
+
+    async def run_probes(self, session: aiohttp.ClientSession):
+        """Probe every server forever, every probe_period seconds."""
+        while True:
+            await asyncio.sleep(self.probe_period)
+            try:
+                await self.probe_all(session)
+            except Exception as e:
+                self.logger.error(f"Health probing failed: {str(e)}")
+
+    def start(self, session: aiohttp.ClientSession):
+        """Start background health probing."""
+        if self.probe_task is None:
+            self.probe_task = asyncio.create_task(self.run_probes(session))
+
+    async def stop(self):
+        """Stop background health probing."""
+        if self.probe_task:
+            self.probe_task.cancel()
+            try:
+                await self.probe_task
+            except asyncio.CancelledError:
+                pass
+            self.probe_task = None
+
+    @property
+    def available(self) -> bool:
+        return any(backend.available for backend in self.backends)
+
+    def pick(self) -> Backend:
+        """
+        Choose the available server with the fewest outstanding requests. Without one, the
+        server with the fewest failures is tried rather than failing the request outright.
+        :return Backend: The server.
+        """
+        if not self.backends:
+            raise ConnectionError("No inference backend configured")
+        available = [backend for backend in self.backends if backend.available]
+        if not available:
+            return min(self.backends, key=lambda backend: (backend.failures, backend.outstanding))
+        return min(available, key=lambda backend: backend.outstanding)
+
+    def report_failure(self, backend: Backend):
+        """
+        Count a failed request, and eject the server after max_failures in a row, unless it is
+        the last available one: ejecting it would fail every request until it is re-admitted.
+        :param backend: Server that failed.
+        """
+        backend.failures += 1
+        others = any(other.available for other in self.backends if other is not backend)
+        if backend.failures >= self.max_failures and backend.healthy and others:
+            backend.healthy = False
+            backend.ejected_until = time.monotonic() + self.eject_period
+            self.logger.warning(f"Ejected inference backend {backend.url} for {self.eject_period}s "
+                                f"after {backend.failures} failures")
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        Route a request to a server, tracking its outstanding requests and failures.
+        Connection errors, timeouts and 5xx statuses raised inside count as failures.
+        """
+        backend = self.pick()
+        backend.outstanding += 1
+        try:
+            yield backend
+            backend.failures = 0
+        except aiohttp.ClientResponseError as e:
+            if e.status >= 500:
+                self.report_failure(backend)
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            # Running out of the task's own deadline is not the server's fault.
+            if not expired():
+                self.report_failure(backend)
+            raise
+        finally:
+            backend.outstanding -= 1
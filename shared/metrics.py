@@ -0,0 +1,206 @@
+import asyncio
+import bisect
+import logging
+import os
+import socket
+import time
+from contextlib import contextmanager
+from aiohttp import web
+
+# Upper bounds in seconds of the latency histogram buckets.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        """
+        Fixed-bucket histogram of observations.
+        :param buckets: Sorted upper bounds of the buckets, an overflow bucket is added.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile by interpolating inside its bucket.
+        :param q: Quantile between 0 and 1.
+        :return float: The estimate, 0.0 without observations.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for num, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[num - 1] if num > 0 else 0.0
+                upper = self.buckets[num] if num < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class Metrics:
+    def __init__(self, service: str):
+        """
+        Stage latency histograms, counters and gauges of one service.
+        Exposed in Prometheus text format over HTTP and/or flushed to a Redis hash.
+        :param service: Name of the service, ex: "search".
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.service = service
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.caches = {}
+        self.instance = f"{socket.gethostname()}:{os.getpid()}"
+        self.port = int(os.environ.get("METRICS_PORT", "0"))
+        self.flush_period = float(os.environ.get("METRICS_FLUSH_PERIOD", "0"))
+        self.runner = None
+        self.flush_task = None
+
+    def observe(self, stage: str, seconds: float):
+        """
+        Record the duration of a stage.
+        :param stage: Name of the stage, ex: "llm_extract".
+        :param seconds: Duration in seconds.
+        """
+        if stage not in self.histograms:
+            self.histograms[stage] = Histogram()
+        self.histograms[stage].observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Time the body of a with block as a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def increment(self, name: str, amount: float = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name: str, value: float):
+        self.gauges[name] = value
+
+    def record_cache(self, cache: str, hit: bool):
+        """
+        Count a cache lookup.
+        :param cache: Name of the cache, ex: "stock_data".
+        :param hit: True if the lookup was served from the cache.
+        """
+        hits, misses = self.caches.get(cache, (0, 0))
+        self.caches[cache] = (hits + 1, misses) if hit else (hits, misses + 1)
+
+    def render(self) -> str:
+        """
+        Render every metric in Prometheus text format.
+        :return str: The exposition text.
+        """
+        service = f'service="{self.service}"'
+        lines = ["# TYPE trademon_stage_seconds histogram"]
+        for stage, histogram in sorted(self.histograms.items()):
+            labels = f'{service},stage="{stage}"'
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'trademon_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'trademon_stage_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"trademon_stage_seconds_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"trademon_stage_seconds_count{{{labels}}} {histogram.count}")
+
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE trademon_{name}_total counter")
+            lines.append(f"trademon_{name}_total{{{service}}} {value}")
+
+        for name, value in sorted(self.gauges.items()):
+            lines.append(f"# TYPE trademon_{name} gauge")
+            lines.append(f"trademon_{name}{{{service}}} {value}")
+
+        if self.caches:
+            lines.append("# TYPE trademon_cache_hit_ratio gauge")
+        for cache, (hits, misses) in sorted(self.caches.items()):
+            ratio = hits / (hits + misses) if hits + misses else 0.0
+            lines.append(f'trademon_cache_hit_ratio{{{service},cache="{cache}"}} {ratio}')
+
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """
+        Flat summary of every metric, used for the Redis hash.
+        :return dict: field to value.
+        """
+        fields = {}
+        for stage, histogram in self.histograms.items():
+            fields[f"{stage}_count"] = histogram.count
+            fields[f"{stage}_sum"] = histogram.sum
+            fields[f"{stage}_p50"] = histogram.quantile(0.5)
+            fields[f"{stage}_p99"] = histogram.quantile(0.99)
+        fields.update({f"{name}_total": value for name, value in self.counters.items()})
+        fields.update(self.gauges)
+        for cache, (hits, misses) in self.caches.items():
+            fields[f"{cache}_hits"] = hits
+            fields[f"{cache}_misses"] = misses
+        fields["updated_at"] = time.time()
+        return fields
+
+    async def flush(self, redis):
+        """
+        Write the snapshot to the Redis hash "metrics:<service>:<host>:<pid>".
+        :param redis: Redis connection.
+        """
+        await redis.hset(f"metrics:{self.service}:{self.instance}", mapping=self.snapshot())
+
+    async def run_flush(self, redis):
+        """Flush to Redis forever, every flush_period seconds."""
+        while True:
+            await asyncio.sleep(self.flush_period)
+            try:
+                await self.flush(redis)
+            except Exception as e:
+                self.logger.error(f"Metrics flush failed: {str(e)}")
+
+    async def start(self, redis=None):
+        """
+        Serve /metrics on METRICS_PORT and flush to Redis every METRICS_FLUSH_PERIOD seconds,
+        each only if configured (non-zero).
+        :param redis: Redis connection for flushing.
+        """
+        if self.port and self.runner is None:
+            app = web.Application()
+            app.router.add_get("/metrics", self.handle_metrics)
+            self.runner = web.AppRunner(app, access_log=None)
+            await self.runner.setup()
+            try:
+                await web.TCPSite(self.runner, "0.0.0.0", self.port).start()
+                self.logger.info(f"Serving metrics on port {self.port}")
+            except OSError as e:
+                self.logger.error(f"Metrics server failed on port {self.port}: {str(e)}")
+                await self.runner.cleanup()
+                self.runner = None
+
+        if self.flush_period and redis is not None and self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.run_flush(redis))
+
+    async def stop(self):
+        """Stop serving and flushing."""
+        if self.flush_task:
+            self.flush_task.cancel()
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+            self.flush_task = None
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
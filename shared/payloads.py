@@ -9,26 +9,154 @@ def date_pack(date, days):
     return f"{date_minus(date, days)}to{date}"
 
 
-def make_llm_payload(template, time, ticker, html_content) -> dict:
-    content = (template
-               .replace("{{TICKER}}", ticker)
-               .replace("{{TIME}}", time))
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token count estimate, about 4 characters per token for English text.
+    Used as the default tokenizer hook for prompt packing.
+    """
+    return len(text) // 4 + 1
+
+
+def estimate_max_tokens(output_keys: list, estimate=estimate_tokens) -> int:
+    """
+    Number of tokens needed to answer with a flat JSON object of numbers.
+    :param output_keys: Keys that the answer must contain.
+    :param estimate: Token estimate hook.
+    :return int: max_tokens for the request.
+    """
+    body = sum(estimate(f'"{key}": -100, ') for key in output_keys)
+    return 2 * body + 16
+
+
+def truncate_to_tokens(text: str, max_tokens: int, estimate=estimate_tokens) -> str:
+    """
+    Cut text down to about max_tokens tokens.
+    :param text: Text to cut.
+    :param max_tokens: Token limit.
+    :param estimate: Token estimate hook.
+    :return str: The text, cut and marked with "..." if it was too long.
+    """
+    if max_tokens <= 0:
+        return ""
+    tokens = estimate(text)
+    if tokens <= max_tokens:
+        return text
+
+    # The "..." marker counts against the limit too.
+    cut = len(text) * max_tokens // tokens
+    while cut > 0 and estimate(text[:cut].rstrip() + "...") > max_tokens:
+        cut = cut * 9 // 10
+    return text[:cut].rstrip() + "..." if cut > 0 else ""
+
+
+# Per-field token limits used when packaging web results.
+FIELD_TOKEN_LIMITS = {
+    "title": 48,
+    "description": 256,
+    "extra_snippets": 384,
+    "transcript": 512
+}
+
+
+# Between the packaged results of a prompt.
+RESULT_SEPARATOR = "\n\n\n"
+
+SYSTEM_PROMPT = "You are a financial analyst. Return ONLY valid JSON with no commentary."
+
+
+def make_static_prompt(template: str) -> str:
+    """
+    Goal instructions with the per-request values left out, so they are identical for every request.
+    :param template: Use template from the prompt templates.json file.
+    :return str: The instructions, referring to the ticker and date given with the request.
+    """
+    return (template
+            .replace("{{TICKER}}", "the ticker given below")
+            .replace("{{TIME}}", "the date given below"))
+
+
+def make_json_schema(output_keys: list, value_range: list = None) -> dict:
+    """
+    JSON schema of an answer holding exactly the output keys as integers.
+    :param output_keys: Keys that the answer must contain.
+    :param value_range: Optional [minimum, maximum] of every value.
+    :return dict: The schema.
+    """
+    value = {"type": "integer"}
+    if value_range:
+        value["minimum"], value["maximum"] = value_range
+
     return {
+        "type": "object",
+        "properties": {key: dict(value) for key in output_keys},
+        "required": list(output_keys),
+        "additionalProperties": False
+    }
+
+
+def make_combined_template(templates: list) -> str:
+    """
+    Template of one request answering several goals over the same context.
+    :param templates: Prompts of the goals, each asking for its own keys.
+    :return str: The combined template.
+    """
+    tasks = "\n".join(f"Task {num}: {template}" for num, template in enumerate(templates, 1))
+    return f"{tasks}\nAnswer every task in ONE JSON object holding all of the keys above."
+
+
+def merge_json_schemas(schemas: list) -> dict:
+    """
+    Schema of an answer holding the keys of every schema, see make_json_schema.
+    :param schemas: Object schemas with distinct keys.
+    :return dict: The merged schema.
+    """
+    merged = {"type": "object", "properties": {}, "required": [], "additionalProperties": False}
+    for schema in schemas:
+        merged["properties"].update(schema["properties"])
+        merged["required"].extend(key for key in schema["required"] if key not in merged["required"])
+    return merged
+
+
+def make_llm_payload(template, time, ticker, html_content, max_tokens=3200, slot=None, schema=None) -> dict:
+    """
+    Make a payload for the chat completions API.
+    The system message only holds static instructions so llama.cpp can reuse its prompt cache
+    for every request of the same goal; the ticker, date and context come after it.
+    :param template: Use template from the prompt templates.json file.
+    :param time: The latest date of the stock.
+    :param ticker: Stock's ticker.
+    :param html_content: Context to extract from.
+    :param max_tokens: Maximum tokens to generate.
+    :param slot: llama.cpp server slot to pin the request to, None to let the server choose.
+    :param schema: JSON schema the answer is constrained to, None for any JSON object.
+    :return: payload.
+    """
+    payload = {
         "model": "llama",
         "messages": [
             {
                 "role": "system",
-                "content": "You are a financial analyst. Return ONLY valid JSON with no commentary."
+                "content": f"{SYSTEM_PROMPT}\n\n{make_static_prompt(template)}"
             },
             {
                 "role": "user",
-                "content": f"{content}\nHTML context:\n```{html_content}```"
+                "content": f"Ticker: {ticker}\nDate: {time}\nHTML context:\n```{html_content}```"
             }
         ],
         "temperature": 0.4,
-        "max_tokens": 3200,
-        "response_format": {"type": "json_object"}
+        "max_tokens": max_tokens,
+        "response_format": {"type": "json_object"},
+        "cache_prompt": True
     }
+    if slot is not None:
+        payload["id_slot"] = slot
+    if schema is not None:
+        payload["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": "answer", "schema": schema}
+        }
+
+    return payload
 
 
 def make_search_payload(template, date, ticker, count, period=365) -> dict:
@@ -56,39 +184,81 @@ def make_search_payload(template, date, ticker, count, period=365) -> dict:
     return params
 
 
-def package_web_results(web_results: list) -> str:
+def package_web_result(num: int, result: dict, field_limits: dict = None, estimate=estimate_tokens) -> str:
     """
-    Enhanced result packaging with more context
-    web_results: list of dicts with search results.
+    Package a single search result, each field cut to its token limit.
+    :param num: Position of the result, starting at 0.
+    :param result: dict of the search result.
+    :param field_limits: Token limit per field, defaults to FIELD_TOKEN_LIMITS.
+    :param estimate: Token estimate hook.
+    :return str: The packaged result.
     """
-    package = ""
-    for num, result in enumerate(web_results):
-        package += f"=== RESULT {num + 1} ===\n"
+    limits = FIELD_TOKEN_LIMITS if field_limits is None else field_limits
+    lines = [f"=== RESULT {num + 1} ==="]
+
+    # Add title
+    lines.append(f"Title: {truncate_to_tokens(result.get('title', ''), limits['title'], estimate)}")
 
-        # Add title
-        package += f"Title: {result.get('title', '')}\n"
+    # Add date information if available
+    if "age" in result:
+        lines.append(f"Date: {result['age']}")
+    elif "page_age" in result:
+        lines.append(f"Date: {result['page_age']}")
 
-        # Add date information if available
-        if "age" in result:
-            package += f"Date: {result['age']}\n"
-        elif "page_age" in result:
-            package += f"Date: {result['page_age']}\n"
+    # Add main content
+    if "description" in result:
+        description = truncate_to_tokens(result["description"], limits["description"], estimate)
+        lines.append(f"\nDescription:\n{description}\n")
 
-        # Add main content
-        if "description" in result:
-            package += f"\nDescription:\n{result['description']}\n\n"
+    # Add extra snippets, until their shared limit is used up
+    if "extra_snippets" in result and result["extra_snippets"]:
+        lines.append("Additional Information:")
+        remaining = limits["extra_snippets"]
+        for snippet in result["extra_snippets"]:
+            snippet = truncate_to_tokens(snippet, remaining, estimate)
+            if not snippet:
+                break
+            lines.append(f"- {snippet}")
+            remaining -= estimate(snippet)
+        lines.append("")
 
-        # Add extra snippets
-        if "extra_snippets" in result and result["extra_snippets"]:
-            package += "Additional Information:\n"
-            for snippet in result["extra_snippets"]:
-                package += f"- {snippet}\n"
-            package += "\n"
+    # Add video transcript
+    if "video" in result and "transcript" in result["video"]:
+        transcript = truncate_to_tokens(result["video"]["transcript"], limits["transcript"], estimate)
+        lines.append(f"Video Transcript:\n{transcript}\n")
+
+    return "\n".join(lines)
+
+
+def package_web_results(web_results: list, token_budget: int = None, field_limits: dict = None,
+                        estimate=estimate_tokens) -> str:
+    """
+    Enhanced result packaging with more context.
+    Results are packed in the order given (the search API's relevance order) until the budget is used.
+    :param web_results: list of dicts with search results.
+    :param token_budget: Maximum tokens of the package, None for no limit.
+    :param field_limits: Token limit per field, defaults to FIELD_TOKEN_LIMITS.
+    :param estimate: Token estimate hook.
+    :return str: The packaged results.
+    """
+    parts = []
+    used = 0
+    separator = estimate(RESULT_SEPARATOR)
+    for num, result in enumerate(web_results):
+        packaged = package_web_result(num, result, field_limits, estimate)
+        # Every result after the first is preceded by the separator.
+        if parts:
+            used += separator
+        tokens = estimate(packaged)
 
-        # Add video transcript
-        if "video" in result and "transcript" in result["video"]:
-            package += f"Video Transcript:\n{result['video']['transcript']}\n\n"
+        if token_budget is not None and used + tokens > token_budget:
+            # Keep a cut version of the result only if a useful amount of it fits.
+            packaged = truncate_to_tokens(packaged, token_budget - used, estimate)
+            if estimate(packaged) >= 32:
+                parts.append(packaged)
+            break
 
-        package += "\n\n"
+        parts.append(packaged)
+        used += tokens
 
-    return package.strip()
\ No newline at end of file
+    return RESULT_SEPARATOR.join(parts).strip()
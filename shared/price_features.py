@@ -0,0 +1,130 @@
+import math
+import numpy as np
+
+TRADING_DAYS = 252
+
+
+def series_arrays(series: dict) -> tuple:
+    """
+    Daily series of the stock API as arrays, oldest day first.
+    :param series: dict of "YYYY-MM-DD" to bar, as cached by the Stocker.
+    :return tuple: (days as datetime64[D], close prices as float64)
+    """
+    days = np.array(list(series), dtype="datetime64[D]")
+    closes = np.fromiter((float(bar["4. close"]) for bar in series.values()), dtype=np.float64, count=len(series))
+    order = np.argsort(days, kind="stable")
+    return days[order], closes[order]
+
+
+def position(days: np.ndarray, day: str) -> int:
+    """
+    Index of the last bar on or before a day, so features never look past it.
+    :return int: The index, -1 if the series starts after the day.
+    """
+    return int(np.searchsorted(days, np.datetime64(day, "D"), side="right")) - 1
+
+
+def forward_returns(closes: np.ndarray, at: int, horizons: np.ndarray) -> np.ndarray:
+    """
+    Returns from bar at to bar at + horizon, for every horizon at once.
+    :param closes: Close prices, oldest first.
+    :param at: Index of the starting bar.
+    :param horizons: Horizons in trading days.
+    :return np.ndarray: Returns, NaN where the series ends before the horizon.
+    """
+    ends = at + horizons
+    returns = np.full(len(horizons), np.nan)
+    valid = ends < len(closes)
+    returns[valid] = closes[ends[valid]] / closes[at] - 1
+    return returns
+
+
+def returns_between(days: np.ndarray, closes: np.ndarray, start: np.datetime64, ends: np.ndarray) -> np.ndarray:
+    """
+    Returns of a series between calendar days rather than bar positions, so two series with
+    different gaps (halts, listings, missing bars) are compared over the same dates.
+    :param days: Days of the series, oldest first.
+    :param closes: Close prices of the days.
+    :param start: First day, the last bar on or before it is used.
+    :param ends: Last days, the last bar on or before each is used.
+    :return np.ndarray: Returns, NaN where the series starts after the first day or ends
+    before a last day.
+    """
+    at = int(np.searchsorted(days, start, side="right")) - 1
+    returns = np.full(len(ends), np.nan)
+    if at < 0:
+        return returns
+    positions = np.searchsorted(days, ends, side="right") - 1
+    valid = ends <= days[-1]
+    returns[valid] = closes[positions[valid]] / closes[at] - 1
+    return returns
+
+
+def trailing_features(closes: np.ndarray, at: int, windows: np.ndarray) -> dict:
+    """
+    Volatility, momentum and max drawdown over windows ending at a bar, from one slice of log
+    returns shared by every window.
+    :param closes: Close prices, oldest first.
+    :param at: Index of the last bar of the windows.
+    :param windows: Window lengths in trading days.
+    :return dict: Feature name to array over windows, NaN where the series is too short.
+    """
+    longest = int(windows.max())
+    past = closes[max(0, at - longest):at + 1]
+    log_returns = np.diff(np.log(past))
+
+    volatility = np.full(len(windows), np.nan)
+    momentum = np.full(len(windows), np.nan)
+    drawdown = np.full(len(windows), np.nan)
+    for num, window in enumerate(windows):
+        if window >= len(past):
+            continue
+        prices = past[-window - 1:]
+        if window > 1:
+            volatility[num] = log_returns[-window:].std(ddof=1) * math.sqrt(TRADING_DAYS)
+        momentum[num] = prices[-1] / prices[0] - 1
+        drawdown[num] = (prices / np.maximum.accumulate(prices) - 1).min()
+    return {"volatility": volatility, "momentum": momentum, "max_drawdown": drawdown}
+
+
+def to_values(array: np.ndarray) -> list:
+    """Plain floats for JSON, None for NaN."""
+    return [None if math.isnan(value) else float(value) for value in array]
+
+
+def price_features(ticker: tuple, index: tuple, day: str, horizons: list, windows: list) -> dict:
+    """
+    Multi-horizon features of a ticker as of a day, in one pass over its series and the index's.
+    Forward returns look past the day and are meant as labels, trailing features only use bars
+    up to the day. Horizons count the ticker's bars; the index return of an excess return is
+    taken between the same two dates.
+    :param ticker: (days, closes) of the ticker, see series_arrays.
+    :param index: (days, closes) of the index.
+    :param day: As-of day, "YYYY-MM-DD".
+    :param horizons: Forward horizons in trading days.
+    :param windows: Trailing windows in trading days.
+    :return dict: {"labels": {...}, "features": {...}}, values None where the series is too short,
+    empty if a series starts after the day.
+    """
+    at, index_at = position(ticker[0], day), position(index[0], day)
+    if at < 0 or index_at < 0:
+        return {}
+    horizons = np.asarray(horizons, dtype=np.int64)
+    windows = np.asarray(windows, dtype=np.int64)
+
+    labels = {}
+    returns = forward_returns(ticker[1], at, horizons)
+    ends = np.minimum(at + horizons, len(ticker[0]) - 1)
+    excess = returns - returns_between(index[0], index[1], ticker[0][at], ticker[0][ends])
+    for horizon, value, excess_value in zip(horizons, to_values(returns), to_values(excess)):
+        labels[f"return_{horizon}d"] = value
+        labels[f"excess_return_{horizon}d"] = excess_value
+
+    features = {}
+    for name, values in trailing_features(ticker[1], at, windows).items():
+        for window, value in zip(windows, to_values(values)):
+            features[f"{name}_{window}d"] = value
+    index_features = trailing_features(index[1], index_at, windows)
+    for window, value in zip(windows, to_values(index_features["volatility"])):
+        features[f"index_volatility_{window}d"] = value
+    return {"labels": labels, "features": features}
@@ -1,4 +1,5 @@
 import asyncio
+import os
 import time
 from typing import Optional
 
@@ -22,4 +23,38 @@ class RateLimiter:
             wait_time = self.period - time_since_last_call
             if wait_time > 0:
                 await asyncio.sleep(wait_time)
-            self.last_call = current_time
\ No newline at end of file
+            # After the wait, or the next call would only be spaced from the previous one's arrival.
+            self.last_call = time.time()
+
+class SharedRateLimiter(RateLimiter):
+    def __init__(self, period: float, key: str):
+        """
+        RateLimiter shared by every process through Redis, for workers run by the supervisor.
+        Each call claims the key for period seconds (SET NX PX), so calls of all processes are
+        spaced by period. Works like RateLimiter until bind() is called.
+        :param period: Minimum wait date.
+        :param key: Redis key of the limit. Ex: "rate_limit:search"
+        """
+        super().__init__(period)
+        self.key = key
+        self.redis = None
+
+    def bind(self, redis):
+        """
+        Use a Redis connection from now on.
+        :param redis: Redis connection.
+        """
+        self.redis = redis
+
+    async def acquire(self):
+        """
+        Acquire the lock and wait until no process has called within period.
+        """
+        if self.redis is None or self.period <= 0:
+            return await super().acquire()
+
+        async with self._lock:
+            while not await self.redis.set(self.key, os.getpid(), px=max(1, int(self.period * 1000)), nx=True):
+                wait_ms = await self.redis.pttl(self.key)
+                await asyncio.sleep(max(wait_ms, 10) / 1000)
+            self.last_call = time.time()
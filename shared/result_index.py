@@ -0,0 +1,177 @@
+import asyncio
+import json
+import logging
+import os
+from datetime import date, datetime
+from redis.asyncio import Redis
+
+PREFIXES = ("search", "stock")
+
+
+def parse_result_key(key) -> tuple:
+    """
+    Split a result key. Ex: "stock:AAPL,2022-01-01,2023-01-01" -> ("stock", "AAPL", "2022-01-01")
+    :param key: Result key, str or bytes.
+    :return tuple: (prefix, ticker, first date)
+    """
+    if isinstance(key, bytes):
+        key = key.decode("utf-8")
+    prefix, task = key.split(":", 1)
+    ticker, day = task.split(",")[:2]
+    return prefix, ticker, day
+
+
+def day_score(day) -> int:
+    """Sorted set score of a date: its proleptic Gregorian ordinal."""
+    if isinstance(day, str):
+        day = datetime.strptime(day, "%Y-%m-%d")
+    return day.toordinal()
+
+
+def score_day(score: float) -> str:
+    return date.fromordinal(int(score)).strftime("%Y-%m-%d")
+
+
+def flatten_values(result: dict) -> dict:
+    """
+    Numeric values of a result: the "metrics" of a search result, the top-level numbers of a
+    stock result.
+    :param result: Result as written by a worker.
+    :return dict: Name to number.
+    """
+    values = result.get("metrics") if isinstance(result.get("metrics"), dict) else result
+    return {name: value for name, value in values.items() if isinstance(value, (int, float))}
+
+
+class ResultIndex:
+    def __init__(self, redis):
+        """
+        Index of the results workers write, per result type and ticker:
+        - "index:<prefix>:<ticker>": sorted set of result keys scored by their date (day_score),
+        - "index:<prefix>:<ticker>:values": hash of result key to JSON of its numeric values,
+        - "index:<prefix>:tickers": set of indexed tickers.
+        Finding the results of a ticker or the one nearest to a date is then a lookup instead of
+        a SCAN over the keyspace.
+        :param redis: Redis connection, with or without decode_responses.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.redis = redis
+
+    @staticmethod
+    def decode(value):
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+    async def add(self, key: str, result: dict) -> bool:
+        """
+        Index a result. Error results are left out.
+        :param key: Result key. Ex: "search:AAPL,2022-01-01"
+        :param result: The result.
+        :return bool: Whether it was indexed.
+        """
+        if not isinstance(result, dict) or "error" in result:
+            return False
+        prefix, ticker, day = parse_result_key(key)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zadd(f"index:{prefix}:{ticker}", {key: day_score(day)})
+            pipe.hset(f"index:{prefix}:{ticker}:values", key, json.dumps(flatten_values(result)))
+            pipe.sadd(f"index:{prefix}:tickers", ticker)
+            await pipe.execute()
+        return True
+
+    async def tickers(self, prefix: str) -> list:
+        """
+        :param prefix: Result type, ex: "search".
+        :return list: Sorted tickers with indexed results.
+        """
+        return sorted(self.decode(ticker) for ticker in await self.redis.smembers(f"index:{prefix}:tickers"))
+
+    async def range(self, prefix: str, ticker: str, start=None, end=None) -> list:
+        """
+        Results of a ticker within a date window.
+        :param prefix: Result type, ex: "search".
+        :param ticker: Ticker.
+        :param start: First date, "YYYY-MM-DD" or date, None for no bound.
+        :param end: Last date, None for no bound.
+        :return list: (result key, date) tuples in date order.
+        """
+        low = day_score(start) if start else "-inf"
+        high = day_score(end) if end else "+inf"
+        entries = await self.redis.zrangebyscore(f"index:{prefix}:{ticker}", low, high, withscores=True)
+        return [(self.decode(key), score_day(score)) for key, score in entries]
+
+    async def nearest(self, prefix: str, ticker: str, day, max_days: int = None):
+        """
+        Result of a ticker closest in time to a date.
+        :param prefix: Result type, ex: "search".
+        :param ticker: Ticker.
+        :param day: Date, "YYYY-MM-DD" or date.
+        :param max_days: Farthest distance in days, None for any.
+        :return tuple: (result key, date), or None if there is none within max_days.
+        """
+        score = day_score(day)
+        name = f"index:{prefix}:{ticker}"
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zrevrangebyscore(name, score, score - max_days if max_days is not None else "-inf",
+                                  start=0, num=1, withscores=True)
+            pipe.zrangebyscore(name, score, score + max_days if max_days is not None else "+inf",
+                               start=0, num=1, withscores=True)
+            before, after = await pipe.execute()
+
+        candidates = [(self.decode(key), found) for key, found in before + after]
+        if not candidates:
+            return None
+        key, found = min(candidates, key=lambda candidate: abs(candidate[1] - score))
+        return key, score_day(found)
+
+    async def values(self, prefix: str, ticker: str, start=None, end=None) -> dict:
+        """
+        Numeric values of every result of a ticker within a date window, in two round trips.
+        :return dict: Result key to its values (see flatten_values), in date order.
+        """
+        keys = [key for key, _ in await self.range(prefix, ticker, start, end)]
+        if not keys:
+            return {}
+        found = await self.redis.hmget(f"index:{prefix}:{ticker}:values", keys)
+        return {key: json.loads(value) for key, value in zip(keys, found) if value is not None}
+
+    async def results(self, prefix: str, ticker: str, start=None, end=None) -> dict:
+        """
+        Full results of a ticker within a date window.
+        :return dict: Result key to result, in date order.
+        """
+        keys = [key for key, _ in await self.range(prefix, ticker, start, end)]
+        if not keys:
+            return {}
+        found = await self.redis.mget(keys)
+        return {key: json.loads(value) for key, value in zip(keys, found) if value is not None}
+
+    async def rebuild(self) -> int:
+        """
+        Index every result already in Redis, for results written before the index existed.
+        :return int: Number of results indexed.
+        """
+        indexed = 0
+        for prefix in PREFIXES:
+            keys = [key async for key in self.redis.scan_iter(match=f"{prefix}:*")]
+            for num in range(0, len(keys), 500):
+                batch = keys[num:num + 500]
+                for key, value in zip(batch, await self.redis.mget(batch)):
+                    try:
+                        indexed += await self.add(self.decode(key), json.loads(value))
+                    except (TypeError, ValueError):
+                        self.logger.warning(f"Skipping unreadable result {self.decode(key)}")
+        self.logger.info(f"Indexed {indexed} results")
+        return indexed
+
+
+async def main():
+    redis = Redis.from_url(os.environ.get("REDIS_URL"), decode_responses=True)
+    try:
+        await ResultIndex(redis).rebuild()
+    finally:
+        await redis.aclose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
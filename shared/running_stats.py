@@ -0,0 +1,178 @@
+import math
+
+
+class RunningStat:
+    def __init__(self):
+        """
+        Running mean, variance, min and max of a stream of numbers (Welford's update).
+        Stats of separate streams can be merged.
+        """
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, value: float):
+        """
+        Add a single observation.
+        :param value: The observed value.
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "RunningStat"):
+        """
+        Add the observations of another stream (Chan et al.'s parallel update).
+        :param other: Stats of the other stream.
+        """
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self) -> float:
+        """Sample variance, 0.0 with fewer than two observations."""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    def half_width(self, z: float = 1.96) -> float:
+        """
+        Half width of the confidence interval of the mean.
+        :param z: z-score of the confidence level (1.96 for 95%).
+        :return float: half width, or inf with fewer than two observations.
+        """
+        if self.count < 2:
+            return math.inf
+        return z * self.std / math.sqrt(self.count)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self.m2,
+            "std": self.std,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RunningStat":
+        stat = cls()
+        stat.count = data["count"]
+        stat.mean = data["mean"]
+        stat.m2 = data["m2"]
+        if stat.count:
+            stat.min = data["min"]
+            stat.max = data["max"]
+        return stat
+
+
+class QuantileSketch:
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048):
+        """
+        Mergeable quantile sketch with logarithmic bins (DDSketch): a quantile is returned within
+        relative_accuracy of its true value, whatever the distribution, in bounded memory.
+        :param relative_accuracy: Relative error of the quantiles.
+        :param max_bins: Bins per sign, the bins closest to zero are collapsed beyond it.
+        """
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+
+    def index(self, value: float) -> int:
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def value(self, index: int) -> float:
+        """Value a bin stands for, within relative_accuracy of everything in it."""
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, value: float):
+        self.count += 1
+        if value > 0:
+            bins, index = self.positive, self.index(value)
+        elif value < 0:
+            bins, index = self.negative, self.index(-value)
+        else:
+            self.zeros += 1
+            return
+        bins[index] = bins.get(index, 0) + 1
+        if len(bins) > self.max_bins:
+            self.collapse(bins)
+
+    def collapse(self, bins: dict):
+        """Fold the lowest bins into one, keeping max_bins."""
+        lowest = sorted(bins)[:len(bins) - self.max_bins + 1]
+        bins[lowest[-1]] = sum(bins.pop(index) for index in lowest[:-1]) + bins[lowest[-1]]
+
+    def merge(self, other: "QuantileSketch"):
+        """
+        Add the values of another sketch of the same relative accuracy.
+        :param other: The other sketch.
+        """
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches of different relative accuracy")
+        for bins, other_bins in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in other_bins.items():
+                bins[index] = bins.get(index, 0) + count
+            if len(bins) > self.max_bins:
+                self.collapse(bins)
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def quantile(self, q: float):
+        """
+        :param q: Quantile between 0 and 1.
+        :return float: The estimate, None without values.
+        """
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                return -self.value(index)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return self.value(index)
+        return self.value(max(self.positive)) if self.positive else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "positive": {str(index): count for index, count in self.positive.items()},
+            "negative": {str(index): count for index, count in self.negative.items()},
+            "zeros": self.zeros
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QuantileSketch":
+        sketch = cls(relative_accuracy=data["relative_accuracy"])
+        sketch.positive = {int(index): count for index, count in data["positive"].items()}
+        sketch.negative = {int(index): count for index, count in data["negative"].items()}
+        sketch.zeros = data["zeros"]
+        sketch.count = sketch.zeros + sum(sketch.positive.values()) + sum(sketch.negative.values())
+        return sketch
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+
+
+def aggregate(snapshots: list) -> dict:
+    """
+    Add up metric snapshots of several processes (see Metrics.snapshot).
+    Counters, histogram counts/sums and cache hits/misses are summed, other fields are dropped.
+    :param snapshots: Snapshots to add up.
+    :return dict: field to total.
+    """
+    totals = {}
+    for snapshot in snapshots:
+        for field, value in snapshot.items():
+            if field.endswith(("_total", "_count", "_sum", "_hits", "_misses")):
+                totals[field] = totals.get(field, 0) + value
+    return totals
+
+
+async def report_stats(worker, index: int, stats: multiprocessing.Queue, period: float):
+    """Send the worker's metric snapshot to the supervisor every period seconds."""
+    while True:
+        await asyncio.sleep(period)
+        try:
+            stats.put_nowait((index, worker.metrics.snapshot()))
+        except queue.Full:
+            pass
+
+
+async def serve(factory, index: int, stats: multiprocessing.Queue, period: float):
+    """
+    Run one worker until SIGTERM or SIGINT, which let it finish its current task unless the
+    supervisor kills it first, after its grace period.
+    """
+    worker = factory()
+    reporter = asyncio.ensure_future(report_stats(worker, index, stats, period))
+    try:
+        await worker.run()
+    finally:
+        reporter.cancel()
+        try:
+            stats.put_nowait((index, worker.metrics.snapshot()))
+        except queue.Full:
+            pass
+
+
+def run_child(factory, index: int, processes: int, stats: multiprocessing.Queue, period: float):
+    """
+    Entry point of a worker process. Every process gets its own event loop and connections,
+    and its own metrics port after the first.
+    """
+    # Forked children inherit the supervisor's handlers, Worker.run() installs their own.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    os.environ["WORKER_INDEX"] = str(index)
+    os.environ["WORKER_PROCESSES"] = str(processes)
+    port = int(os.environ.get("METRICS_PORT", "0"))
+    if port:
+        os.environ["METRICS_PORT"] = str(port + index)
+    logging.basicConfig(level=logging.INFO, format=f"%(levelname)s:%(name)s[{index}]:%(message)s")
+    asyncio.run(serve(factory, index, stats, period))
+
+
+class Supervisor:
+    def __init__(self, factory, processes: int = None, grace_period: float = None,
+                 restart_delay: float = None, stats_period: float = None):
+        """
+        Run several processes of a Worker, restart the ones that crash and report their
+        combined stats. SIGTERM/SIGINT stop every process after its current task, within the
+        grace period.
+        Settings default to WORKER_PROCESSES (0 for one per core), WORKER_GRACE_PERIOD,
+        WORKER_RESTART_DELAY and WORKER_STATS_PERIOD.
+        :param factory: Picklable callable that makes the worker, ex: the Reader class.
+        :param processes: Number of worker processes.
+        :param grace_period: Seconds processes get to finish their task when stopping, then they are
+        killed. Far shorter than TASK_TIMEOUT by default: a long task is cut off and its key left unset.
+        :param restart_delay: Seconds before restarting a crashed process, doubled while it keeps crashing.
+        :param stats_period: Seconds between stat reports.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.factory = factory
+        if processes is None:
+            processes = int(os.environ.get("WORKER_PROCESSES", "0"))
+        self.processes = processes or os.cpu_count() or 1
+        self.grace_period = grace_period if grace_period is not None \
+            else float(os.environ.get("WORKER_GRACE_PERIOD", "30"))
+        self.restart_delay = restart_delay if restart_delay is not None \
+            else float(os.environ.get("WORKER_RESTART_DELAY", "1"))
+        self.stats_period = stats_period if stats_period is not None \
+            else float(os.environ.get("WORKER_STATS_PERIOD", "30"))
+
+        self.context = multiprocessing.get_context()
+        self.stats = self.context.Queue(maxsize=1000)
+        self.children = {}
+        self.started_at = {}
+        self.delays = {}
+        self.restart_at = {}
+        self.snapshots = {}
+        self.retired = {}
+        self.restarts = 0
+        self.stopping = False
+
+    def spawn(self, index: int):
+        process = self.context.Process(
+            target=run_child,
+            args=(self.factory, index, self.processes, self.stats, self.stats_period),
+            name=f"worker-{index}",
+            daemon=False
+        )
+        process.start()
+        self.children[index] = process
+        self.started_at[index] = time.monotonic()
+        self.logger.info(f"Started worker {index} (pid {process.pid})")
+
+    def request_stop(self, signum, frame):
+        if not self.stopping:
+            self.logger.info(f"Received signal {signum}, stopping {len(self.children)} workers")
+        self.stopping = True
+
+    def drain_stats(self):
+        while True:
+            try:
+                index, snapshot = self.stats.get_nowait()
+            except queue.Empty:
+                return
+            self.snapshots[index] = snapshot
+
+    def totals(self) -> dict:
+        """
+        Stats of every process, including the ones that were restarted.
+        :return dict: field to total.
+        """
+        return aggregate([self.retired, *self.snapshots.values()])
+
+    def log_stats(self):
+        totals = self.totals()
+        alive = sum(process.is_alive() for process in self.children.values())
+        count = totals.get("process_task_count", 0)
+        mean = totals.get("process_task_sum", 0.0) / count if count else 0.0
+        self.logger.info(f"{alive}/{self.processes} workers alive, {self.restarts} restarts, "
+                         f"{totals.get('tasks_total', 0)} tasks, "
+                         f"{totals.get('failed_tasks_total', 0)} failed, "
+                         f"{totals.get('timeouts_total', 0)} timed out, "
+                         f"{mean:.2f}s mean task time")
+
+    def check_children(self):
+        """Schedule restarts of exited processes, with exponential backoff while they keep crashing."""
+        now = time.monotonic()
+        for index, process in list(self.children.items()):
+            if process.is_alive() or index in self.restart_at:
+                continue
+            self.drain_stats()
+            self.retired = aggregate([self.retired, self.snapshots.pop(index, {})])
+
+            # A process that ran for a while starts over with the base delay.
+            if now - self.started_at[index] > 60:
+                self.delays[index] = self.restart_delay
+            delay = self.delays.get(index, self.restart_delay)
+            self.delays[index] = min(delay * 2, 60)
+            self.restart_at[index] = now + delay
+            self.logger.warning(f"Worker {index} exited with code {process.exitcode}, restarting in {delay:.0f}s")
+
+        for index, at in list(self.restart_at.items()):
+            if now >= at:
+                del self.restart_at[index]
+                self.restarts += 1
+                self.spawn(index)
+
+    def shutdown(self):
+        """Ask every process to finish, kill the ones still running after the grace period."""
+        for process in self.children.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + self.grace_period
+        for process in self.children.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+        for index, process in self.children.items():
+            if process.is_alive():
+                self.logger.warning(f"Worker {index} did not stop in {self.grace_period}s, killing it")
+                process.kill()
+                process.join()
+
+    def run(self):
+        """
+        Start the processes and supervise them until SIGTERM or SIGINT.
+        :return dict: Final stats of every process.
+        """
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        self.logger.info(f"Starting {self.processes} worker processes")
+        for index in range(self.processes):
+            self.spawn(index)
+
+        last_report = time.monotonic()
+        try:
+            while not self.stopping:
+                time.sleep(0.5)
+                self.drain_stats()
+                self.check_children()
+                if time.monotonic() - last_report >= self.stats_period:
+                    self.log_stats()
+                    last_report = time.monotonic()
+        finally:
+            self.shutdown()
+            self.drain_stats()
+            self.log_stats()
+        return self.totals()
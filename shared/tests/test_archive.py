@@ -0,0 +1,42 @@
+import sqlite3
+import zlib
+import pytest
+from shared.archive import ResponseArchive
+
+
+@pytest.mark.asyncio
+async def test_record_then_replay_newest(tmp_path):
+    path = str(tmp_path / "search.sqlite")
+    key = ResponseArchive.make_key("https://api.example.com/res/v1/web/search", {"q": "AAPL", "apikey": "secret"})
+    assert "secret" not in key
+
+    recorder = ResponseArchive(path, "record")
+    await recorder.put(key, b"first")
+    await recorder.put(key, b"second")
+    recorder.close()
+    # Appended, not replaced.
+    with sqlite3.connect(path) as db:
+        assert db.execute("SELECT COUNT(*) FROM entries WHERE key = ?", (key,)).fetchone()[0] == 2
+
+    replayer = ResponseArchive(path, "replay")
+    assert await replayer.get(key) == b"second"
+    assert await replayer.get("/other?q=MSFT") is None
+    # Replaying never records.
+    await replayer.put(key, b"third")
+    assert await replayer.get(key) == b"second"
+    replayer.close()
+
+
+@pytest.mark.asyncio
+async def test_older_archive_migrated(tmp_path):
+    path = str(tmp_path / "stock.sqlite")
+    with sqlite3.connect(path) as db:
+        db.execute("CREATE TABLE responses ("
+                   "key TEXT PRIMARY KEY, recorded_at REAL NOT NULL, size INTEGER NOT NULL, body BLOB NOT NULL)")
+        db.execute("INSERT INTO responses VALUES (?, ?, ?, ?)", ("/query?symbol=AAPL", 1.0, 3, zlib.compress(b"old")))
+
+    archive = ResponseArchive(path, "record")
+    assert await archive.get("/query?symbol=AAPL") == b"old"
+    await archive.put("/query?symbol=AAPL", b"new")
+    assert await archive.get("/query?symbol=AAPL") == b"new"
+    archive.close()
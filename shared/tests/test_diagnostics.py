@@ -0,0 +1,31 @@
+import asyncio
+import logging
+import time
+import pytest
+from shared.diagnostics import LoopMonitor
+from shared.metrics import Metrics
+
+
+def block_the_loop(seconds: float):
+    time.sleep(seconds)
+
+
+@pytest.mark.asyncio
+async def test_blocking_call_trips_lag_and_watchdog(caplog):
+    metrics = Metrics("test")
+    monitor = LoopMonitor(metrics, period=0.02, slow_threshold=0.05)
+    task = asyncio.ensure_future(monitor.run())
+    try:
+        await asyncio.sleep(0.1)
+        with caplog.at_level(logging.WARNING, logger="LoopMonitor"):
+            block_the_loop(0.3)
+            await asyncio.sleep(0.1)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    lag = metrics.histograms["loop_lag"]
+    assert lag.quantile(1.0) >= 0.25
+    assert metrics.counters["slow_callbacks"] == 1
+    # The watchdog names the blocking code.
+    assert "block_the_loop" in caplog.text
@@ -0,0 +1,68 @@
+import time
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from shared.http_client import Upstream, parse_retry_after
+
+
+@pytest_asyncio.fixture
+async def server():
+    """Local upstream that rate limits the first request of every path."""
+    calls = {}
+
+    async def handle(request):
+        calls[request.path] = calls.get(request.path, 0) + 1
+        if calls[request.path] == 1:
+            return web.Response(status=429, headers={"Retry-After": "0.3"})
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_get("/{name}", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}", calls
+    await runner.cleanup()
+
+
+@pytest_asyncio.fixture
+async def upstream():
+    upstream = Upstream("test", limit=2, retries=2, backoff=0.01)
+    upstream.open()
+    yield upstream
+    await upstream.close()
+
+
+@pytest.mark.asyncio
+async def test_429_retried_through_rate_limit(server, upstream):
+    url, calls = server
+    acquired = []
+
+    async def acquire():
+        acquired.append(time.monotonic())
+
+    async with upstream.get(f"{url}/limited", acquire=acquire) as resp:
+        assert resp.status == 200
+        assert upstream.in_flight == 1
+    assert len(acquired) == 2
+    assert acquired[1] - acquired[0] >= 0.3
+    assert upstream.in_flight == 0
+    assert upstream.stats()["peak_in_flight"] == 1
+
+
+@pytest.mark.asyncio
+async def test_429_not_retried_without_rate_limit(server, upstream):
+    url, calls = server
+    async with upstream.get(f"{url}/plain") as resp:
+        assert resp.status == 429
+    assert calls["/plain"] == 1
+    assert upstream.in_flight == 0
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("2") == 2.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
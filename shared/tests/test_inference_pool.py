@@ -0,0 +1,39 @@
+from shared.inference_pool import InferencePool
+
+
+def make_pool(urls: list) -> InferencePool:
+    pool = InferencePool(urls, max_failures=2, eject_period=30)
+    for backend in pool.backends:
+        backend.healthy = True
+    return pool
+
+
+def test_last_backend_is_never_ejected():
+    pool = make_pool(["http://a"])
+    backend = pool.backends[0]
+    for _ in range(5):
+        pool.report_failure(backend)
+    assert backend.available
+    assert pool.pick() is backend
+
+
+def test_eject_while_others_are_available():
+    pool = make_pool(["http://a", "http://b"])
+    a, b = pool.backends
+    pool.report_failure(a)
+    pool.report_failure(a)
+    assert not a.available
+    assert pool.pick() is b
+    # b is the last one left, it stays in.
+    pool.report_failure(b)
+    pool.report_failure(b)
+    assert b.available
+
+
+def test_fallback_to_least_failed():
+    pool = make_pool(["http://a", "http://b"])
+    a, b = pool.backends
+    a.healthy = b.healthy = False
+    a.failures, b.failures = 4, 1
+    assert not pool.available
+    assert pool.pick() is b
@@ -0,0 +1,64 @@
+import pytest
+from bench.memory_redis import MemoryStore, MemoryRedis
+from shared.metrics import Histogram, Metrics
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram(buckets=(1.0, 2.0, 4.0))
+    for value in (0.5, 1.0, 1.5, 1.5, 3.0, 10.0):
+        histogram.observe(value)
+
+    # Upper bounds are inclusive, the last count is the overflow bucket.
+    assert histogram.counts == [2, 2, 1, 1]
+    assert histogram.count == 6 and histogram.sum == pytest.approx(17.5)
+    # Rank 3 of 6 is the first of the (1, 2] bucket's two values, half way through it.
+    assert histogram.quantile(0.5) == pytest.approx(1.5)
+    assert histogram.quantile(0.25) == pytest.approx(0.75)
+    # The overflow bucket is reported at the last bound.
+    assert histogram.quantile(1.0) == 4.0
+    assert Histogram().quantile(0.5) == 0.0
+
+
+def test_render_exposition_format():
+    metrics = Metrics("search")
+    metrics.histograms["llm"] = Histogram(buckets=(0.1, 1.0))
+    metrics.observe("llm", 0.05)
+    metrics.observe("llm", 0.5)
+    metrics.observe("llm", 5.0)
+    metrics.increment("tasks", 2)
+    metrics.set_gauge("queue_depth", 7)
+    metrics.record_cache("stock_data", True)
+    metrics.record_cache("stock_data", False)
+
+    lines = metrics.render().splitlines()
+    assert lines == [
+        "# TYPE trademon_stage_seconds histogram",
+        'trademon_stage_seconds_bucket{service="search",stage="llm",le="0.1"} 1',
+        'trademon_stage_seconds_bucket{service="search",stage="llm",le="1.0"} 2',
+        'trademon_stage_seconds_bucket{service="search",stage="llm",le="+Inf"} 3',
+        'trademon_stage_seconds_sum{service="search",stage="llm"} 5.55',
+        'trademon_stage_seconds_count{service="search",stage="llm"} 3',
+        "# TYPE trademon_tasks_total counter",
+        'trademon_tasks_total{service="search"} 2',
+        "# TYPE trademon_queue_depth gauge",
+        'trademon_queue_depth{service="search"} 7',
+        "# TYPE trademon_cache_hit_ratio gauge",
+        'trademon_cache_hit_ratio{service="search",cache="stock_data"} 0.5',
+    ]
+
+
+@pytest.mark.asyncio
+async def test_flush_snapshot_to_redis():
+    redis = MemoryRedis(MemoryStore())
+    metrics = Metrics("stock")
+    metrics.observe("fetch_stock", 0.2)
+    metrics.increment("tasks")
+    metrics.record_cache("stock_data", True)
+    await metrics.flush(redis)
+
+    fields = await redis.hgetall(f"metrics:stock:{metrics.instance}")
+    assert float(fields["fetch_stock_count"]) == 1
+    assert float(fields["fetch_stock_sum"]) == pytest.approx(0.2)
+    assert float(fields["tasks_total"]) == 1
+    assert float(fields["stock_data_hits"]) == 1
+    assert "updated_at" in fields
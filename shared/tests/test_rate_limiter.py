@@ -0,0 +1,57 @@
+import asyncio
+import time
+import pytest
+from shared.rate_limiter import RateLimiter, SharedRateLimiter
+
+
+class ExpiringRedis:
+    """The SET NX PX and PTTL of Redis, enough for SharedRateLimiter."""
+    def __init__(self):
+        self.expiry = {}
+
+    async def set(self, name, value, px=None, nx=False):
+        now = time.monotonic()
+        if nx and self.expiry.get(name, 0) > now:
+            return None
+        self.expiry[name] = now + px / 1000
+        return True
+
+    async def pttl(self, name) -> int:
+        left = self.expiry.get(name, 0) - time.monotonic()
+        return int(left * 1000) if left > 0 else -2
+
+
+def assert_spaced(times: list, period: float):
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    assert min(gaps) >= period * 0.9, gaps
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_spacing():
+    limiter = RateLimiter(0.05)
+    times = []
+
+    async def call():
+        await limiter.acquire()
+        times.append(time.monotonic())
+
+    await asyncio.gather(*(call() for _ in range(4)))
+    assert_spaced(times, 0.05)
+
+
+@pytest.mark.asyncio
+async def test_shared_rate_limiter_spaces_processes():
+    # Two limiters on one Redis, as in two worker processes.
+    redis = ExpiringRedis()
+    limiters = [SharedRateLimiter(0.05, key="rate_limit:test") for _ in range(2)]
+    for limiter in limiters:
+        limiter.bind(redis)
+    times = []
+
+    async def call(limiter):
+        await limiter.acquire()
+        times.append(time.monotonic())
+
+    await asyncio.gather(*(call(limiters[num % 2]) for num in range(6)))
+    assert len(times) == 6
+    assert_spaced(sorted(times), 0.05)
@@ -0,0 +1,37 @@
+import pytest
+from bench.memory_redis import MemoryStore, MemoryRedis
+from shared.result_index import ResultIndex
+
+
+@pytest.fixture
+def index():
+    return ResultIndex(MemoryRedis(MemoryStore()))
+
+
+@pytest.mark.asyncio
+async def test_range_and_values(index):
+    for day, score in [("2022-03-01", 10), ("2022-01-01", 20), ("2022-06-01", 30)]:
+        await index.add(f"search:AAPL,{day}", {"ticker": "AAPL", "date": day, "metrics": {"esg_risk": score}})
+    await index.add("search:AAPL,2022-02-01", {"error": "timeout"})
+    await index.add("stock:MSFT,2022-01-01,2023-01-01", {"outperformed": True, "ticker_performance": 3.5})
+
+    assert await index.tickers("search") == ["AAPL"]
+    assert [day for _, day in await index.range("search", "AAPL")] == ["2022-01-01", "2022-03-01", "2022-06-01"]
+    assert await index.values("search", "AAPL", "2022-02-01", "2022-12-31") == {
+        "search:AAPL,2022-03-01": {"esg_risk": 10},
+        "search:AAPL,2022-06-01": {"esg_risk": 30}
+    }
+    assert await index.values("stock", "MSFT") == {
+        "stock:MSFT,2022-01-01,2023-01-01": {"outperformed": True, "ticker_performance": 3.5}
+    }
+
+
+@pytest.mark.asyncio
+async def test_nearest(index):
+    for day in ("2022-01-01", "2022-01-20"):
+        await index.add(f"search:AAPL,{day}", {"metrics": {}})
+
+    assert await index.nearest("search", "AAPL", "2022-01-08") == ("search:AAPL,2022-01-01", "2022-01-01")
+    assert await index.nearest("search", "AAPL", "2022-01-15") == ("search:AAPL,2022-01-20", "2022-01-20")
+    assert await index.nearest("search", "AAPL", "2022-03-01", max_days=30) is None
+    assert await index.nearest("search", "MSFT", "2022-01-01") is None
@@ -0,0 +1,27 @@
+import math
+import numpy as np
+import pytest
+from shared.running_stats import RunningStat
+
+
+def test_welford_matches_two_pass():
+    values = np.random.default_rng(1).normal(40, 15, size=500)
+    stat = RunningStat()
+    for value in values:
+        stat.update(value)
+    assert stat.count == 500
+    assert stat.mean == pytest.approx(values.mean())
+    assert stat.variance == pytest.approx(values.var(ddof=1))
+    assert (stat.min, stat.max) == (values.min(), values.max())
+
+
+def test_half_width():
+    stat = RunningStat()
+    assert stat.half_width() == math.inf
+    stat.update(10)
+    assert stat.half_width() == math.inf
+    for value in (20, 30, 40):
+        stat.update(value)
+    # std of 10..40 is sqrt(500/3), n = 4.
+    assert stat.half_width(1.96) == pytest.approx(1.96 * math.sqrt(500 / 3) / 2)
+    assert stat.variance == pytest.approx(500 / 3)
@@ -0,0 +1,59 @@
+import time
+import pytest
+from shared.supervisor import Supervisor, aggregate
+
+
+class Exited:
+    """A worker process that crashed."""
+    pid = 0
+    exitcode = 1
+
+    def is_alive(self) -> bool:
+        return False
+
+
+@pytest.fixture
+def supervisor():
+    supervisor = Supervisor(factory=None, processes=1, grace_period=0, restart_delay=1, stats_period=1)
+    supervisor.spawned = []
+
+    def spawn(index):
+        supervisor.spawned.append(index)
+        supervisor.children[index] = Exited()
+        supervisor.started_at[index] = time.monotonic()
+    supervisor.spawn = spawn
+    spawn(0)
+    return supervisor
+
+
+def restart(supervisor) -> float:
+    """Let the supervisor see the exit, return the delay it scheduled and restart at once."""
+    now = time.monotonic()
+    supervisor.check_children()
+    delay = supervisor.restart_at[0] - now
+    supervisor.restart_at[0] = 0
+    supervisor.check_children()
+    return delay
+
+
+def test_restart_backoff(supervisor):
+    delays = [restart(supervisor) for _ in range(3)]
+    assert delays == pytest.approx([1, 2, 4], abs=0.1)
+    assert supervisor.restarts == 3
+    assert supervisor.spawned == [0] * 4
+
+    # A process that ran for a while starts over with the base delay.
+    supervisor.started_at[0] -= 61
+    assert restart(supervisor) == pytest.approx(1, abs=0.1)
+    # Delays are capped at a minute.
+    supervisor.delays[0] = 50
+    restart(supervisor)
+    assert supervisor.delays[0] == 60
+
+
+def test_restarted_stats_kept(supervisor):
+    supervisor.snapshots[0] = {"tasks_total": 3, "process_task_count": 3, "queue_depth": 7}
+    restart(supervisor)
+    supervisor.snapshots[0] = {"tasks_total": 2}
+    assert supervisor.totals()["tasks_total"] == 5
+    assert "queue_depth" not in aggregate([{"queue_depth": 1}])
@@ -0,0 +1,83 @@
+import asyncio
+import json
+import pytest
+from bench.memory_redis import MemoryStore, MemoryRedis
+from shared.worker import Worker
+
+
+class SlowWorker(Worker):
+    def __init__(self, store: MemoryStore):
+        super().__init__(input_queue="queries", data_type="test")
+        self.store = store
+        self.started = asyncio.Event()
+
+    async def init_redis(self) -> bool:
+        self.redis = MemoryRedis(self.store)
+        return True
+
+    async def process_task(self, task: str) -> dict:
+        self.started.set()
+        await asyncio.sleep(0.2)
+        return {"task": task}
+
+
+@pytest.mark.asyncio
+async def test_stop_finishes_current_task(monkeypatch):
+    monkeypatch.setenv("LOOP_LAG_PERIOD", "0")
+    store = MemoryStore()
+    worker = SlowWorker(store)
+    redis = MemoryRedis(store)
+    await redis.lpush("queries", "test:MSFT,2022-01-01")
+    await redis.lpush("queries", "test:AAPL,2022-01-01")
+    running = asyncio.create_task(worker.run_worker())
+
+    await worker.started.wait()
+    worker.request_stop()
+    await asyncio.wait_for(running, 5)
+
+    # The task in progress is stored, the queued one is left for another worker.
+    assert json.loads(await redis.get("test:AAPL,2022-01-01")) == {"task": "AAPL,2022-01-01"}
+    assert await redis.llen("queries") == 1
+
+
+@pytest.mark.asyncio
+async def test_stop_while_idle(monkeypatch):
+    monkeypatch.setenv("LOOP_LAG_PERIOD", "0")
+    worker = SlowWorker(MemoryStore())
+    running = asyncio.create_task(worker.run_worker())
+    await asyncio.sleep(0.05)
+    worker.request_stop()
+    await asyncio.wait_for(running, 5)
+
+
+class BrokenIndex:
+    async def add(self, key, result):
+        raise ConnectionError("index unavailable")
+
+
+class BrokenIndexWorker(SlowWorker):
+    async def open_connection(self):
+        connected = await super().open_connection()
+        self.index = BrokenIndex()
+        return connected
+
+
+@pytest.mark.asyncio
+async def test_index_error_does_not_fail_task(monkeypatch):
+    monkeypatch.setenv("LOOP_LAG_PERIOD", "0")
+    store = MemoryStore()
+    worker = BrokenIndexWorker(store)
+    redis = MemoryRedis(store)
+    await redis.lpush("queries", "test:AAPL,2022-01-01")
+    running = asyncio.create_task(worker.run_worker())
+
+    await worker.started.wait()
+    worker.request_stop()
+    await asyncio.wait_for(running, 5)
+
+    assert json.loads(await redis.get("test:AAPL,2022-01-01")) == {"task": "AAPL,2022-01-01"}
+    assert worker.metrics.counters["tasks"] == 1
+    assert worker.metrics.counters["record_errors"] == 1
+    assert "failed_tasks" not in worker.metrics.counters
+    # Waiters are told the queue is served.
+    assert await redis.get("queries:taken_at")
@@ -1,10 +1,17 @@
 import json
-import aiohttp
 import os
 import logging
 import asyncio
+import signal
+import time
 from shared.payloads import *
-from shared.rate_limiter import RateLimiter
+from shared.rate_limiter import RateLimiter, SharedRateLimiter
+from shared.metrics import Metrics
+from shared.archive import ResponseArchive
+from shared.http_client import HttpClient
+from shared.diagnostics import LoopMonitor, TaskProfiler
+from shared.result_index import ResultIndex
+from shared.deadline import TIMEOUT_ERROR, current_deadline, expired, parse_entry, task_timeout, taken_key
 from redis.asyncio import Redis
 
 
@@ -14,8 +21,40 @@ class Worker:
         self.redis_url = os.environ.get("REDIS_URL")
         self.input_queue = input_queue
         self.data_type = data_type
-        self.session = None
         self.redis = None
+        self.metrics = Metrics(data_type)
+        # Child classes add their upstreams, each gets its own connection pool.
+        self.http = HttpClient(self.metrics)
+        self.loop_monitor = LoopMonitor(
+            self.metrics,
+            period=float(os.environ.get("LOOP_LAG_PERIOD", "0.5")),
+            slow_threshold=float(os.environ.get("LOOP_SLOW_THRESHOLD", "0.25")),
+            debug=os.environ.get("LOOP_DEBUG", "false").lower() == "true"
+        )
+        # Off unless PROFILE_SAMPLE_RATE is set, ex: 0.05 profiles one task in 20.
+        self.profiler = TaskProfiler(
+            data_type,
+            sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", "0")),
+            directory=os.environ.get("PROFILE_DIR", "profiles")
+        )
+        self.index_results = os.environ.get("RESULT_INDEX", "true").lower() == "true"
+        self.index = None
+        self.archive = ResponseArchive(
+            path=os.path.join(os.environ.get("ARCHIVE_DIR", "archive"), f"{data_type}.sqlite"),
+            mode=os.environ.get("ARCHIVE_MODE", "off")
+        )
+        # Longest a task may run, whatever the timeout of its entry. 0 for no limit.
+        self.task_timeout = task_timeout(data_type)
+        # Seconds a timeout result is kept, long enough for waiters to read it.
+        self.timeout_result_ttl = int(os.environ.get("TIMEOUT_RESULT_TTL", "60"))
+        # Set by the supervisor when it runs several processes of this worker.
+        self.processes = int(os.environ.get("WORKER_PROCESSES", "1"))
+        self.worker_index = int(os.environ.get("WORKER_INDEX", "0"))
+        self.rate_limiters = []
+        # Set on SIGTERM/SIGINT: no new task is taken, the current one runs on until it ends or the
+        # process is killed (the supervisor's WORKER_GRACE_PERIOD, Docker's stop_grace_period).
+        self.stop_requested = False
+        self.waiting = None
 
     async def init_redis(self) -> bool:
         try:
@@ -27,19 +66,23 @@ class Worker:
             return False
 
     async def open_connection(self):
-        """Initialize aiohttp session and Redis connection"""
-        if self.session is None:
-            self.session = aiohttp.ClientSession()
-        return await self.init_redis()
+        """Initialize HTTP connection pools and Redis connection"""
+        self.http.open()
+        connected = await self.init_redis()
+        if connected:
+            self.index = ResultIndex(self.redis)
+            for limiter in self.rate_limiters:
+                if isinstance(limiter, SharedRateLimiter):
+                    limiter.bind(self.redis)
+        return connected
 
     async def close_connection(self):
         """Close connections"""
-        if self.session:
-            await self.session.close()
-            self.session = None
+        await self.http.close()
         if self.redis:
             await self.redis.aclose()
             self.redis = None
+        self.archive.close()
 
     async def __aenter__(self):
         await self.open_connection()
@@ -48,36 +91,170 @@ class Worker:
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self.close_connection()
 
+    def make_rate_limiter(self, name: str, period: float) -> RateLimiter:
+        """
+        Rate limiter of an upstream API. Shared through Redis when several processes of this
+        worker run, so they respect the limit together.
+        :param name: Name of the API. Ex: "search"
+        :param period: Minimum seconds between calls.
+        :return RateLimiter: The limiter.
+        """
+        if self.processes > 1:
+            limiter = SharedRateLimiter(period, key=f"rate_limit:{name}")
+        else:
+            limiter = RateLimiter(period)
+        self.rate_limiters.append(limiter)
+        return limiter
+
+    def rate_limited(self, limiter: RateLimiter):
+        """
+        Acquire callback of upstream requests (see Upstream.request), so every attempt, retries
+        included, waits for the rate limit. Waits are timed as "rate_limit_wait".
+        :param limiter: The rate limit of the upstream.
+        """
+        async def acquire():
+            with self.metrics.timer("rate_limit_wait"):
+                await limiter.acquire()
+        return acquire
+
     async def process_task(self, task_data: dict) -> dict:
         """To be implemented by child classes (template method)"""
         raise NotImplementedError("Child classes must implement process_task()")
 
+    def background_jobs(self) -> list:
+        """Coroutines to run next to the task loop while the worker runs, for child classes."""
+        return []
+
+    def task_budget(self, timeout: float = None):
+        """
+        Seconds a task may run from now, when a worker takes it: its timeout, at most TASK_TIMEOUT.
+        :param timeout: Timeout from the queue entry, None for none.
+        :return float: The budget, None for no limit.
+        """
+        budget = self.task_timeout if self.task_timeout > 0 else None
+        if timeout is not None:
+            budget = timeout if budget is None else min(timeout, budget)
+        return budget
+
+    async def run_task(self, task: str, budget: float = None) -> dict:
+        """
+        Process a task within its budget. HTTP calls made for it are bounded by the same deadline
+        (see shared.deadline).
+        :raises asyncio.TimeoutError: The budget ran out. The task is cancelled, or its result is
+        dropped if it was cut short by its timed out calls instead.
+        """
+        token = current_deadline.set(None if budget is None else time.time() + budget)
+        try:
+            result = await asyncio.wait_for(self.process_task(task), budget)
+            if expired():
+                raise asyncio.TimeoutError("Task finished past its deadline")
+            return result
+        finally:
+            current_deadline.reset(token)
+
+    async def record_task(self, task_key: str, result: dict):
+        """
+        Index a stored result and update the stats. Errors are logged and counted as
+        "record_errors", the task succeeded already.
+        :param task_key: Key of the task. Ex: "search:AAPL,2022-01-01"
+        :param result: Its result.
+        """
+        try:
+            if self.index_results:
+                with self.metrics.timer("index"):
+                    await self.index.add(task_key, result)
+            self.http.stats()
+            self.metrics.set_gauge("queue_depth", await self.redis.llen(self.input_queue))
+        except Exception as e:
+            self.logger.error(f"Recording task {task_key} failed: {str(e)}")
+            self.metrics.increment("record_errors")
+
+    def request_stop(self):
+        """Stop after the current task. Only a BLPOP waiting for the next task is cancelled."""
+        if not self.stop_requested:
+            self.logger.info("Stop requested, finishing the current task")
+        self.stop_requested = True
+        if self.waiting is not None:
+            self.waiting.cancel()
+
+    async def run(self):
+        """
+        Run the worker until SIGTERM or SIGINT, which stop it after its current task. Nothing here
+        bounds that task but its budget, whoever sent the signal kills the process if it runs too long.
+        """
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self.request_stop)
+        try:
+            await self.run_worker()
+        finally:
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                loop.remove_signal_handler(signum)
+
     async def run_worker(self):
         """
         Main worker loop for processing tasks from Redis.
         The result is in Redis under the same key as the task. Ex: "search:AAPL,2022-01-01"
         """
         await self.open_connection()
+        await self.metrics.start(self.redis)
+        jobs = [asyncio.create_task(job) for job in [self.loop_monitor.run(), *self.background_jobs()]]
         self.logger.info(f"{self.__class__.__name__} STARTED. Listening on {self.input_queue}")
 
         try:
-            while True:
-                _, task_key = await self.redis.blpop([self.input_queue], timeout=0)
-                if task_key:
+            while not self.stop_requested:
+                self.waiting = asyncio.ensure_future(self.redis.blpop([self.input_queue], timeout=0))
+                try:
+                    _, entry = await self.waiting
+                except asyncio.CancelledError:
+                    if self.stop_requested:
+                        break
+                    raise
+                finally:
+                    self.waiting = None
+                if entry:
                     try:
+                        # Tells waiters the queue is served, see Feeder.wait_for_key.
+                        await self.redis.set(taken_key(self.input_queue), time.time())
+                        task_key, timeout = parse_entry(entry)
                         prefix, task = task_key.split(":", 1)
-                        result = await self.process_task(task)
-                        await self.redis.set(
-                            task_key,
-                            json.dumps(result),
-                        )
+                        # The deadline starts now, queued tasks wait as long as it takes.
+                        budget = self.task_budget(timeout)
+
+                        try:
+                            with self.metrics.timer("process_task"), self.profiler.profile():
+                                result = await self.run_task(task, budget)
+                        except asyncio.TimeoutError:
+                            self.logger.warning(f"Task {task_key} timed out")
+                            self.metrics.increment("timeouts")
+                            await self.redis.set(task_key, json.dumps({"error": TIMEOUT_ERROR}),
+                                                 ex=self.timeout_result_ttl)
+                            continue
 
+                        with self.metrics.timer("redis_set"):
+                            await self.redis.set(
+                                task_key,
+                                json.dumps(result),
+                            )
                     except json.JSONDecodeError:
-                        self.logger.error(f"Invalid JSON task: {task_key}")
+                        self.logger.error(f"Invalid JSON task: {entry}")
+                        self.metrics.increment("failed_tasks")
+                        continue
                     except Exception as e:
                         self.logger.error(f"Task processing failed: {str(e)}")
+                        self.metrics.increment("failed_tasks")
+                        continue
+
+                    # The result is stored, what follows cannot fail the task.
+                    self.metrics.increment("tasks")
+                    await self.record_task(task_key, result)
         except asyncio.CancelledError:
             self.logger.info("Worker shutdown requested")
         finally:
+            for job in jobs:
+                job.cancel()
+            await asyncio.gather(*jobs, return_exceptions=True)
+            self.profiler.close()
+            await self.metrics.stop()
             await self.close_connection()
             self.logger.info("Worker shutdown complete")
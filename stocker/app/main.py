@@ -1,6 +1,12 @@
 from app.stocker import Stocker
+from shared.supervisor import Supervisor
 import asyncio
+import os
 
 if __name__ == "__main__":
-    stocker = Stocker()
-    asyncio.run(stocker.run_worker())
\ No newline at end of file
+    # WORKER_PROCESSES > 1 (or 0 for one per core) runs several processes under a supervisor.
+    if int(os.environ.get("WORKER_PROCESSES", "1")) == 1:
+        stocker = Stocker()
+        asyncio.run(stocker.run())
+    else:
+        Supervisor(Stocker).run()
@@ -2,9 +2,14 @@ import json
 import logging
 import asyncio
 import os
+import time
+from redis.exceptions import WatchError
 from shared.worker import Worker
-from shared.rate_limiter import RateLimiter
-from datetime import datetime, timedelta
+from shared.price_features import series_arrays, price_features
+from datetime import date, datetime, timedelta
+
+# A compact response holds the latest 100 trading days, about 140 calendar days.
+COMPACT_DAYS = 140
 
 
 def find_nearest_valid_date(dataset: dict, target_date: str) -> str:
@@ -28,54 +33,280 @@ def find_nearest_valid_date(dataset: dict, target_date: str) -> str:
         return ""
 
 
+def last_trading_day(today: date) -> str:
+    """
+    Latest weekday before today, the newest bar a daily series can be expected to hold.
+    :param today: Current date.
+    :return str: The date as YYYY-MM-DD.
+    """
+    day = today - timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day.strftime("%Y-%m-%d")
+
+
 class Stocker(Worker):
     def __init__(self):
         super().__init__(
             input_queue=os.environ.get("STOCK_QUERIES_NAME"),
             data_type="stock"
         )
-        self.base_url = "https://www.alphavantage.co/query"
+        self.base_url = os.environ.get("STOCK_API_URL", "https://www.alphavantage.co/query")
         self.stock_api_key = os.environ["STOCK_API_KEY"]
 
-        self.rate_limiter = RateLimiter(period=float(os.environ.get("STOCK_API_PERIOD", "15.0")))
+        self.rate_limiter = self.make_rate_limiter("stock", float(os.environ.get("STOCK_API_PERIOD", "15.0")))
+        # Requests are spaced by the rate limit, so a couple of connections are enough.
+        self.stock_http = self.http.add("stock", limit=int(os.environ.get("STOCK_API_CONNECTIONS", "2")),
+                                        timeout=float(os.environ.get("STOCK_API_TIMEOUT", "10")),
+                                        retries=int(os.environ.get("STOCK_API_HTTP_RETRIES", "1")))
+        self.index_ticker = "SPY"
+        self.inflight = {}
+
+        # Prefetch walks the ticker universe into the cache ahead of demand.
+        self.prefetch = os.environ.get("STOCK_PREFETCH", "false").lower() == "true"
+        self.tickers_path = os.environ.get("TICKERS_PATH")
+        self.prefetch_idle = float(os.environ.get("STOCK_PREFETCH_IDLE", "600"))
+        # Seconds between checks for queued tasks while prefetch is paused for them.
+        self.prefetch_pause = float(os.environ.get("STOCK_PREFETCH_PAUSE", "1"))
+        self.active_tasks = 0
+
+        # Seconds between refresh checks of a cached series that is behind, 0 never refreshes.
+        self.refresh_period = float(os.environ.get("STOCK_REFRESH_PERIOD", "43200"))
+
+        # Price features of every task, computed from the series already loaded for it.
+        self.features = os.environ.get("STOCK_FEATURES", "true").lower() == "true"
+        self.feature_horizons = [int(days) for days in
+                                 os.environ.get("STOCK_FEATURE_HORIZONS", "5,21,63,126,252").split(",")]
+        self.feature_windows = [int(days) for days in os.environ.get("STOCK_FEATURE_WINDOWS", "21,63,252").split(",")]
+        self.arrays = {}
 
-    async def fetch_stock_data(self, ticker: str) -> dict:
+    async def fetch_stock_data(self, ticker: str, until: str = None) -> dict:
         """
-        Fetch stock data with simplified caching - no TTL, no read warnings
+        Fetch stock data, concurrent fetches of the same ticker share one request. Fetches that
+        may refresh the series and fetches served from the cache are shared separately, so a task
+        covered by the cache never waits on a refresh, and one needing newer bars never gets the
+        cached series without them.
         :param ticker: Stock ticker symbol
+        :param until: Last day the caller needs, see load_stock_data.
         :return dict: Stock data or empty dict on failure
         """
-        cache_key = f"stock_data:{ticker}"
-
-        cached = await self.redis.get(cache_key)
-        if cached and "Time Series (Daily)" in cached:
-            return json.loads(cached)
+        last_day = (await self.redis.hmget(f"stock_meta:{ticker}", ["last_day"]))[0] or ""
+        key = (ticker, until is None or until > last_day)
+        if key not in self.inflight:
+            self.inflight[key] = asyncio.ensure_future(self.load_stock_data(ticker, until))
+            self.inflight[key].add_done_callback(lambda _: self.inflight.pop(key, None))
+        # Shielded so a cancelled waiter does not cancel the fetch for the others.
+        return await asyncio.shield(self.inflight[key])
 
+    async def request_series(self, ticker: str, outputsize: str = "full") -> dict:
+        """
+        Request the daily series from the API, or from the archive when replaying.
+        :param ticker: Stock ticker symbol
+        :param outputsize: "full" for the whole history, "compact" for the latest 100 days.
+        :return dict: Time series, None on failure, including the API's rate limit ("Note",
+        "Information") and error bodies, so a failure is never taken for a series without new bars.
+        """
         try:
-            await self.rate_limiter.acquire()
             params = {
                 "function": "TIME_SERIES_DAILY",
                 "symbol": ticker,
                 "apikey": self.stock_api_key,
-                "outputsize": "full"
+                "outputsize": outputsize
             }
+            archive_key = self.archive.make_key(self.base_url, params)
 
-            async with self.session.get(self.base_url, params=params, timeout=10) as response:
-                if response.status != 200:
-                    return {}
-                data = await response.json()
+            if self.archive.replaying:
+                body = await self.archive.get(archive_key)
+                if body is None:
+                    self.logger.warning(f"No archived stock data for {ticker}")
+                    return None
+            else:
+                with self.metrics.timer("fetch_stock"):
+                    async with self.stock_http.get(self.base_url, params=params,
+                                                   acquire=self.rate_limited(self.rate_limiter)) as response:
+                        if response.status != 200:
+                            self.logger.warning(f"Stock API returned {response.status} for {ticker}")
+                            return None
+                        body = await response.read()
 
-            if "Time Series (Daily)" not in data:
-                return {}
+            with self.metrics.timer("json_parse"):
+                data = json.loads(body)
 
-            time_series = data["Time Series (Daily)"]
+            if "Time Series (Daily)" not in data:
+                message = data.get("Note") or data.get("Information") or data.get("Error Message") or data
+                self.logger.warning(f"No stock data for {ticker}: {message}")
+                self.metrics.increment("stock_api_errors")
+                return None
+            await self.archive.put(archive_key, body)
 
-            await self.redis.set(cache_key, json.dumps(time_series))
-            return time_series
+            return data["Time Series (Daily)"]
         except Exception as e:
             logging.exception(f"Failed to fetch stock data: {e}")
+            return None
+
+    async def store_series(self, ticker: str, bars: dict) -> dict:
+        """
+        Merge bars into the cached series and record the last cached day, atomically.
+        :param ticker: Stock ticker symbol
+        :param bars: dict of dates and prices to add, may be empty to only mark the series checked.
+        :return dict: The merged series.
+        """
+        cache_key = f"stock_data:{ticker}"
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(cache_key)
+                    current = await pipe.get(cache_key)
+                    series = {**(json.loads(current) if current else {}), **bars}
+                    series = dict(sorted(series.items(), reverse=True))
+
+                    pipe.multi()
+                    if bars:
+                        pipe.set(cache_key, json.dumps(series))
+                    pipe.hset(f"stock_meta:{ticker}", mapping={
+                        "last_day": next(iter(series), ""),
+                        "checked_at": time.time()
+                    })
+                    with self.metrics.timer("redis_set"):
+                        await pipe.execute()
+                    return series
+                except WatchError:
+                    continue
+
+    async def is_stale(self, ticker: str, series: dict = None) -> bool:
+        """
+        Check if a cached series is missing recent bars and has not been checked for refresh_period.
+        :param ticker: Stock ticker symbol
+        :param series: The cached series, used when no last day is recorded.
+        :return bool: True if it should be refreshed.
+        """
+        if self.refresh_period <= 0 or self.archive.replaying:
+            return False
+
+        meta = await self.redis.hgetall(f"stock_meta:{ticker}")
+        last_day = meta.get("last_day") or (max(series) if series else "")
+        if last_day >= last_trading_day(date.today()):
+            return False
+        return time.time() - float(meta.get("checked_at", 0)) >= self.refresh_period
+
+    async def refresh_stock_data(self, ticker: str, series: dict) -> dict:
+        """
+        Bring a cached series up to date, with a compact request unless it is too far behind.
+        :param ticker: Stock ticker symbol
+        :param series: The cached series.
+        :return dict: The refreshed series, the cached one unchanged if the request failed, which
+        is then not marked checked so the next load tries again.
+        """
+        last_day = max(series) if series else ""
+        behind = (date.today() - datetime.strptime(last_day, "%Y-%m-%d").date()).days if last_day else None
+        outputsize = "compact" if behind is not None and behind < COMPACT_DAYS else "full"
+
+        bars = await self.request_series(ticker, outputsize)
+        if bars is None:
+            self.metrics.increment("refresh_failed")
+            return series
+        new_bars = {day: bar for day, bar in bars.items() if day > last_day}
+        self.logger.info(f"Refreshed {ticker} ({outputsize}): {len(new_bars)} new bars after {last_day}")
+        self.metrics.increment(f"refresh_{outputsize}")
+
+        return await self.store_series(ticker, new_bars)
+
+    async def load_stock_data(self, ticker: str, until: str = None) -> dict:
+        """
+        Load stock data from the cache, refreshing stale series, or download the full history.
+        :param ticker: Stock ticker symbol
+        :param until: Last day the caller needs. A stale series is only refreshed when it ends
+        before that day, None always refreshes it (prefetch keeps the cache fresh).
+        :return dict: Stock data or empty dict on failure
+        """
+        cache_key = f"stock_data:{ticker}"
+
+        with self.metrics.timer("redis_get"):
+            cached = await self.redis.get(cache_key)
+        if cached:
+            self.metrics.record_cache("stock_data", True)
+            with self.metrics.timer("json_parse"):
+                series = json.loads(cached)
+            needed = until is None or until > max(series, default="")
+            if needed and await self.is_stale(ticker, series):
+                series = await self.refresh_stock_data(ticker, series)
+            return series
+        self.metrics.record_cache("stock_data", False)
+
+        series = await self.request_series(ticker, "full")
+        if not series:
             return {}
+        return await self.store_series(ticker, series)
+
+    def load_tickers(self) -> list:
+        """
+        Load the ticker universe, index first since every task needs it.
+        :return list: Tickers.
+        """
+        with open(self.tickers_path) as f:
+            tickers = [line.strip() for line in f if line.strip()]
+        return [self.index_ticker] + [ticker for ticker in tickers if ticker != self.index_ticker]
+
+    async def wait_for_tasks(self):
+        """
+        Wait while tasks are queued or processed, so their fetches never wait on the shared rate
+        limit behind prefetch requests.
+        """
+        while self.active_tasks or await self.redis.llen(self.input_queue):
+            await asyncio.sleep(self.prefetch_pause)
+
+    async def prefetch_universe(self):
+        """
+        Walk the ticker universe into the cache at the allowed rate, index first. Cached tickers
+        that are stale are refreshed on the way. Prefetch only runs while no task is queued or
+        processed: tasks fetch their own tickers first and prefetch picks up after them.
+        Warm-cache coverage is reported as the "stock_cache_coverage" gauge and in the log.
+        """
+        try:
+            universe = self.load_tickers()
+        except Exception as e:
+            self.logger.error(f"Prefetch disabled, failed to load tickers: {str(e)}")
+            return
+        self.logger.info(f"Prefetching {len(universe)} tickers")
+
+        cached = set()
+        failed = set()
+        logged = None
+        while True:
+            await self.wait_for_tasks()
+            ticker = None
+            for candidate in universe:
+                if candidate in cached or candidate in failed:
+                    continue
+                if await self.redis.exists(f"stock_data:{candidate}") and not await self.is_stale(candidate):
+                    cached.add(candidate)
+                else:
+                    ticker = candidate
+                    break
 
+            coverage = len(cached.intersection(universe)) / len(universe)
+            self.metrics.set_gauge("stock_cache_coverage", coverage)
+
+            if ticker is None:
+                self.logger.info(f"Prefetch pass done, cache coverage {coverage:.1%}, "
+                                 f"{len(failed)} tickers unavailable")
+                await asyncio.sleep(self.prefetch_idle)
+                cached.clear()
+                failed.clear()
+                logged = None
+                continue
+
+            if await self.fetch_stock_data(ticker):
+                cached.add(ticker)
+            else:
+                failed.add(ticker)
+            if len(cached) % 25 == 0 and len(cached) != logged:
+                logged = len(cached)
+                self.logger.info(f"Prefetch cache coverage {coverage:.1%}")
+
+    def background_jobs(self) -> list:
+        # One prefetching process is enough when the supervisor runs several.
+        return [self.prefetch_universe()] if self.prefetch and self.worker_index == 0 else []
 
     def calculate_performance(self, data: dict, first_day: str, last_day: str) -> float:
         """
@@ -98,16 +329,34 @@ class Stocker(Worker):
         except (KeyError, ValueError):
             return 0.0
 
+    def get_arrays(self, ticker: str, series: dict) -> tuple:
+        """
+        Series of a ticker as arrays, converted once per version of the cached series.
+        :param ticker: Stock ticker symbol
+        :param series: dict of dates and prices, newest first.
+        :return tuple: (days, closes), see series_arrays.
+        """
+        version = (len(series), next(iter(series), ""))
+        cached = self.arrays.get(ticker)
+        if cached is None or cached[0] != version:
+            with self.metrics.timer("series_arrays"):
+                cached = self.arrays[ticker] = (version, series_arrays(series))
+        return cached[1]
+
     async def process_task(self, task: str) -> dict:
         """Process task"""
         try:
             ticker, first_date, last_date = task.split(",", 2)
             self.logger.info(f"Processing: {ticker} from {first_date} to {last_date}")
 
-            stock_data, index_data = await asyncio.gather(
-                self.fetch_stock_data(ticker),
-                self.fetch_stock_data("SPY")
-            )
+            self.active_tasks += 1
+            try:
+                stock_data, index_data = await asyncio.gather(
+                    self.fetch_stock_data(ticker, last_date),
+                    self.fetch_stock_data(self.index_ticker, last_date)
+                )
+            finally:
+                self.active_tasks -= 1
 
             if not stock_data or not index_data:
                 return {"ticker": ticker, "error": "Data unavailable"}
@@ -115,7 +364,7 @@ class Stocker(Worker):
             stock_perf = self.calculate_performance(stock_data, first_date, last_date)
             index_perf = self.calculate_performance(index_data, first_date, last_date)
 
-            return {
+            result = {
                 "ticker": ticker,
                 "first_day": first_date,
                 "last_day": last_date,
@@ -123,6 +372,12 @@ class Stocker(Worker):
                 "ticker_performance": stock_perf,
                 "index_performance": index_perf
             }
+            if self.features:
+                with self.metrics.timer("price_features"):
+                    result.update(price_features(self.get_arrays(ticker, stock_data),
+                                                 self.get_arrays(self.index_ticker, index_data),
+                                                 first_date, self.feature_horizons, self.feature_windows))
+            return result
 
         except ValueError:
             return {"error": f"Invalid task format: {task}"}
@@ -0,0 +1,70 @@
+import math
+import numpy as np
+import pytest
+from datetime import date, timedelta
+from shared.price_features import series_arrays, price_features
+
+
+def make_series(closes: list, first: date = date(2022, 1, 3)) -> dict:
+    """Daily series like the stock API's, newest first, one bar per weekday."""
+    days = []
+    day = first
+    while len(days) < len(closes):
+        if day.weekday() < 5:
+            days.append(day.strftime("%Y-%m-%d"))
+        day += timedelta(days=1)
+    return {day: {"4. close": str(close)} for day, close in reversed(list(zip(days, closes)))}
+
+
+def test_forward_returns_and_labels():
+    ticker = series_arrays(make_series([100.0 * 1.01 ** num for num in range(40)]))
+    index = series_arrays(make_series([100.0] * 40))
+    day = str(ticker[0][10])
+    result = price_features(ticker, index, day, [5, 21, 63], [21])
+
+    assert result["labels"]["return_5d"] == pytest.approx(1.01 ** 5 - 1)
+    assert result["labels"]["excess_return_21d"] == pytest.approx(1.01 ** 21 - 1)
+    # The series ends before the horizon.
+    assert result["labels"]["return_63d"] is None
+
+
+def test_trailing_features():
+    closes = [100.0, 110.0, 99.0, 120.0, 90.0, 95.0]
+    ticker = series_arrays(make_series(closes))
+    at = str(ticker[0][-1])
+    features = price_features(ticker, ticker, at, [1], [3, 5, 10])["features"]
+
+    assert features["momentum_3d"] == pytest.approx(95.0 / 99.0 - 1)
+    assert features["max_drawdown_5d"] == pytest.approx(90.0 / 120.0 - 1)
+    log_returns = np.diff(np.log(closes))
+    assert features["volatility_5d"] == pytest.approx(log_returns.std(ddof=1) * math.sqrt(252))
+    assert features["volatility_10d"] is None
+
+
+def test_as_of_day():
+    series = make_series([10.0, 20.0, 30.0])
+    ticker = series_arrays(series)
+    # A day without a bar uses the last bar before it.
+    features = price_features(ticker, ticker, "2022-01-08", [1], [2])
+    assert features["features"]["momentum_2d"] == pytest.approx(2.0)
+    assert price_features(ticker, ticker, "2021-12-31", [1], [2]) == {}
+
+
+def test_excess_return_aligned_by_date():
+    index_series = make_series([100.0 * 1.01 ** num for num in range(40)])
+    ticker_series = make_series([100.0] * 40)
+    days = sorted(ticker_series)
+    # The ticker is halted for five bars after the as-of day.
+    for day in days[11:16]:
+        del ticker_series[day]
+    ticker, index = series_arrays(ticker_series), series_arrays(index_series)
+    labels = price_features(ticker, index, days[10], [5, 21], [5])["labels"]
+
+    # Five ticker bars later is ten trading days later, the index is compared over the same dates.
+    assert labels["return_5d"] == pytest.approx(0.0)
+    assert labels["excess_return_5d"] == pytest.approx(-(1.01 ** 10 - 1))
+    # The index ends before the ticker's 21st bar after the day.
+    index = series_arrays(dict(list(index_series.items())[10:]))
+    labels = price_features(ticker, index, days[10], [5, 21], [5])["labels"]
+    assert labels["return_21d"] == pytest.approx(0.0)
+    assert labels["excess_return_21d"] is None
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from app.stocker import Stocker
+from bench.memory_redis import MemoryStore, MemoryRedis
+
+
+@pytest.fixture
+def stocker(monkeypatch):
+    monkeypatch.setenv("STOCK_API_KEY", "test")
+    monkeypatch.setenv("STOCK_REFRESH_PERIOD", "60")
+    stocker = Stocker()
+    stocker.redis = MemoryRedis(MemoryStore())
+    stocker.requests = []
+    stocker.response = {"2030-01-02": {"4. close": "2.0"}}
+
+    async def request_series(ticker, outputsize="full"):
+        stocker.requests.append((ticker, outputsize))
+        return stocker.response
+    stocker.request_series = request_series
+    return stocker
+
+
+@pytest.mark.asyncio
+async def test_refresh_only_when_window_needs_it(stocker):
+    # A stale series, last checked long ago.
+    await stocker.redis.set("stock_data:AAPL", json.dumps({"2022-06-01": {"4. close": "1.0"}}))
+
+    series = await stocker.load_stock_data("AAPL", "2022-01-01")
+    assert stocker.requests == []
+    assert list(series) == ["2022-06-01"]
+
+    series = await stocker.load_stock_data("AAPL", "2023-01-01")
+    assert stocker.requests == [("AAPL", "full")]
+    assert list(series) == ["2030-01-02", "2022-06-01"]
+
+
+@pytest.mark.asyncio
+async def test_prefetch_refreshes_stale_series(stocker):
+    await stocker.redis.set("stock_data:AAPL", json.dumps({"2022-06-01": {"4. close": "1.0"}}))
+    await stocker.load_stock_data("AAPL")
+    assert stocker.requests == [("AAPL", "full")]
+
+
+@pytest.mark.asyncio
+async def test_failed_refresh_is_retried(stocker):
+    await stocker.redis.set("stock_data:AAPL", json.dumps({"2022-06-01": {"4. close": "1.0"}}))
+    stocker.response = None
+
+    series = await stocker.load_stock_data("AAPL")
+    assert list(series) == ["2022-06-01"]
+    # Not marked checked, so the next load tries again instead of waiting STOCK_REFRESH_PERIOD.
+    assert await stocker.redis.hgetall("stock_meta:AAPL") == {}
+    await stocker.load_stock_data("AAPL")
+    assert len(stocker.requests) == 2
+
+
+@pytest.mark.asyncio
+async def test_refresh_without_new_bars_is_checked(stocker):
+    await stocker.redis.set("stock_data:AAPL", json.dumps({"2022-06-01": {"4. close": "1.0"}}))
+    stocker.response = {}
+
+    await stocker.load_stock_data("AAPL")
+    assert (await stocker.redis.hgetall("stock_meta:AAPL"))["last_day"] == "2022-06-01"
+    await stocker.load_stock_data("AAPL")
+    assert len(stocker.requests) == 1
+
+
+@pytest_asyncio.fixture
+async def api(monkeypatch):
+    """Local stock API answering every request with the body set by the test."""
+    answer = {}
+
+    async def query(request):
+        return web.json_response(answer["body"])
+
+    app = web.Application()
+    app.router.add_get("/query", query)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    monkeypatch.setenv("STOCK_API_URL", f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/query")
+    monkeypatch.setenv("STOCK_API_KEY", "test")
+    monkeypatch.setenv("STOCK_API_PERIOD", "0")
+    stocker = Stocker()
+    stocker.http.open()
+    yield stocker, answer
+    await stocker.http.close()
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("body", [
+    {"Note": "Thank you for using Alpha Vantage! Our standard API call frequency is 5 calls per minute."},
+    {"Information": "We have detected your API key as premium..."},
+    {"Error Message": "Invalid API call."}
+])
+async def test_request_series_api_messages_fail(api, body):
+    stocker, answer = api
+    answer["body"] = body
+    assert await stocker.request_series("AAPL") is None
+
+
+@pytest.mark.asyncio
+async def test_request_series(api):
+    stocker, answer = api
+    answer["body"] = {"Time Series (Daily)": {"2024-01-02": {"4. close": "1.0"}}}
+    assert await stocker.request_series("AAPL") == {"2024-01-02": {"4. close": "1.0"}}
+
+
+async def run_prefetch(stocker, until_requests: int):
+    """Run prefetch until it made a number of requests and went idle, or timed out."""
+    task = asyncio.ensure_future(stocker.prefetch_universe())
+    try:
+        for _ in range(200):
+            if len(stocker.requests) >= until_requests and "stock_cache_coverage" in stocker.metrics.gauges:
+                break
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+@pytest.fixture
+def prefetching(stocker, tmp_path):
+    path = tmp_path / "tickers.txt"
+    path.write_text("AAPL\nSPY\nMSFT\nNVDA\n")
+    stocker.tickers_path = str(path)
+    stocker.prefetch_pause = 0.01
+    stocker.prefetch_idle = 60
+    return stocker
+
+
+@pytest.mark.asyncio
+async def test_prefetch_walks_universe_index_first(prefetching):
+    stocker = prefetching
+    # Fresh in the cache, skipped.
+    await stocker.store_series("MSFT", {"2099-01-01": {"4. close": "1.0"}})
+    answers = {"NVDA": None}
+
+    async def request_series(ticker, outputsize="full"):
+        stocker.requests.append((ticker, outputsize))
+        return answers.get(ticker, {"2099-01-01": {"4. close": "1.0"}})
+    stocker.request_series = request_series
+
+    await run_prefetch(stocker, 3)
+    # A failed ticker is not retried within the pass.
+    assert [ticker for ticker, _ in stocker.requests] == ["SPY", "AAPL", "NVDA"]
+    assert stocker.metrics.gauges["stock_cache_coverage"] == pytest.approx(0.75)
+
+
+@pytest.mark.asyncio
+async def test_prefetch_waits_for_tasks(prefetching):
+    stocker = prefetching
+    stocker.input_queue = "stock_queries"
+    await stocker.redis.lpush(stocker.input_queue, "task")
+
+    task = asyncio.ensure_future(stocker.prefetch_universe())
+    await asyncio.sleep(0.05)
+    assert stocker.requests == []
+    await stocker.redis.delete(stocker.input_queue)
+    stocker.active_tasks = 1
+    await asyncio.sleep(0.05)
+    assert stocker.requests == []
+    stocker.active_tasks = 0
+    await asyncio.sleep(0.05)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    assert stocker.requests
+
+
+@pytest.mark.asyncio
+async def test_cached_fetch_does_not_wait_on_refresh(stocker):
+    await stocker.store_series("AAPL", {"2022-06-01": {"4. close": "1.0"}})
+    await stocker.redis.hset("stock_meta:AAPL", mapping={"checked_at": 0})
+    release = asyncio.Event()
+
+    async def request_series(ticker, outputsize="full"):
+        stocker.requests.append((ticker, outputsize))
+        await release.wait()
+        return {"2030-01-02": {"4. close": "2.0"}}
+    stocker.request_series = request_series
+
+    refreshes = [asyncio.ensure_future(stocker.fetch_stock_data("AAPL")) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    # Covered by the cache: served at once while the refresh is still waiting.
+    series = await asyncio.wait_for(stocker.fetch_stock_data("AAPL", "2022-01-01"), 1)
+    assert list(series) == ["2022-06-01"]
+
+    release.set()
+    for series in await asyncio.gather(*refreshes):
+        assert list(series) == ["2030-01-02", "2022-06-01"]
+    # The two refreshing fetches shared one request.
+    assert len(stocker.requests) == 1
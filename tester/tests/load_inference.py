@@ -0,0 +1,156 @@
+"""
+Concurrent load test of the inference server with the prompts of test_inference.py.
+
+Each concurrency level sends the prompt set (repeated to --requests requests) with that many
+requests in flight, streaming every answer to time the first token. Reports requests/s, tokens/s
+from the "usage" fields, time to first token and latency percentiles, and writes a JSON report.
+
+    python tests/load_inference.py --concurrency 1 2 4 8 --requests 64 --output load_report.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from test_inference import prompts, make_test_payload, url
+
+
+def percentile(values: list, q: float) -> float:
+    """
+    Nearest-rank percentile.
+    :param values: Observations.
+    :param q: Percentile between 0 and 100.
+    :return float: The percentile, or None without observations.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def summarize(values: list) -> dict:
+    return {
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None
+    }
+
+
+async def send_request(session: aiohttp.ClientSession, prompt: str, timeout: float) -> dict:
+    """
+    Stream one completion.
+    :param session: aiohttp session.
+    :param prompt: User prompt.
+    :param timeout: Timeout of the request in seconds.
+    :return dict: latency, ttft, prompt/completion tokens and error of the request.
+    """
+    payload = {**make_test_payload(prompt), "stream": True, "stream_options": {"include_usage": True}}
+    started = time.perf_counter()
+    ttft = None
+    chunks = 0
+    usage = {}
+
+    try:
+        async with session.post(url, json=payload, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            if resp.status != 200:
+                return {"error": f"HTTP {resp.status}", "latency": time.perf_counter() - started}
+
+            async for line in resp.content:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+                if chunk.get("choices") and chunk["choices"][0].get("delta", {}).get("content"):
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+                    chunks += 1
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        return {"error": str(e) or e.__class__.__name__, "latency": time.perf_counter() - started}
+
+    return {
+        "latency": time.perf_counter() - started,
+        "ttft": ttft,
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", chunks),
+        "error": None
+    }
+
+
+async def run_level(session: aiohttp.ClientSession, concurrency: int, num_requests: int, timeout: float) -> dict:
+    """
+    Send num_requests requests with at most concurrency in flight.
+    :return dict: Throughput, latency and TTFT summary of the level.
+    """
+    prompt_set = [param.values[0] for param in prompts]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(num):
+        async with semaphore:
+            return await send_request(session, prompt_set[num % len(prompt_set)], timeout)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(limited(num) for num in range(num_requests)))
+    elapsed = time.perf_counter() - started
+
+    ok = [result for result in results if result["error"] is None]
+    completion_tokens = sum(result["completion_tokens"] for result in ok)
+    prompt_tokens = sum(result["prompt_tokens"] for result in ok)
+
+    return {
+        "concurrency": concurrency,
+        "requests": num_requests,
+        "errors": num_requests - len(ok),
+        "elapsed": elapsed,
+        "requests_per_second": len(ok) / elapsed,
+        "completion_tokens_per_second": completion_tokens / elapsed,
+        "prompt_tokens_per_second": prompt_tokens / elapsed,
+        "latency": summarize([result["latency"] for result in ok]),
+        "ttft": summarize([result["ttft"] for result in ok if result["ttft"] is not None]),
+        "error_samples": sorted({result["error"] for result in results if result["error"]})[:5]
+    }
+
+
+async def main(args):
+    report = {
+        "url": url,
+        "label": args.label,
+        "model_settings": {key: value for key, value in os.environ.items() if key.startswith("LLAMA_ARG_")},
+        "levels": []
+    }
+
+    async with aiohttp.ClientSession() as session:
+        for concurrency in args.concurrency:
+            level = await run_level(session, concurrency, args.requests, args.timeout)
+            report["levels"].append(level)
+            print(f"concurrency={concurrency}: {level['requests_per_second']:.2f} req/s, "
+                  f"{level['completion_tokens_per_second']:.1f} tok/s, "
+                  f"p50={level['latency']['p50']} p99={level['latency']['p99']} "
+                  f"ttft_p50={level['ttft']['p50']} errors={level['errors']}")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the inference server")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="Concurrency levels to run")
+    parser.add_argument("--requests", type=int, default=44, help="Requests per concurrency level")
+    parser.add_argument("--timeout", type=float, default=120, help="Timeout per request in seconds")
+    parser.add_argument("--output", default="load_report.json", help="Where to write the JSON report")
+    parser.add_argument("--label", default="", help="Name of the model/settings under test, kept in the report")
+    asyncio.run(main(parser.parse_args()))